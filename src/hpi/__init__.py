@@ -1,24 +1,83 @@
 #****************************************************************************
 #* hpi package
 #****************************************************************************
+import sys
 
-from hpi.rgy import bfm
-from hpi.rgy import import_task
-from hpi.rgy import export_task
-from hpi.rgy import register_bfm
-from hpi.rgy import bfm_list
-from hpi.rgy import entry
-from hpi.rgy import bfm_wrapper_type
-from hpi.tb_main import get_plusarg
-from hpi.tb_main import tb_main
-from hpi.tb_main import tb_init
-from hpi.tb_main import raise_objection
-from hpi.tb_main import drop_objection
-from hpi.tb_main import finish
-from hpi.scheduler import SimThread
-from hpi.scheduler import thread_create
-from hpi.scheduler import thread_yield
-from hpi.scheduler import fork
-from hpi.scheduler import branch
-from hpi.scheduler import semaphore
-from hpi.scheduler import int_thread_yield
+# Public names, and the submodule that provides each. Submodules are 
+# loaded on first use (PEP 562), such that 'import hpi' and the command-
+# line tools don't load the scheduler, registry and launcher support 
+# unless they are used
+prv_attr_m = {
+    "bfm": "hpi.rgy",
+    "BfmBase": "hpi.rgy",
+    "import_task": "hpi.rgy",
+    "export_task": "hpi.rgy",
+    "register_bfm": "hpi.rgy",
+    "register_bfms": "hpi.rgy",
+    "bfm_list": "hpi.rgy",
+    "get_bfm": "hpi.rgy",
+    "get_bfms": "hpi.rgy",
+    "find_bfms": "hpi.rgy",
+    "entry": "hpi.rgy",
+    "bfm_wrapper_type": "hpi.rgy",
+    "get_plusarg": "hpi.tb_main",
+    "get_plusarg_vals": "hpi.tb_main",
+    "get_plusarg_int": "hpi.tb_main",
+    "get_plusarg_bool": "hpi.tb_main",
+    "get_plusarg_time": "hpi.tb_main",
+    "get_plusargs": "hpi.tb_main",
+    "tb_main": "hpi.tb_main",
+    "tb_init": "hpi.tb_main",
+    "tb_fini": "hpi.tb_main",
+    "fast_exit": "hpi.tb_main",
+    "raise_objection": "hpi.tb_main",
+    "drop_objection": "hpi.tb_main",
+    "finish": "hpi.tb_main",
+    "get_simtime": "hpi.tb_main",
+    "set_timeout": "hpi.tb_main",
+    "trace_on": "hpi.tb_main",
+    "trace_off": "hpi.tb_main",
+    "SimThread": "hpi.scheduler",
+    "thread_create": "hpi.scheduler",
+    "thread_yield": "hpi.scheduler",
+    "fork": "hpi.scheduler",
+    "branch": "hpi.scheduler",
+    "semaphore": "hpi.scheduler",
+    "int_thread_yield": "hpi.scheduler",
+    }
+
+def import_module(name):
+    __import__(name)
+    return sys.modules[name]
+
+def __getattr__(name):
+    if name in prv_attr_m.keys():
+        v = getattr(import_module(prv_attr_m[name]), name)
+    elif not name.startswith("__"):
+        try:
+            v = import_module("hpi." + name)
+        except ModuleNotFoundError as e:
+            if e.name != "hpi." + name:
+                raise
+            raise AttributeError("module 'hpi' has no attribute '" + name + "'")
+    else:
+        raise AttributeError("module 'hpi' has no attribute '" + name + "'")
+    globals()[name] = v
+    return v
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(prv_attr_m.keys()))
+
+class hpi_module(type(sys)):
+
+    # Importing a submodule binds it as an attribute of the package. 
+    # hpi.tb_main is the function, not the submodule of the same name
+    def __setattr__(self, name, value):
+        if (name in prv_attr_m.keys() and isinstance(value, type(sys)) and
+                value.__name__ == "hpi." + name):
+            return
+        super().__setattr__(name, value)
+
+sys.modules[__name__].__class__ = hpi_module
+
+__all__ = list(prv_attr_m.keys())
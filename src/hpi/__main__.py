@@ -6,13 +6,19 @@
 import hpi
 import argparse
 import os
-from hpi.rgy import bfm
-from hpi.rgy import tf_decl
-from string import Template
-from hpi import launcher_vl
-from hpi import launcher_sv
-from hpi import gen_dpi_if
-from hpi import gen_wrapper
+import sys
+
+#********************************************************************
+#* lazy()
+#*
+#* Returns a subcommand function that loads <module> when called, 
+#* such that each subcommand only loads the code it uses
+#********************************************************************
+def lazy(module, name):
+    def func(args):
+        __import__(module)
+        return getattr(sys.modules[module], name)(args)
+    return func
 
 def gen_dpi_export_methods():
     pass
@@ -25,6 +31,7 @@ def list_bfms(args):
 
     
 def gen_launcher_sv(args):
+    from hpi import launcher_sv
     fh = open(os.path.join(args.outdir, "pyhpi_sv_dpi.c"), "w")
     fh.write(launcher_sv.dpi_c)
     fh.close()
@@ -46,7 +53,7 @@ def main():
     gen_dpi_cmd.add_argument("-verilator", action="store_true", help="Enables Verilator specifics")
     gen_dpi_cmd.add_argument("-o", help="Specifies output file")
     gen_dpi_cmd.add_argument("-m", action="append", help="Specifies a module to load")
-    gen_dpi_cmd.set_defaults(func=gen_dpi_if.gen_dpi)
+    gen_dpi_cmd.set_defaults(func=lazy("hpi.gen_dpi_if", "gen_dpi"))
     
     list_bfms_cmd = subparsers.add_parser("list-bfms")
     list_bfms_cmd.set_defaults(func=list_bfms)
@@ -61,7 +68,7 @@ def main():
     gen_bfm_wrapper_cmd.add_argument("bfm",
             help="Specify the BFM type")
     
-    gen_bfm_wrapper_cmd.set_defaults(func=gen_wrapper.gen_bfm_wrapper)
+    gen_bfm_wrapper_cmd.set_defaults(func=lazy("hpi.gen_wrapper", "gen_bfm_wrapper"))
     
     gen_launcher_vl_cmd = subparsers.add_parser("gen-launcher-vl",
             help="Generate a launcher for Verilator")
@@ -71,13 +78,19 @@ def main():
     gen_launcher_vl_cmd.add_argument("--trace-fst",
             action="store_true",
             help="Enable FST tracing from the launcher")
+    gen_launcher_vl_cmd.add_argument("--trace-depth",
+            type=int, default=99,
+            help="Specifies the default depth of hierarchy to trace")
+    gen_launcher_vl_cmd.add_argument("--threads",
+            action="store_true",
+            help="Support models built with 'verilator --threads'")
     gen_launcher_vl_cmd.add_argument("-clk", 
             action="append",
             help="Specifies clock to drive")
     gen_launcher_vl_cmd.add_argument("-m", action="append", help="Specifies a module to load")
     gen_launcher_vl_cmd.add_argument("top",
             help="Specify the top-level module to run")
-    gen_launcher_vl_cmd.set_defaults(func=launcher_vl.gen_launcher_vl)
+    gen_launcher_vl_cmd.set_defaults(func=lazy("hpi.launcher_vl", "gen_launcher_vl"))
     
     gen_launcher_sv_cmd = subparsers.add_parser("gen-launcher-sv",
             help="Generate a launcher for standard SV/DPI simulators")
@@ -86,6 +99,124 @@ def main():
             help="Specifies the output directory")
     gen_launcher_sv_cmd.set_defaults(func=gen_launcher_sv)
     
+    regress_cmd = subparsers.add_parser("regress",
+            help="Run a list of tests in parallel")
+    regress_cmd.add_argument("-sim",
+            default="./obj_dir/Vtop",
+            help="Specifies the simulation image to run")
+    regress_cmd.add_argument("-args",
+            help="Specifies arguments passed to every test")
+    regress_cmd.add_argument("-j",
+            type=int, default=os.cpu_count(),
+            help="Specifies the number of parallel workers")
+    regress_cmd.add_argument("-count",
+            type=int, default=1,
+            help="Specifies the number of seeds for tests that don't list seeds")
+    regress_cmd.add_argument("-timeout",
+            type=float,
+            help="Specifies the maximum wall time (s) for each test")
+    regress_cmd.add_argument("-fast-exit",
+            action="store_true",
+            help="Passes +hpi.fast_exit to each test to skip interpreter teardown")
+    regress_cmd.add_argument("-outdir",
+            default="regress",
+            help="Specifies the output directory for logs and results")
+    regress_cmd.add_argument("testlist",
+            help="Specifies the test list")
+    regress_cmd.set_defaults(func=lazy("hpi.regress", "regress"))
+    
+    profile_report_cmd = subparsers.add_parser("profile-report",
+            help="Report profile data (+hpi.profile) aggregated across runs")
+    profile_report_cmd.add_argument("-o",
+            help="Specifies a file to write the aggregated profile data")
+    profile_report_cmd.add_argument("files",
+            nargs="+",
+            help="Specifies the profile-data files to aggregate")
+    profile_report_cmd.set_defaults(func=lazy("hpi.profile", "profile_report"))
+    
+    loopback_cmd = subparsers.add_parser("loopback",
+            help="Run a Python testbench without a simulator, looping export calls back to Python responders")
+    loopback_cmd.add_argument("-m", action="append", 
+            help="Specifies a module to load (eg responder models)")
+    loopback_cmd.add_argument("-bfm", action="append",
+            help="Creates a BFM instance (<type>:<path>[:<count>])")
+    loopback_cmd.add_argument("-args",
+            help="Specifies testbench arguments (eg '+hpi.entry=my_tb.run')")
+    loopback_cmd.add_argument("-trace",
+            help="Specifies a trace of import-task calls to replay")
+    loopback_cmd.add_argument("-record",
+            help="Specifies a file to record export-task calls to")
+    loopback_cmd.add_argument("-cycles",
+            type=int,
+            help="Specifies the maximum number of cycles to run")
+    loopback_cmd.add_argument("-period",
+            default="1ns",
+            help="Specifies the clock period (default 1ns)")
+    loopback_cmd.set_defaults(func=lazy("hpi.loopback", "loopback_cmd"))
+    
+    shm_tb_cmd = subparsers.add_parser("shm-tb",
+            help="Run the testbench side of a shared-memory channel (started by +hpi.shm)")
+    shm_tb_cmd.add_argument("channel",
+            help="Specifies the channel file")
+    shm_tb_cmd.set_defaults(func=lazy("hpi.shm", "shm_tb"))
+    
+    replay_cmd = subparsers.add_parser("replay",
+            help="Replay a recording (+hpi.record) without the simulator, checking export calls")
+    replay_cmd.add_argument("-args",
+            help="Specifies additional testbench arguments")
+    replay_cmd.add_argument("-max-errors",
+            type=int, default=10,
+            help="Specifies the number of mismatches to report")
+    replay_cmd.add_argument("log",
+            help="Specifies the recording")
+    replay_cmd.set_defaults(func=lazy("hpi.replay", "replay"))
+    
+    cov_merge_cmd = subparsers.add_parser("cov-merge",
+            help="Merge and report coverage files (+hpi.coverage)")
+    cov_merge_cmd.add_argument("-o",
+            help="Specifies a file to write the merged coverage to")
+    cov_merge_cmd.add_argument("-bins",
+            action="store_true",
+            help="Reports the count of each bin")
+    cov_merge_cmd.add_argument("files",
+            nargs="+",
+            help="Specifies the coverage files to merge")
+    cov_merge_cmd.set_defaults(func=lazy("hpi.coverage", "cov_merge"))
+    
+    build_cmd = subparsers.add_parser("build",
+            help="Generate the launcher, BFM wrappers and DPI interface in one pass")
+    build_cmd.add_argument("-m", action="append", help="Specifies a module to load")
+    build_cmd.add_argument("-outdir",
+            default=".",
+            help="Specifies the output directory")
+    build_cmd.add_argument("-launcher",
+            choices=("vl", "sv", "none"), default="vl",
+            help="Specifies the launcher to generate (default vl)")
+    build_cmd.add_argument("-top",
+            help="Specifies the top-level module to run (-launcher vl)")
+    build_cmd.add_argument("-clk", 
+            action="append",
+            help="Specifies clock to drive (-launcher vl)")
+    build_cmd.add_argument("--trace-fst",
+            action="store_true",
+            help="Enable FST tracing from the launcher")
+    build_cmd.add_argument("--trace-depth",
+            type=int, default=99,
+            help="Specifies the default depth of hierarchy to trace")
+    build_cmd.add_argument("--threads",
+            action="store_true",
+            help="Support models built with 'verilator --threads'")
+    build_cmd.add_argument("-wrappers",
+            choices=("sv-dpi", "vl-vpi", "none"), default="sv-dpi",
+            help="Specifies the type of BFM wrapper to generate (default sv-dpi)")
+    build_cmd.add_argument("-mk",
+            default="hpi_build.mk",
+            help="Specifies the Makefile fragment to write in the output directory")
+    build_cmd.add_argument("-j",
+            type=int, default=os.cpu_count(),
+            help="Specifies the number of threads writing outputs")
+    build_cmd.set_defaults(func=lazy("hpi.build", "build"))
+    
     args = parser.parse_args()
    
     if hasattr(args, "func") == False:
@@ -93,7 +224,9 @@ def main():
         
 
             
-    args.func(args)
+    ret = args.func(args)
+    if ret:
+        sys.exit(ret)
    
 if __name__ == "__main__":
     main()
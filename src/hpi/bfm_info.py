@@ -4,19 +4,15 @@ Created on May 15, 2019
 @author: ballance
 '''
 
-try:
-    # Bring in generated module that provides export-task wrappers
-    # Ignore if we're running in wrapper-gen mode
-    import hpi_e
-except:
-    pass
-
 class bfm_info(object):
+    __slots__ = ('tname', 'bfm_id', 'cls', 'tf_list', 'inst_list')
     
     def __init__(self, tname, bfm_id):
         self.tname = tname
         self.bfm_id = bfm_id
         self.cls = None
         self.tf_list = []
+        # Instances of this type, in registration order
+        self.inst_list = []
 
     
\ No newline at end of file
@@ -0,0 +1,131 @@
+#****************************************************************************
+#* build.py
+#*
+#* Implements 'hpi build', which loads the testbench modules once and
+#* generates the launcher, the wrapper of each BFM type and the DPI
+#* interface. Outputs whose content is unchanged are not rewritten,
+#* such that make doesn't rebuild from them. A Makefile fragment lists
+#* the outputs and the Python sources they were generated from.
+#****************************************************************************
+import os
+import shlex
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from hpi import log
+
+#********************************************************************
+#* write_if_changed()
+#*
+#* Writes <text> to <path>, unless the file already has that content.
+#* Returns True if the file was written
+#********************************************************************
+def write_if_changed(path : str, text : str) -> bool:
+    data = text.encode()
+    try:
+        with open(path, "rb") as fp:
+            if fp.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "wb") as fp:
+        fp.write(data)
+    return True
+
+# Returns the Python source files of the modules loaded since <before>
+def module_sources(before) -> list:
+    ret = []
+    for name,m in list(sys.modules.items()):
+        if name in before:
+            continue
+        f = getattr(m, "__file__", None)
+        if f != None and f.endswith(".py"):
+            ret.append(os.path.abspath(f))
+    return sorted(set(ret))
+
+def mk_var(name, files):
+    return name + " = \\\n" + "".join(["    " + f + " \\\n" for f in files]) + "\n"
+
+#********************************************************************
+#* gen_mk()
+#*
+#* Returns the Makefile fragment. The outputs depend on a stamp file
+#* that is updated by re-running the build whenever a source changes.
+#* Paths are absolute, and the build re-runs in the directory it was
+#* run from, such that the fragment may be included from any directory
+#********************************************************************
+def gen_mk(args, outputs, sources, stamp) -> str:
+    cmd = " ".join([shlex.quote(a) for a in sys.argv[1:]])
+
+    ret = "# Generated by 'hpi build'. Do not edit\n"
+    ret += mk_var("HPI_BUILD_OUTPUTS", outputs)
+    ret += mk_var("HPI_BUILD_SOURCES", sources)
+    ret += "HPI_BUILD_PYTHON ?= python3\n\n"
+    ret += stamp + " : $(HPI_BUILD_SOURCES)\n"
+    ret += ("\tcd " + shlex.quote(os.getcwd()).replace("$", "$$") + 
+            " && $(HPI_BUILD_PYTHON) -m hpi " + cmd.replace("$", "$$") + "\n")
+    ret += "\ttouch $@\n\n"
+    ret += "$(HPI_BUILD_OUTPUTS) : " + stamp + "\n"
+    ret += "\t@true\n"
+    return ret
+
+def build(args):
+    from hpi import gen_dpi_if
+    from hpi import gen_wrapper
+    from hpi import launcher_vl
+    from hpi import launcher_sv
+    from hpi.rgy import bfm_type_map
+
+    before = set(sys.modules.keys())
+    if args.m != None:
+        for m in args.m:
+            log.debug("loading " + str(m))
+            __import__(m)
+
+    os.makedirs(args.outdir, exist_ok=True)
+    files = []
+
+    # Generation runs in this thread, since it is pure Python. The
+    # outputs are compared and written by the pool
+    if args.launcher == "vl":
+        if args.top == None:
+            raise Exception("-top must be specified with -launcher vl")
+        files.append(("launcher_vl.cpp", launcher_vl.gen_launcher_vl_text(args)))
+    elif args.launcher == "sv":
+        files.append(("pyhpi_sv_dpi.c", launcher_sv.dpi_c))
+        files.append(("pyhpi_sv.sv", launcher_sv.dpi_sv))
+
+    if args.wrappers != "none":
+        for tname in sorted(bfm_type_map.keys()):
+            if gen_wrapper.has_wrapper(tname, args.wrappers):
+                files.append((tname + gen_wrapper.wrapper_suffix[args.wrappers],
+                              gen_wrapper.wrapper_text(tname, args.wrappers)))
+            else:
+                log.debug("BFM \"" + tname + "\" has no " + args.wrappers + " wrapper")
+
+    files.append(("pyhpi_dpi.c", gen_dpi_if.gen_dpi_text("pyhpi_dpi.c")))
+
+    outdir = os.path.abspath(args.outdir)
+    paths = [os.path.join(outdir, f) for f,t in files]
+    with ThreadPoolExecutor(max_workers=args.j) as pool:
+        written = list(pool.map(write_if_changed, paths, [t for f,t in files]))
+
+    # The hpi package is a source too, so that upgrading pyHPI regenerates.
+    # Its modules are loaded before <before>, and the generators depend
+    # on most of them (eg rgy, bfm_info)
+    hpi_dir = os.path.dirname(os.path.abspath(__file__))
+    sources = module_sources(before) + [os.path.join(hpi_dir, f) 
+        for f in os.listdir(hpi_dir) if f.endswith(".py")]
+    sources = sorted(set(sources))
+
+    stamp = os.path.join(outdir, ".hpi_build.stamp")
+    if args.mk != None:
+        write_if_changed(os.path.join(outdir, args.mk),
+                         gen_mk(args, paths, sources, stamp))
+
+    # The outputs are up to date, so make needn't re-run the build
+    with open(stamp, "a"):
+        os.utime(stamp)
+
+    log.info("hpi build: " + str(len(files)) + " outputs (" +
+             str(sum(written)) + " updated) in " + args.outdir)
@@ -0,0 +1,443 @@
+#****************************************************************************
+#* coverage.py
+#*
+#* Functional coverage. Each covergroup holds its bin counters in a
+#* single array, with coverpoints followed by crosses. A value is mapped
+#* to its bin through a lookup table (or a bisection for sparse bins),
+#* and a cross bin index is computed from the bin indices of its points.
+#* Blocks of values from batched monitors may be sampled at once, with
+#* NumPy when it is available.
+#*
+#* With +hpi.coverage[=file], the counters of all covergroups are saved
+#* at the end of simulation. A coverage file is:
+#*   - "HPICOV1\n"
+#*   - header length (uint32) and JSON header, padded to 8 bytes
+#*   - counters (uint64, little-endian)
+#* Files from runs with the same covergroups have the same header, and
+#* are merged by adding the counter arrays (hpi cov-merge). Files with
+#* different covergroups are merged item by item.
+#****************************************************************************
+import array
+import bisect
+import collections
+import itertools
+import json
+import operator
+import struct
+import sys
+
+from hpi import log
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b"HPICOV1\n"
+
+# Bins with a span up to this are mapped with a lookup table
+LUT_MAX = 65536
+
+prv_covergroups = []
+prv_outfile = None
+
+class coverpoint():
+
+    #****************************************************************
+    #* __init__()
+    #*
+    #* <bins> is a list of values and inclusive (lo,hi) ranges.
+    #* Alternatively, <auto> bins of equal size are created over
+    #* [lo, hi]. Values that fall in no bin are not counted
+    #****************************************************************
+    def __init__(self, name : str, bins = None, lo : int = None, hi : int = None, auto : int = None):
+        self.name = name
+        if bins == None:
+            if lo == None or hi == None:
+                raise Exception("coverpoint \"" + name + "\" needs bins, or lo and hi")
+            n = min(auto if auto != None else 64, hi-lo+1)
+            bins = []
+            for i in range(n):
+                b_lo = lo + ((hi-lo+1)*i)//n
+                b_hi = lo + ((hi-lo+1)*(i+1))//n - 1
+                bins.append((b_lo, b_hi))
+        self.ranges = [b if type(b) == tuple else (b,b) for b in bins]
+        self.labels = [str(lo) if lo == hi else "[" + str(lo) + ":" + str(hi) + "]"
+                       for lo,hi in self.ranges]
+        self.n_bins = len(self.ranges)
+
+        self.min = min(lo for lo,hi in self.ranges)
+        self.max = max(hi for lo,hi in self.ranges)
+        if self.max - self.min < LUT_MAX:
+            # Earlier bins take precedence where bins overlap
+            self.lut = array.array('i', [-1]) * (self.max - self.min + 1)
+            for i in reversed(range(self.n_bins)):
+                lo,hi = self.ranges[i]
+                for v in range(lo-self.min, hi-self.min+1):
+                    self.lut[v] = i
+            self.starts = None
+        else:
+            self.lut = None
+            order = sorted(range(self.n_bins), key=lambda i: self.ranges[i][0])
+            self.starts = [self.ranges[i][0] for i in order]
+            self.ends = [self.ranges[i][1] for i in order]
+            self.order = order
+
+    # Returns the bin of value <v>, or -1
+    def bin(self, v) -> int:
+        if self.lut != None:
+            v -= self.min
+            return self.lut[v] if v >= 0 and v < len(self.lut) else -1
+        i = bisect.bisect_right(self.starts, v) - 1
+        return self.order[i] if i >= 0 and v <= self.ends[i] else -1
+
+    # Returns the bins of a block of values, as a NumPy array
+    def bins_np(self, vals):
+        v = numpy.asarray(vals, dtype=numpy.int64)
+        if self.lut != None:
+            off = v - self.min
+            valid = (off >= 0) & (off < len(self.lut))
+            ret = numpy.full(len(v), -1, dtype=numpy.int64)
+            ret[valid] = numpy.frombuffer(self.lut, dtype=numpy.int32)[off[valid]]
+            return ret
+        i = numpy.searchsorted(numpy.array(self.starts), v, side="right") - 1
+        ends = numpy.array(self.ends)
+        order = numpy.array(self.order)
+        valid = (i >= 0) & (v <= ends[numpy.maximum(i, 0)])
+        return numpy.where(valid, order[numpy.maximum(i, 0)], -1)
+
+class covergroup():
+
+    #****************************************************************
+    #* __init__()
+    #*
+    #* <points> is a list of coverpoints. Values are sampled in this
+    #* order. <crosses> is a list of tuples of coverpoint names
+    #****************************************************************
+    def __init__(self, name : str, points, crosses = ()):
+        self.name = name
+        self.points = points
+        self.crosses = []
+        names = [p.name for p in points]
+
+        n = sum(p.n_bins for p in points)
+        self.point_off = list(itertools.accumulate([0] + [p.n_bins for p in points]))[:-1]
+        for c in crosses:
+            idx = []
+            for pn in c:
+                if pn not in names:
+                    raise Exception("cross of unknown coverpoint \"" + pn +
+                                    "\" in covergroup \"" + name + "\"")
+                idx.append(names.index(pn))
+            size = 1
+            for i in idx:
+                size *= points[i].n_bins
+            self.crosses.append(("x".join(c), idx, n, size))
+            n += size
+        self.counts = array.array('Q', bytes(8*n))
+        self.gen_sample()
+        prv_covergroups.append(self)
+
+    #****************************************************************
+    #* gen_sample()
+    #*
+    #* Generates sample(), which samples one value per coverpoint, 
+    #* with the bin lookups and cross index arithmetic unrolled
+    #****************************************************************
+    def gen_sample(self):
+        args = ["v" + str(i) for i in range(len(self.points))]
+        scope = {"self" : self, "counts" : self.counts}
+        src = "def sample(" + ", ".join(args) + "):\n"
+        for i,(p,off) in enumerate(zip(self.points, self.point_off)):
+            b = "b" + str(i)
+            if p.lut != None:
+                scope["lut" + str(i)] = p.lut
+                src += "    " + b + " = v" + str(i) + " - " + str(p.min) + "\n"
+                src += ("    " + b + " = lut" + str(i) + "[" + b + "] if " + b + 
+                        " >= 0 and " + b + " < " + str(len(p.lut)) + " else -1\n")
+            else:
+                scope["bin" + str(i)] = p.bin
+                src += "    " + b + " = bin" + str(i) + "(v" + str(i) + ")\n"
+            src += "    if " + b + " != -1:\n"
+            src += "        counts[" + str(off) + "+" + b + "] += 1\n"
+        for name,idx,off,size in self.crosses:
+            x = "b" + str(idx[0])
+            for i in idx[1:]:
+                x = "(" + x + ")*" + str(self.points[i].n_bins) + "+b" + str(i)
+            src += "    if " + " and ".join(["b" + str(i) + " != -1" for i in idx]) + ":\n"
+            src += "        counts[" + str(off) + "+" + x + "] += 1\n"
+        exec(src, scope)
+        self.sample = scope["sample"]
+
+    #****************************************************************
+    #* sample_block()
+    #*
+    #* Samples blocks of values, one sequence (list, array or NumPy
+    #* array) per coverpoint
+    #****************************************************************
+    def sample_block(self, *cols):
+        if numpy == None:
+            self.sample_block_py(cols)
+            return
+
+        counts = numpy.frombuffer(self.counts, dtype=numpy.uint64)
+        b_l = []
+        for p,off,col in zip(self.points, self.point_off, cols):
+            b = p.bins_np(col)
+            b_l.append(b)
+            counts[off:off+p.n_bins] += numpy.bincount(
+                b[b >= 0], minlength=p.n_bins).astype(numpy.uint64)
+        for name,idx,off,size in self.crosses:
+            x = numpy.zeros(len(b_l[0]), dtype=numpy.int64)
+            valid = numpy.ones(len(b_l[0]), dtype=bool)
+            for i in idx:
+                x = x*self.points[i].n_bins + b_l[i]
+                valid &= (b_l[i] >= 0)
+            counts[off:off+size] += numpy.bincount(
+                x[valid], minlength=size).astype(numpy.uint64)
+
+    # Samples blocks without NumPy. Bins are looked up with map(), 
+    # and counted with Counter, when all values fall in the table
+    def sample_block_py(self, cols):
+        counts = self.counts
+        b_l = []
+        for p,off,col in zip(self.points, self.point_off, cols):
+            if p.lut != None and len(col) != 0 and min(col) >= p.min and max(col) <= p.max:
+                if p.min == 0:
+                    b = list(map(p.lut.__getitem__, col))
+                else:
+                    b = list(map(p.lut.__getitem__, 
+                                 map(operator.sub, col, itertools.repeat(p.min))))
+            else:
+                b = list(map(p.bin, col))
+            b_l.append(b)
+            for i,c in collections.Counter(b).items():
+                if i != -1:
+                    counts[off+i] += c
+        for name,idx,off,size in self.crosses:
+            if any(-1 in b_l[i] for i in idx):
+                x = []
+                for bins in zip(*[b_l[i] for i in idx]):
+                    if -1 not in bins:
+                        v = 0
+                        for b,i in zip(bins, idx):
+                            v = v*self.points[i].n_bins + b
+                        x.append(v)
+            else:
+                x = b_l[idx[0]]
+                for i in idx[1:]:
+                    x = map(operator.add, 
+                            map(operator.mul, x, itertools.repeat(self.points[i].n_bins)),
+                            b_l[i])
+            for v,c in collections.Counter(x).items():
+                counts[off+v] += c
+
+    def items(self):
+        for p,off in zip(self.points, self.point_off):
+            yield p.name, off, p.n_bins, p.labels
+        for name,idx,off,size in self.crosses:
+            yield name, off, size, None
+
+    def coverage(self) -> float:
+        return coverage_of(self.counts, list(self.items()))
+
+# Returns the average coverage (%) of the items (coverpoints and crosses)
+def coverage_of(counts, items) -> float:
+    if len(items) == 0:
+        return 0.0
+    total = 0.0
+    for name,off,size,labels in items:
+        hit = sum(1 for i in range(off, off+size) if counts[i] != 0)
+        total += 100.0*hit/size if size != 0 else 0.0
+    return total / len(items)
+
+#********************************************************************
+#* Coverage files
+#********************************************************************
+
+def enable(outfile):
+    global prv_outfile
+    prv_outfile = outfile
+
+def header() -> dict:
+    groups = []
+    off = 0
+    for cg in prv_covergroups:
+        items = []
+        for name,i_off,size,labels in cg.items():
+            item = {"name": name, "size": size}
+            if labels != None:
+                item["bins"] = labels
+            items.append(item)
+        groups.append({"name": cg.name, "offset": off, "size": len(cg.counts), "items": items})
+        off += len(cg.counts)
+    return {"runs": 1, "size": off, "groups": groups}
+
+def write(path, hdr, counts):
+    runs = hdr["runs"]
+    # The run count is kept out of the header, such that merged
+    # and unmerged files of the same covergroups have the same header
+    hdr = dict(hdr)
+    del hdr["runs"]
+    hdr_b = json.dumps(hdr, sort_keys=True).encode()
+    hdr_b += b" " * ((-(len(MAGIC) + 12 + len(hdr_b))) % 8)
+    with open(path, "wb") as fp:
+        fp.write(MAGIC)
+        fp.write(struct.pack("<II", len(hdr_b), 0))
+        fp.write(struct.pack("<I", runs))
+        fp.write(hdr_b)
+        if sys.byteorder != "little":
+            counts = array.array('Q', counts)
+            counts.byteswap()
+        fp.write(memoryview(counts).cast('B'))
+
+def read(path):
+    with open(path, "rb") as fp:
+        data = fp.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise Exception("\"" + path + "\" is not a coverage file")
+    off = len(MAGIC)
+    hdr_len,rsvd,runs = struct.unpack_from("<III", data, off)
+    off += 12
+    hdr_b = data[off:off+hdr_len]
+    hdr = json.loads(hdr_b)
+    hdr["runs"] = runs
+    off += hdr_len
+    counts = array.array('Q')
+    counts.frombytes(data[off:off+8*hdr["size"]])
+    if sys.byteorder != "little":
+        counts.byteswap()
+    return hdr_b, hdr, counts
+
+def dump():
+    if prv_outfile == None or len(prv_covergroups) == 0:
+        return
+    counts = array.array('Q')
+    for cg in prv_covergroups:
+        counts.extend(cg.counts)
+    hdr = header()
+    print_report(hdr, counts)
+    write(prv_outfile, hdr, counts)
+
+def print_report(hdr, counts, bins=False):
+    print("Coverage (" + str(hdr["runs"]) + " runs)")
+    for g in hdr["groups"]:
+        items = []
+        off = g["offset"]
+        for it in g["items"]:
+            items.append((it["name"], off, it["size"], it.get("bins")))
+            off += it["size"]
+        print("  %-32s %6.2f%%" % (g["name"], coverage_of(counts, items)))
+        for name,i_off,size,labels in items:
+            hit = sum(1 for i in range(i_off, i_off+size) if counts[i] != 0)
+            print("    %-30s %6.2f%% (%d/%d)" % (name, 100.0*hit/size if size != 0 else 0.0, hit, size))
+            if bins and labels != None:
+                for i,l in enumerate(labels):
+                    print("      %-28s %d" % (l, counts[i_off+i]))
+
+#********************************************************************
+#* merge()
+#*
+#* Merges coverage files. Files with the same header are merged by
+#* adding their counters. The merged header is the union of the
+#* covergroup items of all files, matched by covergroup, item and
+#* bins. Items are zero in the files that lack them
+#********************************************************************
+def merge(files):
+    # Sum the files that share a header, then map each sum to the union
+    sums = {}
+    runs = 0
+    for f in files:
+        hdr_b,hdr,counts = read(f)
+        runs += hdr["runs"]
+        if hdr_b not in sums.keys():
+            total = numpy.array(counts, dtype=numpy.uint64) if numpy != None else counts
+            sums[hdr_b] = (hdr, total)
+        elif numpy != None:
+            sums[hdr_b][1][:] += numpy.frombuffer(counts, dtype=numpy.uint64)
+        else:
+            total = sums[hdr_b][1]
+            for i,c in enumerate(counts):
+                if c != 0:
+                    total[i] += c
+
+    if len(sums) == 1:
+        hdr,total = list(sums.values())[0]
+    else:
+        hdr = union_header([h for h,t in sums.values()])
+        slots = item_slots(hdr)
+        if numpy != None:
+            total = numpy.zeros(hdr["size"], dtype=numpy.uint64)
+        else:
+            total = array.array('Q', bytes(8*hdr["size"]))
+        for s_hdr,s_total in sums.values():
+            for key,(off,size) in item_slots(s_hdr).items():
+                t_off = slots[key][0]
+                if numpy != None:
+                    total[t_off:t_off+size] += s_total[off:off+size]
+                else:
+                    for i in range(size):
+                        total[t_off+i] += s_total[off+i]
+
+    hdr["runs"] = runs
+    if numpy != None:
+        total = array.array('Q', total.tobytes())
+    return hdr, total
+
+#********************************************************************
+#* union_header()
+#*
+#* Returns a header with the items of all <hdrs>, with covergroups and
+#* items in the order they are first seen. Items of the same name with
+#* different bins are kept as separate items
+#********************************************************************
+def union_header(hdrs) -> dict:
+    groups = {}
+    for hdr in hdrs:
+        for gkey,g in group_keys(hdr):
+            items = groups.setdefault(gkey, {})
+            for it in g["items"]:
+                key = item_key(gkey, it)
+                if key not in items.keys():
+                    if any(k[1] == it["name"] for k in items.keys()):
+                        log.warn(g["name"] + "." + it["name"] + " has different bins " +
+                                 "in the merged files, and is reported separately")
+                    items[key] = it
+
+    ret = []
+    off = 0
+    for (name,n),items in groups.items():
+        size = sum(it["size"] for it in items.values())
+        ret.append({"name": name, "offset": off, "size": size,
+                    "items": list(items.values())})
+        off += size
+    return {"runs": 0, "size": off, "groups": ret}
+
+# Returns (key, group) for the covergroups of <hdr>. Several covergroups
+# may have the same name (eg one per BFM instance), so are identified
+# by name and by their position among the groups of that name
+def group_keys(hdr):
+    seen = {}
+    for g in hdr["groups"]:
+        n = seen.get(g["name"], 0)
+        seen[g["name"]] = n+1
+        yield (g["name"], n), g
+
+# Items without bin labels are identified by their number of bins
+def item_key(gkey, it):
+    return (gkey, it["name"], tuple(it["bins"]) if "bins" in it.keys() else it["size"])
+
+def item_slots(hdr) -> dict:
+    ret = {}
+    for gkey,g in group_keys(hdr):
+        off = g["offset"]
+        for it in g["items"]:
+            ret[item_key(gkey, it)] = (off, it["size"])
+            off += it["size"]
+    return ret
+
+def cov_merge(args):
+    hdr,counts = merge(args.files)
+    print_report(hdr, counts, args.bins)
+    if args.o != None:
+        write(args.o, hdr, counts)
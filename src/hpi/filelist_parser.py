@@ -4,7 +4,24 @@ Created on Jun 2, 2019
 @author: ballance
 '''
 
+import marshal
 import os
+import re
+from hpi import log
+
+# Whitespace and comments match with an empty group. Tokens are either
+# quoted (and may contain whitespace), or run to the next whitespace
+prv_tok_re = re.compile(r'''\s+|//[^\n]*|/\*.*?(?:\*/|\Z)|("(?:\\.|[^"\\])*"?|\S+)''', re.S)
+
+# ${VAR} or $VAR
+prv_var_re = re.compile(r"\$(?:\{(\w+)\}|(\w+))")
+
+# Format version of the expanded-filelist cache
+prv_cache_version = 2
+
+# Options whose argument is a path. These are rebased when they
+# appear in a filelist included with -F
+prv_path_opts = set(["-v", "-y"])
 
 class FilelistParser():
     
@@ -12,176 +29,274 @@ class FilelistParser():
                  filelist : str, 
                  cwd : str, 
                  is_caps_f : bool, 
-                 processed_paths : [str] = [],
-                 parent=None):
+                 processed_paths : set = None,
+                 parent=None,
+                 cache_dir : str = None,
+                 io_threads : int = 8):
         self.parent = parent;
         self.filelist = filelist
         self.cwd = cwd
+        self.is_caps_f = is_caps_f
+        self.cache_dir = cache_dir
+        # Real paths of all filelists already expanded
+        if processed_paths == None:
+            processed_paths = set()
         self.processed_paths = processed_paths
-        self.fp = open(filelist, mode="rb")
-        self.unget_c = ""
+        # Filelists are located relative to the working directory, 
+        # or relative to the including filelist when it was read with -F
+        base = cwd
+        if parent != None and parent.is_caps_f:
+            base = os.path.dirname(parent.path)
+        self.path = self.include_path(base, filelist)
+        if parent != None:
+            self.env_refs = parent.env_refs
+            self.deps = parent.deps
+            self.stack = parent.stack
+            self.io_threads = parent.io_threads
+            self.io = parent.io
+        else:
+            # Values of environment variables referenced by the filelists
+            self.env_refs = {}
+            # (path, mtime, size) of each filelist read
+            self.deps = []
+            # Filelists currently being expanded, for cycle detection
+            self.stack = []
+            self.io_threads = io_threads
+            # Pending reads of included filelists, and the pool running them
+            self.io = {"pool": None, "reads": {}}
         
     
     def parse(self) -> [str]:
-        ret = []
+        if self.parent != None:
+            return self.parse_file()
         
-        if self.filelist in self.processed_paths:
-            return ret
-       
-        self.processed_paths.append(self.filelist)
-      
-        while True:
-            tok = self.readtok();
-            if tok == None:
-                break
+        ret = None
+        if self.cache_dir != None:
+            ret = self.cache_load()
             
-            if tok == "-f" or tok == "-F":
-                filelist = self.expand(self.readtok())
-                basedir = self.cwd
-                
-                parser = FilelistParser(filelist, self.cwd, self.processed_paths)
-                
-                sub_args = parser.parse()
-                
-                for arg in sub_args:
-                    ret.append(arg)
-            else:
-                ret.append(self.expand(tok))
-                
+        if ret == None:
+            try:
+                ret = self.parse_file()
+            finally:
+                if self.io["pool"] != None:
+                    self.io["pool"].shutdown()
+                    self.io["pool"] = None
+                self.io["reads"].clear()
+            if self.cache_dir != None:
+                self.cache_save(ret)
         return ret
     
-    def readtok(self) -> str:
-        ret = ""
-
-        while True:
-            c = self.getch()
-            
-            if c == "":
-                break
-            
-            if c == '/':
-                c2 = self.getch()
+    def parse_file(self) -> [str]:
+        ret = []
+        
+        realpath = os.path.realpath(self.path)
+        
+        if realpath in self.stack:
+            log.warn("filelist include cycle: " + 
+                " -> ".join(self.stack[self.stack.index(realpath):] + [realpath]) +
+                " (ignored)")
+            return ret
+        
+        # A filelist included more than once is only expanded once
+        if realpath in self.processed_paths:
+            return ret
+       
+        self.processed_paths.add(realpath)
+        
+        # Filelists are read concurrently with expansion of their siblings
+        read = self.io["reads"].pop(realpath, None)
+        if read != None:
+            text, mtime, size = read.result()
+        else:
+            text, mtime, size = self.read(self.path)
+        self.deps.append((realpath, mtime, size))
+        toks = self.tokenize(text)
+        
+        self.prefetch(toks)
+        
+        self.stack.append(realpath)
+        try:
+            i=0
+            while i < len(toks):
+                tok = toks[i]
+                i += 1
                 
-                if c2 == '*':
-                    cc1 = -1
-                    cc2 = -1
+                if tok == "-f" or tok == "-F":
+                    if i >= len(toks):
+                        raise Exception("Filelist \"" + self.path + "\" ends with " + tok)
+                    filelist = self.expand(toks[i])
+                    i += 1
                     
-                    while True:
-                        c = self.getch()
-                        
-                        if c == "":
-                            break
-                        
-                        cc2 = cc1
-                        cc1 = c
-                        
-                        if cc1 == '/' and cc2 == '*':
-                            break
-                    continue
-                elif c2 == '/':
-                    while True:
-                        c = self.getch()
+                    parser = FilelistParser(filelist, self.cwd, 
+                            (tok == "-F"), self.processed_paths, self)
                     
-                        if c == "" or c == '\n':
-                            self.ungetch(c)
-                            break
+                    ret.extend(parser.parse())
+                elif self.is_caps_f:
+                    tok = self.expand(tok)
+                    if tok in prv_path_opts and i < len(toks):
+                        ret.append(tok)
+                        tok = self.rebase(self.expand(toks[i]))
+                        i += 1
+                    elif tok.startswith("+incdir+"):
+                        tok = "+incdir+" + "+".join(
+                            self.rebase(d) for d in tok[len("+incdir+"):].split("+"))
+                    elif not tok.startswith(("-", "+")):
+                        tok = self.rebase(tok)
+                    ret.append(tok)
                 else:
-                    self.ungetch(c)
-            elif c.isspace():
-                while True:
-                    c = self.getch()
-                    if c == "" or not c.isspace():
-                        break
-                self.ungetch(c)
-                continue
-            else:
-                # We have a non-WS character
-                break
-
-        if c == '"':
-            last_c = -1
-            ret += c
+                    ret.append(self.expand(tok))
+        finally:
+            self.stack.pop()
                 
-            while True:
-                c = self.getch()
-                    
-                if c == '"' and last_c == '\\':
-                    ret[len(ret)-1] = c
-                else:
-                    ret.append(c)
-                       
-                if c == "" or (c == '"' and last_c != '\\'):
-                    break
-        else:
-            ret += c
-            while True:
-                c = self.getch()
-                if c == "" or c.isspace():
-                    self.ungetch(c)
-                    break
-                else:
-                    ret += c
-
-        if len(ret) > 0:
-            return ret
-        else:
-            return None
+        return ret
+    
+    # Returns the path of filelist <filelist> included relative to <base>
+    @staticmethod
+    def include_path(base, filelist):
+        return os.path.normpath(os.path.join(base, filelist))
+    
+    @staticmethod
+    def read(path):
+        # Read the whole file at once, such that it can be tokenized in bulk
+        with open(path, "r") as fp:
+            st = os.fstat(fp.fileno())
+            return (fp.read(), st.st_mtime_ns, st.st_size)
     
-    def getch(self) -> str:
-        ret = ""
+    #****************************************************************
+    #* prefetch()
+    #*
+    #* Starts reading the filelists included by this one on the I/O
+    #* pool. On network filesystems most of the parse time is spent 
+    #* waiting on reads, so these overlap with expansion of earlier
+    #* includes. Expansion itself remains sequential, such that the
+    #* result is in include order
+    #****************************************************************
+    def prefetch(self, toks):
+        if self.io_threads <= 0:
+            return
         
-        if self.unget_c != "":
-            ret = self.unget_c
-            self.unget_c = ""
-        else:
-            b = self.fp.read(1)
-            if len(b) > 0:
-                ret = b.decode()
+        base = os.path.dirname(self.path) if self.is_caps_f else self.cwd
+        # Reads are keyed by real path, as parse_file() looks them up
+        paths = {}
+        i=0
+        while i+1 < len(toks):
+            if toks[i] == "-f" or toks[i] == "-F":
+                path = self.include_path(base, self.expand(toks[i+1]))
+                realpath = os.path.realpath(path)
+                if (realpath not in self.processed_paths and 
+                        realpath not in self.io["reads"].keys() and 
+                        realpath not in paths.keys()):
+                    paths[realpath] = path
+                i += 2
             else:
-                ret = ""
+                i += 1
+            
+        # A single include gains nothing from a background read
+        if len(paths) < 2:
+            return
+        
+        if self.io["pool"] == None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.io["pool"] = ThreadPoolExecutor(max_workers=self.io_threads)
+        for realpath,path in paths.items():
+            self.io["reads"][realpath] = self.io["pool"].submit(self.read, path)
+        
+    def rebase(self, path : str) -> str:
+        if path.startswith('"'):
+            # Quoted tokens keep their quotes. Rebase the path they hold
+            inner = path[1:-1] if len(path) > 1 and path.endswith('"') else path[1:]
+            return '"' + self.rebase(inner) + '"'
+        if path == "" or os.path.isabs(path):
+            return path
+        return os.path.normpath(os.path.join(os.path.dirname(self.path), path))
+    
+    def tokenize(self, text : str) -> [str]:
+        if '/' not in text and '"' not in text:
+            # No comments or quoted tokens
+            return text.split()
+
+        ret = []
+        for tok in prv_tok_re.findall(text):
+            if tok == "":
+                # Whitespace or comment
+                continue
+            if tok[0] == '"':
+                tok = tok.replace('\\"', '"')
+            ret.append(tok)
 
         return ret
-    
-    def ungetch(self, c):
-        self.unget_c = c
    
     def expand(self, arg : str) -> str:
-        ret = ""
+        if '$' not in arg:
+            return arg
+
+        return prv_var_re.sub(self.expand_var, arg)
+    
+    def expand_var(self, m) -> str:
+        key = m.group(1) or m.group(2)
         
-        i=0
-        while i < len(arg):
-            if arg[i] == '$':
-                if arg[i+1] == '{':
-                    expect_closebrace = True
-                    i += 2
-                else:
-                    expect_closebrace = False
-                    
-                j = i
-                while j < len(arg):
-                    c = arg[j]
-                    
-                    if not c.isalpha() and not c.isnumeric() and (c != '_'):
-                        break
-                    j += 1
-                    
-                key = arg[i:j]
-                
-                if key in os.environ.keys():
-                    val = os.environ[key]
-                else:
-                    val = ""
-                    
-                if expect_closebrace == False:
-                    i=j-1
-                else:
-                    i=j
-                    
-                ret += val
-            else:
-                ret += arg[i]
-                
-            i += 1
+        if key not in self.env_refs.keys():
+            self.env_refs[key] = os.environ.get(key, "")
+            
+        return self.env_refs[key]
+    
+    def cache_path(self) -> str:
+        import hashlib
+        key = "\0".join((
+            os.path.realpath(self.path), 
+            os.path.abspath(self.cwd), 
+            str(self.is_caps_f)))
+        return os.path.join(self.cache_dir, 
+                "fl_" + hashlib.sha1(key.encode()).hexdigest() + ".cache")
+    
+    #****************************************************************
+    #* cache_load()
+    #*
+    #* Returns the cached expansion of this filelist, or None if there 
+    #* is no cache entry or any filelist or referenced environment 
+    #* variable has changed since it was saved
+    #****************************************************************
+    def cache_load(self) -> [str]:
+        try:
+            # Single read of the whole entry
+            with open(self.cache_path(), "rb") as fp:
+                entry = marshal.loads(fp.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
         
-        return ret
-    
\ No newline at end of file
+        if type(entry) != dict or entry.get("version") != prv_cache_version:
+            return None
+        
+        for key,val in entry["env"].items():
+            if os.environ.get(key, "") != val:
+                return None
+            
+        for path,mtime,size in entry["deps"]:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            if st.st_mtime_ns != mtime or st.st_size != size:
+                return None
+            
+        return entry["argv"]
+    
+    def cache_save(self, argv : [str]):
+        entry = {
+            "version": prv_cache_version,
+            "deps": self.deps,
+            "env": self.env_refs,
+            "argv": argv
+            }
+        path = self.cache_path()
+        
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write and rename, such that concurrent runs never 
+            # see a partial entry
+            tmp = path + "." + str(os.getpid())
+            with open(tmp, "wb") as fp:
+                fp.write(marshal.dumps(entry))
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warn("failed to save filelist cache \"" + path + "\": " + str(e))
@@ -56,7 +56,17 @@ pyhpi_dpi_template = '''
  * Provides a DPI interface between SystemVerilog and Python. 
  * Generated using the command: ${command}
  ****************************************************************************/
+#include <stdarg.h>
 #include <stdint.h>
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+#include <fcntl.h>
+#include <sched.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <sys/wait.h>
 #include "Python.h"
     
 #ifdef __cplusplus
@@ -78,6 +88,17 @@ static int pyhpi_register_bfm(const char *tname, const char *iname);
 void *svGetScope(void);
 void svSetScope(void *);
 
+// Message levels, set from the Python side with +hpi.verbosity
+#define PYHPI_LOG_NONE  0
+#define PYHPI_LOG_ERROR 1
+#define PYHPI_LOG_WARN  2
+#define PYHPI_LOG_INFO  3
+#define PYHPI_LOG_DEBUG 4
+#define PYHPI_LOG(level, ...) \\
+    do { if ((level) <= pyhpi_log_level) { pyhpi_log(level, __VA_ARGS__); } } while (0)
+extern int pyhpi_log_level;
+void pyhpi_log(int level, const char *fmt, ...);
+
 #ifdef __cplusplus
 }
 #endif /* __cplusplus */
@@ -88,6 +109,726 @@ static int prv_scope_list_len = 0;
 static int prv_initialized = 0;
 static PyObject *prv_hpi = 0;
 static PyObject *prv_bfm_list = 0;
+static PyObject *prv_register_bfm = 0;
+
+// With bulk registration (+hpi.bulk_register), registrations are queued
+// as (tname, iname, id) and passed to rgy.register_bfms in one call
+static int prv_bulk_register = 0;
+static PyObject *prv_register_q = 0;
+
+#if defined(_MSC_VER)
+#define PYHPI_TLS __declspec(thread)
+#else
+#define PYHPI_TLS __thread
+#endif
+
+static PYHPI_TLS int prv_gil_pinned = 0;
+
+/****************************************************************************
+ * pyhpi_gil_ensure()
+ *
+ * Acquires the GIL for a call arriving from the HDL. With a multi-threaded
+ * model (eg verilator --threads), calls may arrive on any model thread, 
+ * so the call runs on the calling thread once it holds the GIL. A thread
+ * state stays bound to each calling thread, such that later calls only
+ * pay for the GIL hand-off. prv_scope_list is only accessed with the GIL
+ * held.
+ ****************************************************************************/
+static PyGILState_STATE pyhpi_gil_ensure(void) {
+    if (!prv_gil_pinned) {
+        // This Ensure is never released, keeping the thread state alive
+        if (PyGILState_Ensure() == PyGILState_UNLOCKED) {
+            PyEval_SaveThread();
+        }
+        prv_gil_pinned = 1;
+    }
+    return PyGILState_Ensure();
+}
+
+/****************************************************************************
+ * Profiling
+ *
+ * Enabled from the Python side (+hpi.profile). Records the call count
+ * and time spent in each import (HDL->Python) and export (Python->HDL)
+ * task
+ ****************************************************************************/
+typedef struct pyhpi_prof_s {
+    const char      *name;
+    const char      *kind;
+    uint64_t        count;
+    uint64_t        time_ns;
+} pyhpi_prof_t;
+
+static int prv_prof_en = 0;
+static pyhpi_prof_t prv_prof[] = {
+${prof_entries}    {0, 0, 0, 0}
+};
+
+static uint64_t pyhpi_prof_now(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ((uint64_t)ts.tv_sec)*1000000000ULL + ts.tv_nsec;
+}
+
+#define PYHPI_PROF_START() \\
+    uint64_t prof_start = (prv_prof_en)?pyhpi_prof_now():0
+#define PYHPI_PROF_END(idx) \\
+    if (prv_prof_en) { \\
+        prv_prof[idx].count++; \\
+        prv_prof[idx].time_ns += pyhpi_prof_now() - prof_start; \\
+    }
+
+static PyObject *prof_enable(PyObject *self, PyObject *args) {
+    int en;
+    if (!PyArg_ParseTuple(args, "i", &en)) {
+        return 0;
+    }
+    prv_prof_en = en;
+    Py_RETURN_NONE;
+}
+
+static PyObject *prof_data(PyObject *self, PyObject *args) {
+    PyObject *ret = PyList_New(0);
+    pyhpi_prof_t *p;
+
+    for (p=prv_prof; p->name; p++) {
+        PyObject *t = Py_BuildValue("(ssKK)", p->name, p->kind,
+            (unsigned long long)p->count, (unsigned long long)p->time_ns);
+        PyList_Append(ret, t);
+        Py_DECREF(t);
+    }
+    return ret;
+}
+
+/****************************************************************************
+ * pyhpi_log()
+ *
+ * Writes a message from the generated code or the launcher. Callers use
+ * PYHPI_LOG(), which checks the level before formatting. Output is left
+ * to stdio buffering, except for errors and warnings, and when debug
+ * messages are enabled
+ ****************************************************************************/
+int pyhpi_log_level = PYHPI_LOG_INFO;
+
+void pyhpi_log(int level, const char *fmt, ...) {
+    va_list ap;
+    
+    if (level > pyhpi_log_level) {
+        return;
+    }
+    
+    if (level == PYHPI_LOG_ERROR) {
+        fputs("Error: ", stdout);
+    } else if (level == PYHPI_LOG_WARN) {
+        fputs("Warning: ", stdout);
+    }
+    va_start(ap, fmt);
+    vfprintf(stdout, fmt, ap);
+    va_end(ap);
+    fputc('\\n', stdout);
+    
+    // Keep ordering with Python-side output when debugging
+    if (level <= PYHPI_LOG_WARN || pyhpi_log_level >= PYHPI_LOG_DEBUG) {
+        fflush(stdout);
+    }
+}
+
+static PyObject *set_bulk_register(PyObject *self, PyObject *args) {
+    if (!PyArg_ParseTuple(args, "i", &prv_bulk_register)) {
+        return 0;
+    }
+    Py_RETURN_NONE;
+}
+
+/****************************************************************************
+ * pyhpi_flush_registrations()
+ *
+ * Creates the BFM instances for queued registrations. Called from 
+ * tb_main before the testbench starts, and on a call to a BFM whose
+ * registration is still queued
+ ****************************************************************************/
+static int pyhpi_flush_registrations(void) {
+    PyObject *q, *func, *result;
+    
+    if (!prv_register_q || PyList_GET_SIZE(prv_register_q) == 0) {
+        return 0;
+    }
+    
+    q = prv_register_q;
+    prv_register_q = 0;
+    
+    if (!(func = PyObject_GetAttrString(prv_hpi, "register_bfms"))) {
+        PyErr_Print();
+        Py_DECREF(q);
+        return -1;
+    }
+    result = PyObject_CallFunctionObjArgs(func, q, 0);
+    Py_DECREF(func);
+    Py_DECREF(q);
+    
+    if (!result) {
+        PyErr_Print();
+        return -1;
+    }
+    Py_DECREF(result);
+    return 0;
+}
+
+static PyObject *flush_registrations(PyObject *self, PyObject *args) {
+    if (pyhpi_flush_registrations() != 0) {
+        PyErr_SetString(PyExc_RuntimeError, "failed to register queued BFMs");
+        return 0;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *set_verbosity(PyObject *self, PyObject *args) {
+    if (!PyArg_ParseTuple(args, "i", &pyhpi_log_level)) {
+        return 0;
+    }
+    Py_RETURN_NONE;
+}
+
+/****************************************************************************
+ * Shared-memory transport
+ *
+ * With +hpi.shm, the Python testbench runs in a separate process (see
+ * hpi/shm.py). Calls between the simulator and the testbench are passed
+ * through a pair of single-producer/single-consumer rings in a shared 
+ * file. Import calls are posted, and the simulator only waits for the
+ * testbench to become idle before simulation time advances. Export calls
+ * are posted by the testbench and applied by the simulator.
+ ****************************************************************************/
+#define PYHPI_SHM_PAD         0
+#define PYHPI_SHM_HELLO       1
+#define PYHPI_SHM_REGISTER    2
+#define PYHPI_SHM_IMPORT      3
+#define PYHPI_SHM_TIME        4
+#define PYHPI_SHM_SYNC        5
+#define PYHPI_SHM_MAIN        6
+#define PYHPI_SHM_FINI        7
+#define PYHPI_SHM_IDLE        16
+#define PYHPI_SHM_EXPORT      17
+#define PYHPI_SHM_FINISH      18
+#define PYHPI_SHM_TIMEOUT     19
+#define PYHPI_SHM_TRACE       20
+
+// Offsets within the shared file
+#define PYHPI_SHM_S2P_HEAD    64
+#define PYHPI_SHM_S2P_TAIL    128
+#define PYHPI_SHM_P2S_HEAD    192
+#define PYHPI_SHM_P2S_TAIL    256
+#define PYHPI_SHM_DATA        4096
+
+#define PYHPI_SHM_ALIGN(n)    (((n)+7) & ~7)
+#define PYHPI_SHM_STRLEN(n)   PYHPI_SHM_ALIGN(4+(n))
+
+typedef struct pyhpi_shm_rec_s {
+    uint32_t        len;
+    uint16_t        kind;
+    uint16_t        tf;
+    int32_t         id;
+    uint32_t        rsvd;
+} pyhpi_shm_rec_t;
+
+typedef struct pyhpi_shm_ring_s {
+    uint64_t        *head;
+    uint64_t        *tail;
+    uint8_t         *data;
+    uint64_t        size;
+    // Local copy of the index owned by this side
+    uint64_t        idx;
+} pyhpi_shm_ring_t;
+
+static int prv_shm = 0;
+static uint32_t prv_shm_spin = 0;
+static pid_t prv_shm_pid = 0;
+static pyhpi_shm_ring_t prv_shm_s2p;
+static pyhpi_shm_ring_t prv_shm_p2s;
+static uint64_t prv_simtime = 0;
+static int prv_simtime_sent = 1;
+static int prv_shm_posted = 0;
+static int prv_shm_idle = 0;
+// Export calls applied since the last pyhpi_shm_sync()
+static int prv_shm_applied = 0;
+
+static int pyhpi_shm_poll(void);
+
+/****************************************************************************
+ * pyhpi_shm_alive()
+ *
+ * Checks whether the testbench process is still running, without 
+ * reaping it
+ ****************************************************************************/
+static int pyhpi_shm_alive(void) {
+    siginfo_t info;
+    info.si_pid = 0;
+    if (waitid(P_PID, prv_shm_pid, &info, WEXITED|WNOHANG|WNOWAIT) != 0) {
+        return 0;
+    }
+    return (info.si_pid == 0);
+}
+
+/****************************************************************************
+ * pyhpi_shm_backoff()
+ *
+ * Called while waiting on the testbench process. Spins briefly before 
+ * yielding the CPU. Returns 0 once the testbench process has exited
+ ****************************************************************************/
+static int pyhpi_shm_backoff(uint32_t *count) {
+    (*count)++;
+    if (*count < prv_shm_spin) {
+        return 1;
+    }
+    sched_yield();
+    if ((*count & 0xFFFF) == 0 && !pyhpi_shm_alive()) {
+        PYHPI_LOG(PYHPI_LOG_ERROR, "testbench process exited unexpectedly");
+        prv_shm = 0;
+        return 0;
+    }
+    return 1;
+}
+
+/****************************************************************************
+ * pyhpi_shm_reserve()
+ *
+ * Reserves space for a record of <len> bytes in the simulator-to-testbench
+ * ring. Records do not wrap, so the end of the ring is padded when 
+ * required. Pending export calls are applied while waiting for space, 
+ * since the testbench may itself be waiting to post them
+ ****************************************************************************/
+static uint8_t *pyhpi_shm_reserve(uint32_t len) {
+    pyhpi_shm_ring_t *r = &prv_shm_s2p;
+    uint64_t off = r->idx % r->size;
+    uint64_t need = len;
+    uint32_t count = 0;
+    
+    if (off + len > r->size) {
+        need += r->size - off;
+    }
+    
+    while (r->size - (r->idx - __atomic_load_n(r->tail, __ATOMIC_ACQUIRE)) < need) {
+        if (!pyhpi_shm_poll() && !pyhpi_shm_backoff(&count)) {
+            return 0;
+        }
+    }
+    
+    if (off + len > r->size) {
+        pyhpi_shm_rec_t *pad = (pyhpi_shm_rec_t *)&r->data[off];
+        pad->len = r->size - off;
+        pad->kind = PYHPI_SHM_PAD;
+        r->idx += r->size - off;
+        off = 0;
+    }
+    
+    return &r->data[off];
+}
+
+static inline void pyhpi_shm_commit(uint32_t len) {
+    prv_shm_s2p.idx += len;
+    __atomic_store_n(prv_shm_s2p.head, prv_shm_s2p.idx, __ATOMIC_RELEASE);
+}
+
+// Posts a record with a fixed-size payload
+static int pyhpi_shm_post(int kind, int id, const void *payload, uint32_t plen) {
+    uint32_t len = PYHPI_SHM_ALIGN(sizeof(pyhpi_shm_rec_t) + plen);
+    pyhpi_shm_rec_t *rec = (pyhpi_shm_rec_t *)pyhpi_shm_reserve(len);
+    
+    if (!rec) {
+        return -1;
+    }
+    rec->len = len;
+    rec->kind = kind;
+    rec->tf = 0;
+    rec->id = id;
+    if (plen) {
+        memcpy(&rec[1], payload, plen);
+    }
+    pyhpi_shm_commit(len);
+    return 0;
+}
+
+// Called by generated import-task wrappers before posting a call
+static inline uint8_t *pyhpi_shm_import_start(int tf, int id, uint32_t len) {
+    pyhpi_shm_rec_t *rec;
+    
+    if (!prv_simtime_sent) {
+        pyhpi_shm_post(PYHPI_SHM_TIME, 0, &prv_simtime, sizeof(uint64_t));
+        prv_simtime_sent = 1;
+    }
+    
+    len = PYHPI_SHM_ALIGN(len);
+    if (!(rec = (pyhpi_shm_rec_t *)pyhpi_shm_reserve(len))) {
+        return 0;
+    }
+    rec->len = len;
+    rec->kind = PYHPI_SHM_IMPORT;
+    rec->tf = tf;
+    rec->id = id;
+    prv_shm_posted = 1;
+    
+    return (uint8_t *)&rec[1];
+}
+
+static inline uint8_t *pyhpi_shm_put_str(uint8_t *p, const char *s) {
+    uint32_t n = strlen(s);
+    *(uint32_t *)p = n;
+    memcpy(p+4, s, n);
+    return p + PYHPI_SHM_STRLEN(n);
+}
+
+/****************************************************************************
+ * pyhpi_shm_launcher_call()
+ *
+ * Applies a testbench call to the launcher (hpi_l) API
+ ****************************************************************************/
+static void pyhpi_shm_launcher_call(const char *method, PyObject *arg) {
+    PyGILState_STATE gil = pyhpi_gil_ensure();
+    PyObject *hpi_l, *ret = 0;
+    
+    if ((hpi_l = PyImport_ImportModule("hpi_l"))) {
+        if (arg) {
+            ret = PyObject_CallMethod(hpi_l, method, "O", arg);
+        } else {
+            ret = PyObject_CallMethod(hpi_l, method, 0);
+        }
+        Py_DECREF(hpi_l);
+    }
+    if (!ret) {
+        PyErr_Print();
+    }
+    Py_XDECREF(ret);
+    Py_XDECREF(arg);
+    PyGILState_Release(gil);
+}
+
+/****************************************************************************
+ * pyhpi_shm_export()
+ *
+ * Calls the export task identified by its index in the profile table
+ ****************************************************************************/
+static void pyhpi_rec_export(int tf, int id, uint8_t *p, uint32_t len);
+
+static void pyhpi_shm_export(int tf, int id, uint8_t *p, uint32_t len) {
+    pyhpi_rec_export(tf, id, p, len);
+    svSetScope(prv_scope_list[id]);
+    
+${shm_export_switch}
+}
+
+/****************************************************************************
+ * pyhpi_shm_poll()
+ *
+ * Applies records posted by the testbench. Returns the number of 
+ * records processed
+ ****************************************************************************/
+static int pyhpi_shm_poll(void) {
+    pyhpi_shm_ring_t *r = &prv_shm_p2s;
+    uint64_t head = __atomic_load_n(r->head, __ATOMIC_ACQUIRE);
+    int ret = 0;
+    
+    while (r->idx < head) {
+        pyhpi_shm_rec_t *rec = (pyhpi_shm_rec_t *)&r->data[r->idx % r->size];
+        
+        switch (rec->kind) {
+            case PYHPI_SHM_EXPORT: 
+                pyhpi_shm_export(rec->tf, rec->id, (uint8_t *)&rec[1], rec->len); 
+                prv_shm_applied++;
+                break;
+            case PYHPI_SHM_IDLE: 
+                prv_shm_idle++; 
+                break;
+            case PYHPI_SHM_FINISH:
+                pyhpi_shm_launcher_call("finish", 0);
+                break;
+            case PYHPI_SHM_TIMEOUT:
+                pyhpi_shm_launcher_call("set_timeout",
+                    PyLong_FromUnsignedLongLong(*(uint64_t *)&rec[1]));
+                break;
+            case PYHPI_SHM_TRACE:
+                pyhpi_shm_launcher_call((rec->id)?"trace_on":"trace_off", 0);
+                break;
+            case PYHPI_SHM_PAD:
+                break;
+            default:
+                PYHPI_LOG(PYHPI_LOG_ERROR, "unknown record kind %d from testbench", rec->kind);
+                break;
+        }
+        r->idx += rec->len;
+        ret++;
+    }
+    if (ret) {
+        __atomic_store_n(r->tail, r->idx, __ATOMIC_RELEASE);
+    }
+    
+    return ret;
+}
+
+/****************************************************************************
+ * pyhpi_shm_call()
+ *
+ * Posts a request and applies export calls until the testbench 
+ * reports that it is idle
+ ****************************************************************************/
+static int pyhpi_shm_call(int kind) {
+    uint32_t count = 0;
+    
+    if (!prv_simtime_sent) {
+        pyhpi_shm_post(PYHPI_SHM_TIME, 0, &prv_simtime, sizeof(uint64_t));
+        prv_simtime_sent = 1;
+    }
+    prv_shm_idle = 0;
+    if (pyhpi_shm_post(kind, 0, 0, 0) != 0) {
+        return -1;
+    }
+    
+    while (!prv_shm_idle) {
+        if (!pyhpi_shm_poll()) {
+            if (!pyhpi_shm_backoff(&count)) {
+                return -1;
+            }
+        } else {
+            count = 0;
+        }
+    }
+    prv_shm_posted = 0;
+    
+    return 0;
+}
+
+// Returns whether the shared-memory transport is active
+int pyhpi_shm_enabled(void) {
+    return prv_shm;
+}
+
+// Sets the simulation time (ps) of the next evaluation. Called by the
+// launcher, and used by the shared-memory transport and recording
+void pyhpi_settime(uint64_t t) {
+    if (t != prv_simtime) {
+        prv_simtime = t;
+        prv_simtime_sent = 0;
+    }
+}
+
+/****************************************************************************
+ * pyhpi_shm_sync()
+ *
+ * Called by the launcher after each evaluation. When calls were posted
+ * to the testbench during the evaluation, waits for the testbench to 
+ * settle and applies the resulting export calls. Returns the number of
+ * export calls applied since the last sync. The launcher evaluates the 
+ * model again while this is non-zero, since the calls may change its 
+ * inputs, and would have been applied within the evaluation in-process
+ ****************************************************************************/
+int pyhpi_shm_sync(void) {
+    int ret;
+    if (prv_shm && prv_shm_posted) {
+        pyhpi_shm_call(PYHPI_SHM_SYNC);
+    }
+    ret = prv_shm_applied;
+    prv_shm_applied = 0;
+    return ret;
+}
+
+static PyObject *shm_connect(PyObject *self, PyObject *args) {
+    const char *path;
+    int pid, fd;
+    struct stat st;
+    uint8_t *base;
+    
+    if (!PyArg_ParseTuple(args, "si", &path, &pid)) {
+        return 0;
+    }
+    
+#if !defined(__x86_64__) && !defined(__i386__)
+    // The testbench side of the channel relies on TSO (see hpi/shm.py)
+    PyErr_SetString(PyExc_RuntimeError, 
+        "+hpi.shm is only supported on x86 hosts");
+    return 0;
+#endif
+    
+    if ((fd = open(path, O_RDWR)) == -1 || fstat(fd, &st) != 0) {
+        return PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+    }
+    base = (uint8_t *)mmap(0, st.st_size, PROT_READ|PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (base == MAP_FAILED) {
+        return PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+    }
+    
+    prv_shm_s2p.size = (st.st_size - PYHPI_SHM_DATA)/2;
+    prv_shm_s2p.head = (uint64_t *)&base[PYHPI_SHM_S2P_HEAD];
+    prv_shm_s2p.tail = (uint64_t *)&base[PYHPI_SHM_S2P_TAIL];
+    prv_shm_s2p.data = &base[PYHPI_SHM_DATA];
+    prv_shm_s2p.idx = *prv_shm_s2p.head;
+    prv_shm_p2s.size = prv_shm_s2p.size;
+    prv_shm_p2s.head = (uint64_t *)&base[PYHPI_SHM_P2S_HEAD];
+    prv_shm_p2s.tail = (uint64_t *)&base[PYHPI_SHM_P2S_TAIL];
+    prv_shm_p2s.data = &base[PYHPI_SHM_DATA+prv_shm_s2p.size];
+    prv_shm_p2s.idx = *prv_shm_p2s.tail;
+    prv_shm_pid = pid;
+    // Spinning only helps when both processes can run at once
+    prv_shm_spin = (sysconf(_SC_NPROCESSORS_ONLN) > 1)?1000:0;
+    prv_shm = 1;
+    
+    Py_RETURN_NONE;
+}
+
+// Runs the testbench main, and waits for it to settle
+static PyObject *shm_main(PyObject *self, PyObject *args) {
+    if (prv_shm && pyhpi_shm_call(PYHPI_SHM_MAIN) != 0) {
+        PyErr_SetString(PyExc_RuntimeError, "testbench process failed to start");
+        return 0;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *shm_fini(PyObject *self, PyObject *args) {
+    if (prv_shm) {
+        pyhpi_shm_call(PYHPI_SHM_FINI);
+        prv_shm = 0;
+    }
+    Py_RETURN_NONE;
+}
+
+/****************************************************************************
+ * Recording
+ *
+ * With +hpi.record, each BFM registration, import call and export call 
+ * is appended to a binary log, using the same records as the 
+ * shared-memory transport. The log starts with a 16-byte header ('HPIL',
+ * version) followed by a HELLO record, and can be replayed without the 
+ * simulator (python -m hpi replay)
+ ****************************************************************************/
+#define PYHPI_REC_MAGIC       0x4C495048
+#define PYHPI_REC_VERSION     1
+#define PYHPI_REC_BUFSZ       (1024*1024)
+
+static FILE *prv_rec_fp = 0;
+static uint8_t *prv_rec_buf = 0;
+static uint32_t prv_rec_bufsz = 0;
+static uint32_t prv_rec_idx = 0;
+static uint64_t prv_rec_time = 0;
+
+static void pyhpi_rec_flush(void) {
+    if (prv_rec_idx) {
+        fwrite(prv_rec_buf, 1, prv_rec_idx, prv_rec_fp);
+        prv_rec_idx = 0;
+    }
+}
+
+/****************************************************************************
+ * pyhpi_rec_start()
+ *
+ * Reserves space for a record of <len> bytes in the log buffer, 
+ * preceded by a TIME record when simulation time has advanced
+ ****************************************************************************/
+static uint8_t *pyhpi_rec_start(int kind, int tf, int id, uint32_t len) {
+    pyhpi_shm_rec_t *rec;
+    
+    len = PYHPI_SHM_ALIGN(len);
+    if (prv_rec_idx + len + 32 > prv_rec_bufsz) {
+        pyhpi_rec_flush();
+        if (len + 32 > prv_rec_bufsz) {
+            prv_rec_bufsz = len + 32;
+            prv_rec_buf = (uint8_t *)realloc(prv_rec_buf, prv_rec_bufsz);
+        }
+    }
+    
+    if (prv_simtime != prv_rec_time) {
+        rec = (pyhpi_shm_rec_t *)&prv_rec_buf[prv_rec_idx];
+        rec->len = 24;
+        rec->kind = PYHPI_SHM_TIME;
+        rec->tf = 0;
+        rec->id = 0;
+        rec->rsvd = 0;
+        memcpy(&rec[1], &prv_simtime, sizeof(uint64_t));
+        prv_rec_idx += 24;
+        prv_rec_time = prv_simtime;
+    }
+    
+    rec = (pyhpi_shm_rec_t *)&prv_rec_buf[prv_rec_idx];
+    rec->len = len;
+    rec->kind = kind;
+    rec->tf = tf;
+    rec->id = id;
+    rec->rsvd = 0;
+    
+    return (uint8_t *)&rec[1];
+}
+
+static inline uint8_t *pyhpi_rec_import_start(int tf, int id, uint32_t len) {
+    return pyhpi_rec_start(PYHPI_SHM_IMPORT, tf, id, len);
+}
+
+static inline uint8_t *pyhpi_rec_export_start(int tf, int id, uint32_t len) {
+    return pyhpi_rec_start(PYHPI_SHM_EXPORT, tf, id, len);
+}
+
+static inline void pyhpi_rec_commit(uint32_t len) {
+    prv_rec_idx += PYHPI_SHM_ALIGN(len);
+}
+
+static PyObject *record_open(PyObject *self, PyObject *args) {
+    const char *path, *hello;
+    uint32_t hdr[4] = {PYHPI_REC_MAGIC, PYHPI_REC_VERSION, 0, 0};
+    uint32_t len;
+    uint8_t *p;
+    
+    if (!PyArg_ParseTuple(args, "ss", &path, &hello)) {
+        return 0;
+    }
+    if (!(prv_rec_fp = fopen(path, "wb"))) {
+        return PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+    }
+    prv_rec_bufsz = PYHPI_REC_BUFSZ;
+    prv_rec_buf = (uint8_t *)malloc(prv_rec_bufsz);
+    prv_rec_idx = 0;
+    prv_rec_time = prv_simtime;
+    fwrite(hdr, sizeof(hdr), 1, prv_rec_fp);
+    
+    len = sizeof(pyhpi_shm_rec_t) + PYHPI_SHM_STRLEN(strlen(hello));
+    p = pyhpi_rec_start(PYHPI_SHM_HELLO, 0, 0, len);
+    pyhpi_shm_put_str(p, hello);
+    pyhpi_rec_commit(len);
+    
+    Py_RETURN_NONE;
+}
+
+// Records an event without arguments, such as the start of the testbench
+static PyObject *record_event(PyObject *self, PyObject *args) {
+    int kind;
+    
+    if (!PyArg_ParseTuple(args, "i", &kind)) {
+        return 0;
+    }
+    if (prv_rec_fp) {
+        pyhpi_rec_start(kind, 0, 0, sizeof(pyhpi_shm_rec_t));
+        pyhpi_rec_commit(sizeof(pyhpi_shm_rec_t));
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *record_close(PyObject *self, PyObject *args) {
+    if (prv_rec_fp) {
+        pyhpi_rec_flush();
+        fclose(prv_rec_fp);
+        free(prv_rec_buf);
+        prv_rec_fp = 0;
+        prv_rec_buf = 0;
+    }
+    Py_RETURN_NONE;
+}
+
+// Records an export call posted by an out-of-process testbench
+static void pyhpi_rec_export(int tf, int id, uint8_t *p, uint32_t len) {
+    if (prv_rec_fp) {
+        memcpy(pyhpi_rec_start(PYHPI_SHM_EXPORT, tf, id, len), p, 
+            len - sizeof(pyhpi_shm_rec_t));
+        pyhpi_rec_commit(len);
+    }
+}
+
 
 // TODO: need to import hpi module
 
@@ -126,6 +867,17 @@ ${export_trampoline_switch}
 static PyMethodDef hpi_exp_methods[] = {
     {"set_context", &set_context, METH_VARARGS, ""},
     {"export_trampoline", &export_trampoline, METH_VARARGS, ""},
+    {"prof_enable", &prof_enable, METH_VARARGS, ""},
+    {"prof_data", &prof_data, METH_VARARGS, ""},
+    {"set_verbosity", &set_verbosity, METH_VARARGS, ""},
+    {"set_bulk_register", &set_bulk_register, METH_VARARGS, ""},
+    {"flush_registrations", &flush_registrations, METH_VARARGS, ""},
+    {"shm_connect", &shm_connect, METH_VARARGS, ""},
+    {"shm_main", &shm_main, METH_VARARGS, ""},
+    {"shm_fini", &shm_fini, METH_VARARGS, ""},
+    {"record_open", &record_open, METH_VARARGS, ""},
+    {"record_event", &record_event, METH_VARARGS, ""},
+    {"record_close", &record_close, METH_VARARGS, ""},
 ${hpi_method_table_entries}
     { 0, 0, 0, 0}
 };
@@ -146,38 +898,99 @@ static PyObject *PyInit_hpi_e(void) {
     return PyModule_Create(&hpi_e);
 }
 
+/****************************************************************************
+ * pyhpi_register_bfm()
+ *
+ * Called by each BFM instance during elaboration. Records the instance
+ * scope and creates the Python BFM instance, or queues it with bulk
+ * registration
+ ****************************************************************************/
 static int pyhpi_register_bfm(const char *tname, const char *iname) {
-    PyObject *hpi, *reg_func;
+    PyObject *result;
+    PyGILState_STATE gil;
     int ret = 0;
     
     if (!prv_initialized) {
         pyhpi_launcher_init();
         prv_initialized = 1;
     }
+    gil = pyhpi_gil_ensure();
   
     if (prv_scope_list_idx >= prv_scope_list_len) {
-        void *old = prv_scope_list;
-        prv_scope_list = (void **)malloc(sizeof(void *)*prv_scope_list_len+64);
-        if (old) {
-            memcpy(prv_scope_list, old, sizeof(void *)*prv_scope_list_idx);
-            free(old);
+        int len = (prv_scope_list_len)?(2*prv_scope_list_len):64;
+        void **l = (void **)realloc(prv_scope_list, sizeof(void *)*len);
+        if (!l) {
+            PYHPI_LOG(PYHPI_LOG_ERROR, "failed to grow the scope list to %d entries", len);
+            PyGILState_Release(gil);
+            return -1;
         }
+        prv_scope_list = l;
+        prv_scope_list_len = len;
     }
     prv_scope_list[prv_scope_list_idx] = svGetScope();
     ret = prv_scope_list_idx;
     prv_scope_list_idx++;
+    
+    if (prv_rec_fp) {
+        uint32_t len = sizeof(pyhpi_shm_rec_t) + 
+            PYHPI_SHM_STRLEN(strlen(tname)) + PYHPI_SHM_STRLEN(strlen(iname));
+        uint8_t *p = pyhpi_rec_start(PYHPI_SHM_REGISTER, 0, ret, len);
+        pyhpi_shm_put_str(pyhpi_shm_put_str(p, tname), iname);
+        pyhpi_rec_commit(len);
+    }
+    
+    if (prv_shm) {
+        // The BFM instance is created by the testbench process
+        uint32_t len = sizeof(pyhpi_shm_rec_t) + 
+            PYHPI_SHM_STRLEN(strlen(tname)) + PYHPI_SHM_STRLEN(strlen(iname));
+        pyhpi_shm_rec_t *rec = (pyhpi_shm_rec_t *)pyhpi_shm_reserve(len);
+        if (rec) {
+            rec->len = len;
+            rec->kind = PYHPI_SHM_REGISTER;
+            rec->tf = 0;
+            rec->id = ret;
+            pyhpi_shm_put_str(pyhpi_shm_put_str((uint8_t *)&rec[1], tname), iname);
+            pyhpi_shm_commit(len);
+        }
+        PyGILState_Release(gil);
+        return ret;
+    }
 
     // Call Python side to create and register the BFM instance
-    if (!(hpi = PyImport_ImportModule("hpi"))) {
-        fprintf(stdout, "Error: failed to import module 'hpi'\\n");
-        return -1;
+    if (!prv_register_bfm) {
+        if (!prv_hpi && !(prv_hpi = PyImport_ImportModule("hpi"))) {
+            PyErr_Print();
+            PYHPI_LOG(PYHPI_LOG_ERROR, "failed to import module 'hpi'");
+            PyGILState_Release(gil);
+            return -1;
+        }
+        if (!prv_bfm_list) {
+            prv_bfm_list = PyObject_GetAttrString(prv_hpi, "bfm_list");
+        }
+        if (!(prv_register_bfm = PyObject_GetAttrString(prv_hpi, "register_bfm"))) {
+            PyErr_Print();
+            PyGILState_Release(gil);
+            return -1;
+        }
     }
-    reg_func = PyObject_GetAttrString(hpi, "register_bfm");
-    PyObject_CallFunctionObjArgs(reg_func, 
-        PyUnicode_FromString(tname),
-        PyUnicode_FromString(iname), 
-        PyLong_FromLong(ret),
-        0);
+    
+    if (prv_bulk_register) {
+        if (!prv_register_q) {
+            prv_register_q = PyList_New(0);
+        }
+        result = Py_BuildValue("(ssi)", tname, iname, ret);
+        if (!result || PyList_Append(prv_register_q, result) != 0) {
+            PyErr_Print();
+        }
+        Py_XDECREF(result);
+    } else {
+        result = PyObject_CallFunction(prv_register_bfm, "ssi", tname, iname, ret);
+        if (!result) {
+            PyErr_Print();
+        }
+        Py_XDECREF(result);
+    }
+    PyGILState_Release(gil);
     
     return ret;
 }
@@ -203,6 +1016,24 @@ typemap = {
     "s": "const char *"
     }
 
+# Index of each task in the generated profile table
+prv_prof_idx = {}
+
+def gen_prof_entries():
+    ret = ""
+    prv_prof_idx.clear()
+
+    tf_l = [tf for tf in hpi.rgy.tf_global_list if tf.is_imp]
+    for bfm_name in hpi.rgy.bfm_type_map.keys():
+        tf_l.extend(hpi.rgy.bfm_type_map[bfm_name].tf_list)
+
+    for tf in tf_l:
+        prv_prof_idx[tf] = len(prv_prof_idx)
+        ret += "    {\"" + tf.tf_name() + "\", \"" 
+        ret += ("import" if tf.is_imp else "export") + "\", 0, 0},\n"
+
+    return ret
+
 def gen_c_paramlist(params):
     ret = ""
     
@@ -271,7 +1102,6 @@ def gen_hpi_method_table_entries():
 
     # Now, generate BFM-specific methods
     for bfm_name in hpi.rgy.bfm_type_map.keys():
-        print("bfm: " + bfm_name)
         info = hpi.rgy.bfm_type_map[bfm_name]
         for tf in info.tf_list:
             if tf.is_imp == False:
@@ -282,7 +1112,6 @@ def gen_hpi_method_table_entries():
 def gen_py_paramlist(params):
     ret = ""
     for p in params:
-        print("param: " + p.pname)
         if p.ptype == 's':
             ret += "PyUnicode_FromString(" + p.pname + "), "
         else:
@@ -301,25 +1130,107 @@ def gen_py_paramlist(params):
 
     return ret
     
+#********************************************************************
+#* gen_pack_args()
+#*
+#* Generates code that writes a call record using <start> and <commit>.
+#* Integer arguments are written as 64-bit values, and strings as a 
+#* 32-bit length followed by the characters
+#********************************************************************
+def gen_pack_args(tf : tf_decl, id : str, start : str, commit : str):
+    ret = "        uint32_t len = PYHPI_SHM_ALIGN(sizeof(pyhpi_shm_rec_t)"
+    n_int = len([p for p in tf.params if p.ptype != 's'])
+    if n_int != 0:
+        ret += " + " + str(8*n_int)
+    for p in tf.params:
+        if p.ptype == 's':
+            ret += " + PYHPI_SHM_STRLEN(strlen(" + p.pname + "))"
+    ret += ");\n"
+    ret += "        uint8_t *p = " + start + "(" + str(prv_prof_idx[tf]) + ", " + id + ", len);\n"
+    ret += "        if (p) {\n"
+    for p in tf.params:
+        if p.ptype == 's':
+            ret += "            p = pyhpi_shm_put_str(p, " + p.pname + ");\n"
+        else:
+            ret += "            *(int64_t *)p = (int64_t)" + p.pname + "; p += 8;\n"
+    ret += "            " + commit + "(len);\n"
+    ret += "        }\n"
+    return ret
+
+# Generates the code that records (+hpi.record) and, with an 
+# out-of-process testbench (+hpi.shm), posts an import call 
+def gen_shm_import(tf : tf_decl, id : str):
+    ret = "    if (prv_rec_fp) {\n"
+    ret += gen_pack_args(tf, id, "pyhpi_rec_import_start", "pyhpi_rec_commit")
+    ret += "    }\n"
+    ret += "    if (prv_shm) {\n"
+    ret += gen_pack_args(tf, id, "pyhpi_shm_import_start", "pyhpi_shm_commit")
+    ret += "        return 0;\n"
+    ret += "    }\n"
+    return ret
+
+def gen_shm_export_switch():
+    ret = content("    ")
+    
+    ret.println("switch (tf) {")
+    ret.inc_ind()
+    for bfm_name in hpi.rgy.bfm_type_map.keys():
+        info = hpi.rgy.bfm_type_map[bfm_name]
+        for tf in info.tf_list:
+            if not tf.is_imp:
+                ret.println("case " + str(prv_prof_idx[tf]) + ": { // TF " + tf.tf_name())
+                ret.inc_ind()
+                for p in tf.params:
+                    if p.ptype == 's':
+                        ret.println("const char *" + p.pname + " = (const char *)(p+4);")
+                        ret.println("p += PYHPI_SHM_STRLEN(*(uint32_t *)p);")
+                    else:
+                        ret.println(typemap[p.ptype] + " " + p.pname + 
+                                    " = (" + typemap[p.ptype] + ")*(int64_t *)p; p += 8;")
+                ret.println("PYHPI_PROF_START();")
+                ret.append(ret.ind + tf.tf_name() + "(")
+                ret.append(", ".join([p.pname for p in tf.params]))
+                ret.append(");\n")
+                ret.println("PYHPI_PROF_END(" + str(prv_prof_idx[tf]) + ");")
+                ret.dec_ind()
+                ret.println("} break;")
+    ret.println("default:")
+    ret.inc_ind()
+    ret.println("PYHPI_LOG(PYHPI_LOG_ERROR, \"unknown export-task index %d\", tf);")
+    ret.println("break;")
+    ret.dec_ind()
+    ret.dec_ind()
+    ret.println("}")
+    
+    return ret()
+    
 def gen_dpi_global_imp_tf_impl(tf : tf_decl):
     ret = gen_c_ret_type(tf.rtype)
     
     ret += tf.tf_name() + "(" + gen_c_paramlist(tf.params) + ") {\n"
     ret += "    PyObject *module, *call_ret, *f;\n"
+    ret += gen_shm_import(tf, "-1")
+    ret += "    PyGILState_STATE gil = pyhpi_gil_ensure();\n"
     ret += "    module = PyImport_ImportModule(\"" + tf.module + "\");\n"
     ret += "    if (!module) {\n"
-    ret += "        fprintf(stdout, \"Error: failed to import module " + tf.module + "\\n\");\n"
+    ret += "        PYHPI_LOG(PYHPI_LOG_ERROR, \"failed to import module " + tf.module + "\");\n"
+    ret += "        PyGILState_Release(gil);\n"
     ret += "        return 0;\n"
     ret += "    }\n"
     ret += "    f = PyObject_GetAttrString(module, \"" + tf.tf_name() + "\");\n";
     ret += "    if (!f) {\n"
-    ret += "        fprintf(stdout, \"Error: failed to find function " + tf.tf_name() + "\\n\");\n"
+    ret += "        PYHPI_LOG(PYHPI_LOG_ERROR, \"failed to find function " + tf.tf_name() + "\");\n"
+    ret += "        Py_DECREF(module);\n"
+    ret += "        PyGILState_Release(gil);\n"
     ret += "        return 0;\n"
     ret += "    }\n"
+    ret += "    PYHPI_PROF_START();\n"
     ret += "    call_ret = PyObject_CallFunctionObjArgs(f, " + gen_py_paramlist(tf.params) + "0);\n"
+    ret += "    PYHPI_PROF_END(" + str(prv_prof_idx[tf]) + ");\n"
     # TODO: detect a DPI exception and return '1'
     ret += "    Py_DECREF(f);\n"
     ret += "    Py_DECREF(module);\n"
+    ret += "    PyGILState_Release(gil);\n"
    
     ret += "    return 0;\n"
     ret += "}\n"
@@ -344,11 +1255,25 @@ def gen_dpi_bfm_imp_tf_impl(tf : tf_decl):
     else:
         ret += tf.tf_name() + "(int id) {\n"
 
+    ret += gen_shm_import(tf, "id")
+    ret += "    PyGILState_STATE gil = pyhpi_gil_ensure();\n"
+    ret += "    PYHPI_PROF_START();\n"
     ret += "    if (!prv_hpi) {\n"
     ret += "        prv_hpi = PyImport_ImportModule(\"hpi\");\n";
     ret += "        prv_bfm_list = PyObject_GetAttrString(prv_hpi, \"bfm_list\");\n"
     ret += "    }\n"
     ret += "    PyObject *bfm = PyList_GetItem(prv_bfm_list, id);\n"
+    ret += "    if ((!bfm || bfm == Py_None) && prv_register_q) {\n"
+    ret += "        PyErr_Clear();\n"
+    ret += "        pyhpi_flush_registrations();\n"
+    ret += "        bfm = PyList_GetItem(prv_bfm_list, id);\n"
+    ret += "    }\n"
+    ret += "    if (!bfm || bfm == Py_None) {\n"
+    ret += "        PyErr_Clear();\n"
+    ret += "        PYHPI_LOG(PYHPI_LOG_ERROR, \"no BFM registered with id %d (" + tf.tf_name() + ")\", id);\n"
+    ret += "        PyGILState_Release(gil);\n"
+    ret += "        return 0;\n"
+    ret += "    }\n"
 #    ret += "    PyObject *yield = PyObject_GetAttrString(hpi, \"int_thread_yield\");\n"
     ret += "    // TODO: pass arguments\n"
     ret += "    PyObject *result = PyObject_CallMethodObjArgs(bfm, PyUnicode_FromString(\"" + tf.fname + "\"), ";
@@ -357,6 +1282,8 @@ def gen_dpi_bfm_imp_tf_impl(tf : tf_decl):
     ret += "    if (!result) {\n"
     ret += "        PyErr_Print();\n"
     ret += "    }\n"
+    ret += "    PYHPI_PROF_END(" + str(prv_prof_idx[tf]) + ");\n"
+    ret += "    PyGILState_Release(gil);\n"
 #    ret += "    PyObject_CallFunctionObjArgs(yield, 0);\n"
 #    ret += "    Py_DECREF(hpi);\n";
     ret += "    return 0;\n"
@@ -425,18 +1352,22 @@ def gen_dpi_bfm_exp_tf_impl(tf : tf_decl):
 #    ret += "    fprintf(stdout, \"--> entry to " + tf.tf_name() + "\\n\");\n"
 #    ret += "    fflush(stdout);\n"
     
-    if len(tf.params) != 0:
-        for p in tf.params:
-            ret += "    " + gen_dpi_declare_param_var(p)
+    for p in tf.params:
+        ret += "    " + gen_dpi_declare_param_var(p)
 
-#        ret += "    fprintf(stdout, \"--> getting args to " + tf.tf_name() + "\\n\");\n";
-#        ret += "    fflush(stdout);\n"
-        ret += gen_py_argparse(tf.params)
+#    ret += "    fprintf(stdout, \"--> getting args to " + tf.tf_name() + "\\n\");\n";
+#    ret += "    fflush(stdout);\n"
+    # The context id is always the first argument
+    ret += gen_py_argparse(tf.params)
 #        ret += "    fprintf(stdout, \"--> getting args to " + tf.tf_name() + "\\n\");\n";
 #        ret += "    fflush(stdout);\n"
 
+    ret += "    if (prv_rec_fp) {\n"
+    ret += gen_pack_args(tf, "id", "pyhpi_rec_export_start", "pyhpi_rec_commit")
+    ret += "    }\n"
     # Set the DPI context
     ret += "    svSetScope(prv_scope_list[id]);\n"
+    ret += "    PYHPI_PROF_START();\n"
     # Finally, call the actual export
 #    ret += "    fprintf(stdout, \"--> calling " + tf.tf_name() + "\\n\");\n";
 #    ret += "    fflush(stdout);\n"
@@ -451,6 +1382,7 @@ def gen_dpi_bfm_exp_tf_impl(tf : tf_decl):
      
 #    ret += "    fprintf(stdout, \"<-- calling " + tf.tf_name() + "\\n\");\n";
 #    ret += "    fflush(stdout);\n"
+    ret += "    PYHPI_PROF_END(" + str(prv_prof_idx[tf]) + ");\n"
     ret += "    return PyLong_FromLong(0);\n"
     ret += "}\n"
     return ret
@@ -497,20 +1429,22 @@ def gen_export_trampoline_switch():
                     for p in tf.params:
                         ret.println(gen_dpi_declare_param_var(p))
                     gen_py_argparse_c(ret, tf.params)
+                ret.println("PYHPI_PROF_START();")
                 if len(tf.params) == 0:
                     ret.println(tf.tf_name() + "();")
                 else:
                     ret.append(ret.ind + tf.tf_name() + "(")
                     for p in tf.params:
                         ret.append(p.pname + ", ")
-                        ret.trunc(2)# = ret[:len(ret)-2]
-                        ret.append(");\n")
+                    ret.trunc(2)# = ret[:len(ret)-2]
+                    ret.append(");\n")
+                ret.println("PYHPI_PROF_END(" + str(prv_prof_idx[tf]) + ");")
                         
                 ret.dec_ind()
                 ret.println("} break;")
         ret.println("default:")
         ret.inc_ind()
-        ret.println("fprintf(stdout, \"Error: unknown TF id %d in BFM %d\\n\", tf_id, bfm_id);")
+        ret.println("PYHPI_LOG(PYHPI_LOG_ERROR, \"unknown TF id %d in BFM %d\", tf_id, bfm_id);")
         ret.println("break;")
         ret.dec_ind()
         ret.dec_ind()
@@ -520,7 +1454,7 @@ def gen_export_trampoline_switch():
       
     ret.println("default:")
     ret.inc_ind()
-    ret.println("fprintf(stdout, \"Error: unknown BFM ID %d\\n\", bfm_id);")
+    ret.println("PYHPI_LOG(PYHPI_LOG_ERROR, \"unknown BFM ID %d\", bfm_id);")
     ret.println("break;")
     ret.dec_ind()
     ret.println("}")
@@ -539,17 +1473,26 @@ def gen_dpi(args):
             print("loading " + str(m))
             __import__(m)        
 
+    fh = open(args.o, "w")
+    fh.write(gen_dpi_text(os.path.basename(args.o)))
+    fh.close()
+
+#********************************************************************
+#* gen_dpi_text()
+#*
+#* Returns the DPI interface for the registered BFMs and tasks
+#********************************************************************
+def gen_dpi_text(filename : str) -> str:
     template_params = {}
-    template_params['filename'] = os.path.basename(args.o)
+    template_params['filename'] = filename
+    template_params['prof_entries'] = gen_prof_entries()
     template_params['dpi_prototypes'] = gen_dpi_prototypes()
     template_params['hpi_method_table_entries'] = gen_hpi_method_table_entries()
     template_params['dpi_tf_impl'] = gen_dpi_tf_impl()
     template_params['command'] = "TODO"
     template_params['export_trampoline_switch'] = gen_export_trampoline_switch()
+    template_params['shm_export_switch'] = gen_shm_export_switch()
     
-    fh = open(args.o, "w")
     template = Template(pyhpi_dpi_template)
-    fh.write(template.substitute(template_params))
-    
-    fh.close()
+    return template.substitute(template_params)
     
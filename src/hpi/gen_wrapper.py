@@ -6,48 +6,69 @@ Created on May 31, 2019
 
 from hpi.rgy import bfm_type_map, bfm_wrapper_type
 
+# Output file suffix of each wrapper type
+wrapper_suffix = {
+    "sv-dpi" : ".sv",
+    "vl-vpi" : ".v"
+    }
+
 #********************************************************************
-#* gen_bfm_wrapper()
+#* wrapper_text()
 #*
-#* Generates a wrapper for a pyHPI BFM from a template registered
-#* with the Python BFM class
+#* Returns the text of the <wtype> wrapper for BFM type <tname>, 
+#* from the template registered with the Python BFM class
 #********************************************************************
-def gen_bfm_wrapper(args):
-    
-    # Load up modules that contain DPI tasks
-    if args.m != None:
-        print("loading modules")
-        for m in args.m:
-            print("loading " + str(m))
-            __import__(m)    
-    
-    if args.bfm not in bfm_type_map.keys():
-        raise Exception("BFM \"" + args.bfm + "\" is not registered")
+def wrapper_text(tname : str, wtype : str) -> str:
+    if tname not in bfm_type_map.keys():
+        raise Exception("BFM \"" + tname + "\" is not registered")
 
-    bfm = bfm_type_map[args.bfm]
+    bfm = bfm_type_map[tname]
     
     if hasattr(bfm.cls, "bfm_wrappers") == False:
-        raise Exception("BFM \"" + args.bfm + "\" doesn't contain a 'bfm_wrappers' map")
+        raise Exception("BFM \"" + tname + "\" doesn't contain a 'bfm_wrappers' map")
     
     bfm_wrappers = getattr(bfm.cls, "bfm_wrappers")
 
-    if args.type == 'sv-dpi':
+    if wtype == 'sv-dpi':
         bfm_type = bfm_wrapper_type.SV_DPI
-        if args.o == None:
-            args.o = args.bfm + ".sv"
-    elif args.type == 'vl-vpi':
+    elif wtype == 'vl-vpi':
         bfm_type = bfm_wrapper_type.VL_VPI
-        if args.o == None:
-            args.o = args.bfm + ".v"
 
     if bfm_type not in bfm_wrappers.keys():
-        raise Exception("BFM \"" + args.bfm + "\" does not support wrapper \"" + args.type + "\"")
+        raise Exception("BFM \"" + tname + "\" does not support wrapper \"" + wtype + "\"")
 
     wrapper_t = bfm_wrappers[bfm_type]
     
     if callable(wrapper_t):
         # If the wrapper object is callable, assume the string comes from calling it
         wrapper_t = wrapper_t()
+    return wrapper_t
+
+# Returns True if BFM type <tname> has a <wtype> wrapper template
+def has_wrapper(tname : str, wtype : str) -> bool:
+    bfm_wrappers = getattr(bfm_type_map[tname].cls, "bfm_wrappers", {})
+    if wtype == 'sv-dpi':
+        return bfm_wrapper_type.SV_DPI in bfm_wrappers.keys()
+    return bfm_wrapper_type.VL_VPI in bfm_wrappers.keys()
+
+#********************************************************************
+#* gen_bfm_wrapper()
+#*
+#* Generates a wrapper for a pyHPI BFM from a template registered
+#* with the Python BFM class
+#********************************************************************
+def gen_bfm_wrapper(args):
+    
+    # Load up modules that contain DPI tasks
+    if args.m != None:
+        print("loading modules")
+        for m in args.m:
+            print("loading " + str(m))
+            __import__(m)    
+
+    wrapper_t = wrapper_text(args.bfm, args.type)
+    if args.o == None:
+        args.o = args.bfm + wrapper_suffix[args.type]
 
     with open(args.o, "w") as f:
         f.write(wrapper_t)
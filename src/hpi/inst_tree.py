@@ -0,0 +1,77 @@
+#****************************************************************************
+#* inst_tree.py
+#*
+#* Tree of BFM instances, keyed by the components of their hierarchical
+#* path. Supports wildcard queries, such as 'top.u_cluster3.**'
+#****************************************************************************
+from fnmatch import fnmatchcase
+
+class inst_tree_node():
+    __slots__ = ('children', 'inst')
+
+    def __init__(self):
+        self.children = {}
+        self.inst = None
+
+class inst_tree():
+
+    def __init__(self):
+        self.root = inst_tree_node()
+
+    def insert(self, path : str, inst):
+        node = self.root
+        for name in path.split('.'):
+            if name not in node.children.keys():
+                node.children[name] = inst_tree_node()
+            node = node.children[name]
+        node.inst = inst
+
+    def get(self, path : str):
+        node = self.root
+        for name in path.split('.'):
+            if name not in node.children.keys():
+                return None
+            node = node.children[name]
+        return node.inst
+
+    #****************************************************************
+    #* find()
+    #*
+    #* Returns instances whose path matches <pattern>. Each component
+    #* of the pattern matches one level of hierarchy, and may contain
+    #* shell-style wildcards ('*', '?', '[seq]'). A '**' component
+    #* matches zero or more levels. A component that names a child 
+    #* exactly (eg 'gen[3]', a generate or array scope) matches only
+    #* that child. Components without wildcards are looked up 
+    #* directly, so queries rooted at a known scope only visit that
+    #* scope's subtree
+    #****************************************************************
+    def find(self, pattern : str) -> []:
+        ret = []
+        self._find(self.root, pattern.split('.'), 0, ret)
+        
+        if "**" in pattern:
+            # Multiple '**' components may reach an instance more than once
+            seen = set()
+            ret = [i for i in ret if not (id(i) in seen or seen.add(id(i)))]
+        return ret
+
+    def _find(self, node, pattern, i, ret):
+        if i == len(pattern):
+            if node.inst != None:
+                ret.append(node.inst)
+            return
+
+        name = pattern[i]
+        if name == "**":
+            # Zero levels
+            self._find(node, pattern, i+1, ret)
+            # One or more levels
+            for c in node.children.values():
+                self._find(c, pattern, i, ret)
+        elif name in node.children.keys():
+            self._find(node.children[name], pattern, i+1, ret)
+        elif '*' in name or '?' in name or '[' in name:
+            for cname,c in node.children.items():
+                if fnmatchcase(cname, name):
+                    self._find(c, pattern, i+1, ret)
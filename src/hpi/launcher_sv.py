@@ -20,22 +20,161 @@ int pyhpi_init();
 void pyhpi_launcher_init();
 void *svGetScope(void);
 void svSetScope(void *);
+void *svGetScopeFromName(const char *);
 int acc_fetch_argc(void);
 char **acc_fetch_argv(void);
 int pyhpi_sv_launcher_main(void);
+extern int pyhpi_log_level;
+
+// Functions exported by the pyhpi_sv module
+long long pyhpi_sv_get_simtime(void);
+void pyhpi_sv_finish(void);
+void pyhpi_sv_set_timeout(long long t);
+void pyhpi_sv_trace(int on);
+void pyhpi_log(int level, const char *fmt, ...);
+
+// Message levels, set from the Python side with +hpi.verbosity
+#define PYHPI_LOG_NONE  0
+#define PYHPI_LOG_ERROR 1
+#define PYHPI_LOG_WARN  2
+#define PYHPI_LOG_INFO  3
+#define PYHPI_LOG_DEBUG 4
+#define PYHPI_LOG(level, ...) \\
+    do { if ((level) <= pyhpi_log_level) { pyhpi_log(level, __VA_ARGS__); } } while (0)
 
 static unsigned int                    prv_initialized = 0;
 static void                            *prv_pkg_scope = 0;
+static int                             prv_timeout_pending = 0;
+static long long                       prv_timeout = 0;
 static PyObject                        *prv_args;
 static PyObject                        *prv_hpi;
 
 static PyObject *launcher_init(PyObject *self, PyObject *args) {
-    fprintf(stdout, "--> launcher_init\\n");
-    fprintf(stdout, "<-- launcher_init\\n");
+    PYHPI_LOG(PYHPI_LOG_DEBUG, "--> launcher_init");
+    PYHPI_LOG(PYHPI_LOG_DEBUG, "<-- launcher_init");
+    Py_RETURN_NONE;
+}
+
+/********************************************************************
+ * pkg_scope()
+ *
+ * Returns the scope of the pyhpi_sv module. BFMs may register, and 
+ * so initialize Python, before pyhpi_sv_launcher_init() records the
+ * scope, so the scope is otherwise looked up by name. Returns 0 if
+ * it is not yet known
+ ********************************************************************/
+static void *pkg_scope(void) {
+    if (!prv_pkg_scope) {
+        prv_pkg_scope = svGetScopeFromName("pyhpi_sv");
+    }
+    return prv_pkg_scope;
+}
+
+/********************************************************************
+ * get_simtime()
+ *
+ * Returns the current simulation time (ps) to the Python side. The
+ * SV functions called here are exported from the pyhpi_sv module, 
+ * so are called in its scope. Python may be running inside an import
+ * task called from a BFM, so the caller's scope is restored after
+ ********************************************************************/
+static PyObject *get_simtime(PyObject *self, PyObject *args) {
+    void *scope = svGetScope();
+    long long t;
+    
+    if (!pkg_scope()) {
+        // Only possible during time-0 initialization
+        return PyFloat_FromDouble(0.0);
+    }
+    svSetScope(prv_pkg_scope);
+    t = pyhpi_sv_get_simtime();
+    svSetScope(scope);
+    
+    return PyFloat_FromDouble((double)t);
+}
+
+/********************************************************************
+ * finish()
+ *
+ * Called from the Python side to terminate the simulation ($finish)
+ ********************************************************************/
+static PyObject *finish(PyObject *self, PyObject *args) {
+    void *scope = svGetScope();
+    
+    if (!pkg_scope()) {
+        PYHPI_LOG(PYHPI_LOG_ERROR, "finish called before the pyhpi_sv module initialized");
+        Py_RETURN_NONE;
+    }
+    svSetScope(prv_pkg_scope);
+    pyhpi_sv_finish();
+    svSetScope(scope);
+    
+    Py_RETURN_NONE;
+}
+
+/********************************************************************
+ * set_timeout()
+ *
+ * Called from the Python side to end the simulation once simulation
+ * time (ps) reaches the specified time. A time of 0 disables the 
+ * timeout. A timeout set before the pyhpi_sv module is initialized
+ * is applied by pyhpi_sv_launcher_init()
+ ********************************************************************/
+static PyObject *set_timeout(PyObject *self, PyObject *args) {
+    void *scope = svGetScope();
+    unsigned long long t;
+    
+    if (!PyArg_ParseTuple(args, "K", &t)) {
+        return 0;
+    }
+    
+    if (!pkg_scope()) {
+        prv_timeout = (long long)t;
+        prv_timeout_pending = 1;
+        Py_RETURN_NONE;
+    }
+    svSetScope(prv_pkg_scope);
+    pyhpi_sv_set_timeout((long long)t);
+    svSetScope(scope);
+    
+    Py_RETURN_NONE;
+}
+
+static PyObject *trace(int on) {
+    void *scope = svGetScope();
+    
+    if (!pkg_scope()) {
+        PYHPI_LOG(PYHPI_LOG_ERROR, "trace control called before the pyhpi_sv module initialized");
+        Py_RETURN_NONE;
+    }
+    svSetScope(prv_pkg_scope);
+    pyhpi_sv_trace(on);
+    svSetScope(scope);
+    
+    Py_RETURN_NONE;
+}
+
+/********************************************************************
+ * trace_on() / trace_off()
+ *
+ * Called from the Python side to resume/suspend VCD dumping 
+ * ($dumpon/$dumpoff)
+ ********************************************************************/
+static PyObject *trace_on(PyObject *self, PyObject *args) {
+    return trace(1);
+}
+
+static PyObject *trace_off(PyObject *self, PyObject *args) {
+    return trace(0);
 }
     
 static PyMethodDef hpi_l_methods[] = {
     {"init", &launcher_init, METH_VARARGS, ""},
+    {"get_simtime", &get_simtime, METH_VARARGS, ""},
+    {"finish", &finish, METH_VARARGS, ""},
+    {"set_timeout", &set_timeout, METH_VARARGS, ""},
+    {"trace_on", &trace_on, METH_VARARGS, ""},
+    {"trace_off", &trace_off, METH_VARARGS, ""},
     { 0, 0, 0, 0}
 };
 
@@ -62,36 +201,35 @@ void pyhpi_launcher_init() {
         return;
     }
     
-    fprintf(stdout, "TODO: pyhpi_launcher_init()\\n");
-    // Capture all arguments
+    // Register the HPI module with Python
+    // TODO: support a callback to signal activity (?)
+    pyhpi_init();
+   
+    // Register the 'hpi_l' module. Must be done before 
+    // the interpreter is initialized
+    PyImport_AppendInittab("hpi_l", PyInit_hpi_l);
+    
+    Py_Initialize();
+    
+    // Capture all arguments. Python objects can only be 
+    // created once the interpreter is initialized
     prv_args = PyList_New(0);
     {
       int argc = acc_fetch_argc();
       char **argv = acc_fetch_argv();
       int i;
-      for (i=0; i<argc; i++) {
-          PyList_Append(prv_args, PyUnicode_FromString(argv[i]));
+      for (i=1; i<argc; i++) {
+          PyObject *arg = PyUnicode_FromString(argv[i]);
+          PyList_Append(prv_args, arg);
+          Py_DECREF(arg);
       }
     }
-    
-    // Register the HPI module with Python
-    // TODO: support a callback to signal activity (?)
-    pyhpi_init();
-   
-    // Register the 'hpi_l' module
-//    PyImport_AppendInittab("hpi_l", PyInit_hpi_l);
-    
-    // TODO: register launcher namespace methods to use for
-    // - getting simulation time
-    // - yielding to the simulation
-    
-    Py_Initialize();
    
     // TODO: perform some sort of initialization to ensure
     // BFMS are registered before running the testbench
     prv_hpi = PyImport_ImportModule("hpi");
     if (!prv_hpi) {
-        fprintf(stdout, "Error: failed to import 'hpi' package\\n");
+        PYHPI_LOG(PYHPI_LOG_ERROR, "failed to import 'hpi' package");
         return;
     }
 
@@ -100,7 +238,8 @@ void pyhpi_launcher_init() {
         prv_args, 0);
         
     if (!ret) {
-        fprintf(stdout, "Error calling tb_init\\n");
+        PYHPI_LOG(PYHPI_LOG_ERROR, "failed to call tb_init");
+        PyErr_Print();
     }
     
     prv_initialized = 1;
@@ -111,17 +250,30 @@ int pyhpi_sv_launcher_main(void) {
     PyObject *ret = PyObject_CallFunctionObjArgs(
         PyObject_GetAttrString(prv_hpi, "tb_main"), 0);
     if (!ret) {
-        fprintf(stdout, "Error calling tb_main\\n");
+        PYHPI_LOG(PYHPI_LOG_ERROR, "failed to call tb_main");
         PyErr_Print();
     }
     return 0;
 }
 
+void pyhpi_sv_launcher_fini(void) {
+    PyObject *ret = PyObject_CallMethod(prv_hpi, "tb_fini", 0);
+    if (!ret) {
+        PYHPI_LOG(PYHPI_LOG_ERROR, "failed to call tb_fini");
+        PyErr_Print();
+    }
+}
+
 int pyhpi_sv_launcher_init(void) {
-    fprintf(stdout, "--> pyhpi_sv_launcher_init()\\n");
+    PYHPI_LOG(PYHPI_LOG_DEBUG, "--> pyhpi_sv_launcher_init()");
     prv_pkg_scope = svGetScope();
     pyhpi_launcher_init();
-    fprintf(stdout, "<-- pyhpi_sv_launcher_init()\\n");
+    if (prv_timeout_pending) {
+        // Called from pyhpi_sv, so already in its scope
+        pyhpi_sv_set_timeout(prv_timeout);
+        prv_timeout_pending = 0;
+    }
+    PYHPI_LOG(PYHPI_LOG_DEBUG, "<-- pyhpi_sv_launcher_init()");
   return 1;
 }
 
@@ -129,19 +281,84 @@ int pyhpi_sv_launcher_init(void) {
 
 dpi_sv = '''
 module pyhpi_sv;
+    // Times exchanged with the Python side are in ps
+    timeunit 1ps;
+    timeprecision 1ps;
    
     import "DPI-C" context task pyhpi_sv_launcher_main();
+    
+    // Launch the testbench once all time-0 activity has settled. BFMs
+    // register from initial blocks, so all BFMs that register at time 0
+    // (including after #0 delays) have registered by the time the 
+    // nonblocking update of 'launch' occurs
+    bit launch = 0;
     initial begin
-        $display("--> initial");
-        repeat (100) begin
-            #0;
-        end
-        $display("<-- initial");
+        launch <= 1;
+        @(launch);
         pyhpi_sv_launcher_main();
     end
+    
+    export "DPI-C" function pyhpi_sv_get_simtime;
+    function longint pyhpi_sv_get_simtime();
+        return $time;
+    endfunction
+    
+    export "DPI-C" function pyhpi_sv_finish;
+    function void pyhpi_sv_finish();
+        $finish;
+    endfunction
+    
+    export "DPI-C" function pyhpi_sv_trace;
+    function void pyhpi_sv_trace(int on);
+        if (on) begin
+            $dumpon;
+        end else begin
+            $dumpoff;
+        end
+    endfunction
+    
+    // Timeout (absolute time, ps) set by the Python side. 0 disables
+    longint timeout = 0;
+    event timeout_ev;
+    
+    export "DPI-C" function pyhpi_sv_set_timeout;
+    function void pyhpi_sv_set_timeout(longint t);
+        timeout = t;
+        -> timeout_ev;
+    endfunction
+    
+    initial begin
+        forever begin
+            if (timeout == 0) begin
+                @(timeout_ev);
+            end else begin
+                fork
+                    if (timeout > $time) begin
+                        #(timeout - $time);
+                    end
+                    @(timeout_ev);
+                join_any
+                disable fork;
+                if (timeout != 0 && $time >= timeout) begin
+                    $display("Note: timeout reached at %0t", $time);
+                    $finish;
+                    @(timeout_ev);
+                end
+            end
+        end
+    end
 
+    // Initialization calls into Python, so is done from an initial
+    // block rather than a variable initializer
     import "DPI-C" context function int pyhpi_sv_launcher_init();
-    int init = pyhpi_sv_launcher_init();
+    initial begin
+        void'(pyhpi_sv_launcher_init());
+    end
+
+    import "DPI-C" context function void pyhpi_sv_launcher_fini();
+    final begin
+        pyhpi_sv_launcher_fini();
+    end
     
 endmodule
 '''
@@ -12,26 +12,56 @@ launcher = '''
  ****************************************************************************/
 #include <stdint.h>
 #include <stdio.h>
+#include <time.h>
 #include "Python.h"
 #include "V${top}.h"
+${threads_define}
 #ifdef VM_TRACE
 ${trace_headers}
 #endif
+#ifdef VM_COVERAGE
+#include "verilated_cov.h"
+#endif
 #include <map>
 #include <vector>
 #include <string>
 extern "C" int pyhpi_init();
 extern "C" void pyhpi_launcher_init();
+extern "C" int pyhpi_log_level;
+extern "C" void pyhpi_log(int level, const char *fmt, ...);
+extern "C" int pyhpi_shm_enabled(void);
+extern "C" void pyhpi_settime(uint64_t t);
+extern "C" int pyhpi_shm_sync(void);
+
+// Message levels, set from the Python side with +hpi.verbosity
+#define PYHPI_LOG_NONE  0
+#define PYHPI_LOG_ERROR 1
+#define PYHPI_LOG_WARN  2
+#define PYHPI_LOG_INFO  3
+#define PYHPI_LOG_DEBUG 4
+#define PYHPI_LOG(level, ...) \\
+    do { if ((level) <= pyhpi_log_level) { pyhpi_log(level, __VA_ARGS__); } } while (0)
 
 static V${top}                       *prv_top = 0;
 static bool                          prv_initialized = false;
+static int                           prv_argc = 0;
+static char                          **prv_argv = 0;
 static PyObject                      *prv_args;
 static PyObject                      *prv_hpi;
 static uint64_t                      prv_simtime = 0;
+static uint64_t                      prv_cycles = 0;
 static uint64_t                      prv_timeout = 1000000000000/1000; // 1ms
-static bool                          prv_keep_running = true;
+static volatile bool                 prv_keep_running = true;
+static bool                          prv_prof_en = false;
+static bool                          prv_shm = false;
+static uint64_t                      prv_prof_eval_count = 0;
+static uint64_t                      prv_prof_eval_time = 0;
 #ifdef VM_TRACE
 ${trace_fields}
+static volatile bool                 prv_trace_en = true;
+static uint64_t                      prv_trace_start = 0;
+static uint64_t                      prv_trace_stop = UINT64_MAX;
+static uint64_t                      prv_trace_next = 0;
 #endif
 
 /********************************************************************
@@ -53,9 +83,88 @@ static PyObject *finish(PyObject *self, PyObject *args) {
   return PyLong_FromLong(0);
 }
 
+/********************************************************************
+ * set_timeout()
+ *
+ * Called from the Python side to set the simulation time (ps) at 
+ * which simulation ends
+ ********************************************************************/
+static PyObject *set_timeout(PyObject *self, PyObject *args) {
+  unsigned long long t;
+  if (!PyArg_ParseTuple(args, "K", &t)) {
+    return 0;
+  }
+  prv_timeout = (t)?t:UINT64_MAX;
+  Py_RETURN_NONE;
+}
+
+/********************************************************************
+ * trace_on()
+ *
+ * Called from the Python side to resume waveform tracing
+ ********************************************************************/
+static PyObject *trace_on(PyObject *self, PyObject *args) {
+#ifdef VM_TRACE
+  prv_trace_en = true;
+#endif
+  return PyLong_FromLong(0);
+}
+
+/********************************************************************
+ * trace_off()
+ *
+ * Called from the Python side to suspend waveform tracing. The
+ * trace is flushed, such that the traced window is available on disk
+ ********************************************************************/
+static PyObject *trace_off(PyObject *self, PyObject *args) {
+#ifdef VM_TRACE
+  if (prv_trace_o && prv_trace_en) {
+    prv_trace_o->flush();
+  }
+  prv_trace_en = false;
+#endif
+  return PyLong_FromLong(0);
+}
+
+static uint64_t prof_now() {
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return ((uint64_t)ts.tv_sec)*1000000000ULL + ts.tv_nsec;
+}
+
+/********************************************************************
+ * prof_enable()
+ *
+ * Called from the Python side to enable profiling of model evaluation
+ ********************************************************************/
+static PyObject *prof_enable(PyObject *self, PyObject *args) {
+  int en;
+  if (!PyArg_ParseTuple(args, "i", &en)) {
+    return 0;
+  }
+  prv_prof_en = (en != 0);
+  Py_RETURN_NONE;
+}
+
+/********************************************************************
+ * prof_data()
+ *
+ * Returns model-evaluation profile data to the Python side
+ ********************************************************************/
+static PyObject *prof_data(PyObject *self, PyObject *args) {
+  return Py_BuildValue("{s:K,s:K}",
+      "count", (unsigned long long)prv_prof_eval_count,
+      "time_ns", (unsigned long long)prv_prof_eval_time);
+}
+
 static PyMethodDef hpi_l_methods[] = {
     {"get_simtime", &get_simtime, METH_VARARGS, ""},
     {"finish", &finish, METH_VARARGS, ""},
+    {"set_timeout", &set_timeout, METH_VARARGS, ""},
+    {"trace_on", &trace_on, METH_VARARGS, ""},
+    {"trace_off", &trace_off, METH_VARARGS, ""},
+    {"prof_enable", &prof_enable, METH_VARARGS, ""},
+    {"prof_data", &prof_data, METH_VARARGS, ""},
     { 0, 0, 0, 0}
 };
 
@@ -92,13 +201,21 @@ void pyhpi_launcher_init() {
     // - yielding to the simulation
     
     Py_Initialize();
+    
+    // Capture all arguments. Python objects can only be 
+    // created once the interpreter is initialized
+    prv_args = PyList_New(0);
+    for (int i=1; i<prv_argc; i++) {
+        PyObject *arg = PyUnicode_FromString(prv_argv[i]);
+        PyList_Append(prv_args, arg);
+        Py_DECREF(arg);
+    }
    
     // TODO: perform some sort of initialization to ensure
     // BFMS are registered before running the testbench
     prv_hpi = PyImport_ImportModule("hpi");
     if (!prv_hpi) {
-        fprintf(stdout, "Error: failed to import 'hpi' package\\n");
-        fflush(stdout);
+        PYHPI_LOG(PYHPI_LOG_ERROR, "failed to import 'hpi' package");
         return;
     }
 
@@ -110,7 +227,7 @@ void pyhpi_launcher_init() {
         prv_args, 0);
         
     if (!ret) {
-        fprintf(stdout, "Error calling tb_init\\n");
+        PYHPI_LOG(PYHPI_LOG_ERROR, "failed to call tb_init");
         PyErr_Print();
     }
 
@@ -124,53 +241,150 @@ void pyhpi_launcher_init() {
 
 // TODO: clocking scheme
 
+/********************************************************************
+ * get_plusarg()
+ *
+ * Returns the value of a plusarg, the default value if the plusarg
+ * is specified without a value, or NULL if it is not specified
+ ********************************************************************/
+static const char *get_plusarg(const char *key, const char *dflt) {
+    PyObject *val = PyObject_CallMethod(prv_hpi, "get_plusarg", "ss", key, dflt);
+
+    if (!val) {
+        PyErr_Print();
+        return 0;
+    } else if (val == Py_None) {
+        Py_DECREF(val);
+        return 0;
+    }
+    // Note: the value is kept alive for the duration of the run
+    return PyUnicode_AsUTF8(val);
+}
+
+/********************************************************************
+ * get_plusarg_bool()
+ *
+ * Returns the value of a boolean plusarg, parsed as by the Python
+ * get_plusarg_bool() (eg +<key>=0/false/off disables the option)
+ ********************************************************************/
+static bool get_plusarg_bool(const char *key, bool dflt) {
+    PyObject *val = PyObject_CallMethod(prv_hpi, "get_plusarg_bool", "sO", 
+            key, (dflt)?Py_True:Py_False);
+    bool ret = dflt;
+
+    if (!val) {
+        PyErr_Print();
+        return dflt;
+    }
+    ret = (PyObject_IsTrue(val) == 1);
+    Py_DECREF(val);
+    return ret;
+}
+
 /********************************************************************
  * str2time()
  *
- * Convert a time-specification string to time in nS
+ * Convert a time-specification string to time in pS, the unit of
+ * prv_simtime
  ********************************************************************/
-static double str2time(const char *ts) {
+static uint64_t str2time(const char *ts) {
     double ret = 0.0;
     char *eptr;
     
-    if ((ret = strtod(ts, &eptr)) != 0.0) {
+    ret = strtod(ts, &eptr);
+    if (eptr != ts) {
       // Now, determine the units
       switch (tolower(*eptr)) {
           case 'p':
-              ret /= 1000;
+              ret *= 1.0;
               break;
               
           case 'n':
-              ret *= 1.0;
+              ret *= 1000;
               break;
               
           case 'u':
-              ret *= 1000;
+              ret *= 1000000;
               break;
               
           case 'm':
-              ret *= 1000000;
+              ret *= 1000000000;
               break;
               
           case 's':
-              ret *= 1000000000;
+              ret *= 1000000000000;
               break;
               
           default:
-              fprintf(stdout, "Error: unknown time-unit specifier \\"%s\\"\\n", eptr);
+              PYHPI_LOG(PYHPI_LOG_ERROR, "unknown time-unit specifier \\"%s\\"", eptr);
               ret = 0.0;
       }
     } else {
-        fprintf(stdout, "Error: failed to parse timeout specification \\"%s\\"\\n", ts);
+        PYHPI_LOG(PYHPI_LOG_ERROR, "failed to parse time specification \\"%s\\"", ts);
     }
     
-    return ret;
+    return (uint64_t)ret;
+}
+
+#ifdef VM_TRACE
+/********************************************************************
+ * trace_window()
+ *
+ * Called when simulation time reaches the next boundary of the
+ * trace window specified by +vl.trace.start / +vl.trace.stop
+ ********************************************************************/
+static void trace_window() {
+    if (prv_simtime >= prv_trace_stop) {
+        if (prv_trace_en) {
+            prv_trace_o->flush();
+        }
+        prv_trace_en = false;
+        prv_trace_next = UINT64_MAX;
+    } else {
+        prv_trace_en = true;
+        prv_trace_next = prv_trace_stop;
+    }
+}
+#endif
+
+static inline void eval_model_prof() {
+    if (prv_prof_en) {
+        uint64_t start = prof_now();
+        prv_top->eval();
+        prv_prof_eval_time += prof_now() - start;
+        prv_prof_eval_count++;
+    } else {
+        prv_top->eval();
+    }
 }
 
-static void dump() {
+static inline void eval_model() {
+    // Time stamps calls recorded (+hpi.record) or posted (+hpi.shm)
+    pyhpi_settime(prv_simtime);
+    if (prv_shm) {
+        // Calls posted to an out-of-process testbench (+hpi.shm) must 
+        // complete before time advances. The export calls they result 
+        // in are applied after the evaluation, so evaluate until no
+        // more are applied. Time waiting on the testbench is not
+        // counted as eval time
+        eval_model_prof();
+        while (pyhpi_shm_sync() != 0) {
+            eval_model_prof();
+        }
+    } else {
+        eval_model_prof();
+    }
+}
+
+static inline void dump() {
 #ifdef VM_TRACE
     if (prv_trace_o) {
-      prv_trace_o->dump(prv_simtime);
+      if (prv_simtime >= prv_trace_next) {
+        trace_window();
+      }
+      if (prv_trace_en) {
+        prv_trace_o->dump(prv_simtime);
+      }
     }
 #endif
 }
@@ -178,11 +392,14 @@ static void dump() {
 int main(int argc, char **argv) {
     bool started_tb = false;
     const char *trace_file = 0;
+#ifdef PYHPI_VL_THREADS
+    PyThreadState *main_ts;
+#endif
     // 1ms=0.001 - 3
     // 1ns = 0.000000001 - 9
     // 1.0
     // 1,000,000.0
-    fprintf(stdout, "Hello from launcher for Verilator ${top}\\n");
+    PYHPI_LOG(PYHPI_LOG_DEBUG, "Hello from launcher for Verilator ${top}");
     
     
     // First, check to see if a usage message is in order
@@ -197,85 +414,128 @@ int main(int argc, char **argv) {
         }
     }
 
-    // Capture all arguments
-    prv_args = PyList_New(0);
-    for (int i=1; i<argc; i++) {
-        PyList_Append(prv_args, PyUnicode_FromString(argv[i]));
-    }
-    
+    prv_argc = argc;
+    prv_argv = argv;
     pyhpi_launcher_init();
+    prv_shm = (pyhpi_shm_enabled() != 0);
 
     // Create top-level module
     prv_top = new V${top}();
 
-    fprintf(stdout, "--> get_plusarg\\n");
-    fflush(stdout);
-    PyObject *trace_plusarg = PyObject_CallFunctionObjArgs(
-        PyObject_GetAttrString(prv_hpi, "get_plusarg"),
-        PyUnicode_FromString("vl.trace"), 
-        PyUnicode_FromString("${default_trace_file}"), 0);
+    // A trace window implies tracing
+    const char *trace_start = get_plusarg("vl.trace.start", "0");
+    const char *trace_stop = get_plusarg("vl.trace.stop", 0);
+    const char *trace_depth = get_plusarg("vl.trace.depth", "${trace_depth}");
+    const char *trace_plusarg = get_plusarg("vl.trace", "${default_trace_file}");
 
-    fprintf(stdout, "trace_plusarg=%p\\n", trace_plusarg);
-    fflush(stdout);
-    if (trace_plusarg && trace_plusarg != Py_None) {
+    if (!trace_plusarg && (trace_start || trace_stop)) {
+        trace_plusarg = "${default_trace_file}";
+    }
+
+    if (trace_plusarg) {
 #ifdef VM_TRACE
-        trace_file = PyUnicode_AsUTF8(trace_plusarg);
+        trace_file = trace_plusarg;
+        if (trace_start) {
+            prv_trace_start = str2time(trace_start);
+        }
+        if (trace_stop) {
+            prv_trace_stop = str2time(trace_stop);
+        }
+        if (prv_trace_start == 0) {
+            prv_trace_en = true;
+            prv_trace_next = prv_trace_stop;
+        } else {
+            prv_trace_en = false;
+            prv_trace_next = prv_trace_start;
+        }
 #else
-        fprintf(stdout, "Warning: +vl.trace specified, but --trace not specified during compilation\\n");
+        PYHPI_LOG(PYHPI_LOG_WARN, "+vl.trace specified, but --trace not specified during compilation");
 #endif
-        fprintf(stdout, "trace_file=%s\\n", trace_file);
+        PYHPI_LOG(PYHPI_LOG_INFO, "trace_file=%s", trace_file);
     }
     
 #ifdef VM_TRACE
-${trace_init}
+    if (trace_file) {
+        Verilated::traceEverOn(true);  // Verilator must compute traced signals
+        prv_trace_o = new ${trace_class}();
+        prv_top->trace(prv_trace_o, trace_depth?atoi(trace_depth):${trace_depth});
+        prv_trace_o->open(trace_file);  // Open the dump file
+    }
 #endif
 
+#ifdef PYHPI_VL_THREADS
+    // Release the GIL while the model evaluates, so model threads
+    // only contend for it when they call into Python via DPI
+    main_ts = PyEval_SaveThread();
+#endif
 ${clocking_init}    
+#ifdef PYHPI_VL_THREADS
+    PyEval_RestoreThread(main_ts);
+#endif
     
     // Determine whether the user has specified a timeout
-    PyObject *timeout_plusarg = PyObject_CallFunctionObjArgs(
-        PyObject_GetAttrString(prv_hpi, "get_plusarg"),
-        PyUnicode_FromString("vl.timeout"), 0);
+    const char *timeout_plusarg = get_plusarg("vl.timeout", 0);
           
-    if (timeout_plusarg != Py_None) {
-        fprintf(stdout, "Note: parse timeout specification\\n");
-        prv_timeout = str2time(
-                PyBytes_AsString(PyUnicode_AsUTF8String(timeout_plusarg)));
+    if (timeout_plusarg) {
+        PYHPI_LOG(PYHPI_LOG_DEBUG, "Note: parse timeout specification");
+        prv_timeout = str2time(timeout_plusarg);
     } else {
-        fprintf(stdout, "Note: no timeout specified\\n");
+        PYHPI_LOG(PYHPI_LOG_DEBUG, "Note: no timeout specified");
     }
     
     // Launch the testbench main code
     PyObject *ret = PyObject_CallFunctionObjArgs(
         PyObject_GetAttrString(prv_hpi, "tb_main"), 0);
     if (!ret) {
-        fprintf(stdout, "Error calling tb_main\\n");
+        PYHPI_LOG(PYHPI_LOG_ERROR, "failed to call tb_main");
         PyErr_Print();
     }
 
-    fprintf(stdout, "--> eval timeout=%lld\\n", prv_timeout);
-    fflush(stdout);   
+    PYHPI_LOG(PYHPI_LOG_DEBUG, "--> eval timeout=%llu", (unsigned long long)prv_timeout);
+#ifdef PYHPI_VL_THREADS
+    main_ts = PyEval_SaveThread();
+#endif
     while (prv_keep_running && prv_simtime < prv_timeout) {
 ${clocking_block}
     }
-    fprintf(stdout, "<-- eval\\n");
+#ifdef PYHPI_VL_THREADS
+    PyEval_RestoreThread(main_ts);
+#endif
+    PYHPI_LOG(PYHPI_LOG_DEBUG, "<-- eval");
+    // Summary line used by 'hpi regress' to report performance
+    fprintf(stdout, "hpi: simtime=%llups cycles=%llu\\n",
+        (unsigned long long)prv_simtime, (unsigned long long)prv_cycles);
     fflush(stdout);   
     
     prv_top->final();
 
-    // TODO: check for trace enable (support VCD and FST?)
-    
-    // TODO: run python entry-point
-//#ifdef VM_COVERAGE
-//    VerilatedCov::write("sim.cdb");
-//#endif
-    
-    // Done...
-    Py_Finalize();
-    
+    // Tear down the Python testbench, then flush trace and coverage 
+    // data before shutting down Python
+    ret = PyObject_CallMethod(prv_hpi, "tb_fini", 0);
+    if (!ret) {
+        PYHPI_LOG(PYHPI_LOG_ERROR, "failed to call tb_fini");
+        PyErr_Print();
+    }
+
 #ifdef VM_TRACE
-${trace_fini}
+    if (prv_trace_o) {
+        prv_trace_o->close();
+    }
+#endif
+
+#ifdef VM_COVERAGE
+    const char *cov_file = get_plusarg("vl.coverage", 0);
+    VerilatedCov::write(cov_file ? cov_file : "coverage.dat");
 #endif
+
+    if (get_plusarg_bool("hpi.fast_exit", false)) {
+        // Skip interpreter teardown
+        fflush(stdout);
+        fflush(stderr);
+        PyObject_CallMethod(prv_hpi, "fast_exit", "i", 0);
+    }
+    
+    Py_Finalize();
     
     return 0;
 }
@@ -340,19 +600,18 @@ def gen_clocking_block(args):
         p_ps = period_ps(clock_period) / 2
         
         ret += "        prv_top->" + clock_name + " = 0;\n"
-        ret += "        prv_top->eval();\n"
+        ret += "        eval_model();\n"
         ret += "        dump();\n"
         ret += "        prv_simtime += " + str(p_ps) + "; // ps\n"
         ret += "        prv_top->" + clock_name + " = 1;\n"
-        ret += "        prv_top->eval();\n"
+        ret += "        eval_model();\n"
         ret += "        dump();\n"
         ret += "        prv_simtime += " + str(p_ps) + "; // ps\n"
+        ret += "        prv_cycles++;\n"
         
     return ret
 
 def gen_launcher_vl(args):
-    template = Template(launcher)
-    
     # Load up modules that contain DPI tasks
     if args.m != None:
         print("loading modules")
@@ -360,6 +619,19 @@ def gen_launcher_vl(args):
             print("loading " + str(m))
             __import__(m)    
     
+    fh = open(args.o, "w")
+    fh.write(gen_launcher_vl_text(args))
+    fh.close()
+
+#********************************************************************
+#* gen_launcher_vl_text()
+#*
+#* Returns the launcher for the options in <args> (top, clk, 
+#* threads, trace_fst, trace_depth)
+#********************************************************************
+def gen_launcher_vl_text(args) -> str:
+    template = Template(launcher)
+    
     if args.clk == None or len(args.clk) == 0:
         raise Exception("No -clk specified")
     elif len(args.clk) > 1:
@@ -375,42 +647,21 @@ def gen_launcher_vl(args):
     template_params['top'] = args.top
     template_params['clocking_init'] = gen_clocking_init(args)
     template_params['clocking_block'] = gen_clocking_block(args)
+    if args.threads == True:
+        template_params['threads_define'] = "#define PYHPI_VL_THREADS 1"
+    else:
+        template_params['threads_define'] = ""
+    template_params['trace_depth'] = str(args.trace_depth)
     if args.trace_fst == True:
         template_params['trace_headers'] = "#include \"verilated_fst_c.h\""
-        template_params['trace_fields'] = "static VerilatedFstC                 *prv_trace_o = 0;"
-        template_params['trace_init'] = '''
-    if (trace_file) {
-        Verilated::traceEverOn(true);  // Verilator must compute traced signals
-        prv_trace_o = new VerilatedFstC();
-        prv_top->trace(prv_trace_o, 99);  // Trace 99 levels of hierarchy
-        prv_trace_o->open(trace_file);  // Open the dump file
-    }
-        '''
+        template_params['trace_class'] = "VerilatedFstC"
         template_params['default_trace_file'] = "sim.fst"
-        template_params['trace_fini'] = '''
-    if (prv_trace_o) {
-        prv_trace_o->close();
-    }
-        '''
     else:
         template_params['trace_headers'] = "#include \"verilated_vcd_c.h\""
-        template_params['trace_fields'] = "static VerilatedVcdC                 *prv_trace_o = 0;"
-        template_params['trace_init'] = '''
-    if (trace_file) {
-        Verilated::traceEverOn(true);  // Verilator must compute traced signals
-        prv_trace_o = new VerilatedVcdC();
-        prv_top->trace(prv_trace_o, 99);  // Trace 99 levels of hierarchy
-        prv_trace_o->open(trace_file);  // Open the dump file
-    }
-        '''
+        template_params['trace_class'] = "VerilatedVcdC"
         template_params['default_trace_file'] = "sim.vcd"
-        template_params['trace_fini'] = '''
-    if (prv_trace_o) {
-        prv_trace_o->close();
-    }
-        '''
+    template_params['trace_fields'] = ("static " + 
+        template_params['trace_class'] + " *prv_trace_o = 0;")
     
-    fh = open(args.o, "w")
-    fh.write(template.substitute(template_params))
-    fh.close()
+    return template.substitute(template_params)
 
@@ -0,0 +1,95 @@
+#****************************************************************************
+#* loader.py
+#*
+#* Loads testbench modules (+hpi.load, +hpi.entry, +hpi.bfm_load), and
+#* optionally records how long each import takes
+#****************************************************************************
+import builtins
+import sys
+import time
+from hpi import log
+
+# Output file for the import-time profile, or None if not enabled
+prv_outfile = None
+
+# Records (depth, name, self_ns, cumulative_ns), in import-completion order
+prv_records = []
+
+# Stack of child-time accumulators for imports in progress
+prv_stack = []
+
+# Module to import on first registration of a BFM type (+hpi.bfm_load)
+bfm_lazy_map = {}
+
+def enable_importtime(outfile):
+    global prv_outfile
+    prv_outfile = outfile
+
+def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Only imports that actually load a module are of interest
+    if level != 0 or name in sys.modules.keys():
+        return prv_builtin_import(name, globals, locals, fromlist, level)
+
+    prv_stack.append(0)
+    start = time.perf_counter_ns()
+    try:
+        return prv_builtin_import(name, globals, locals, fromlist, level)
+    finally:
+        cumulative = time.perf_counter_ns() - start
+        children = prv_stack.pop()
+        prv_records.append((len(prv_stack), name, cumulative-children, cumulative))
+        if len(prv_stack) > 0:
+            prv_stack[-1] += cumulative
+
+prv_builtin_import = builtins.__import__
+
+#********************************************************************
+#* load()
+#*
+#* Imports module <m>. A load failure is reported along with the
+#* traceback. Returns the module, or None if the load failed
+#********************************************************************
+def load(m, reason="hpi.load"):
+    log.debug("Loading \"" + m + "\" (" + reason + ")")
+
+    if prv_outfile != None:
+        builtins.__import__ = timed_import
+    try:
+        __import__(m)
+        return sys.modules[m]
+    except Exception:
+        log.error("failed to load module \"" + m + "\" (" + reason + ")")
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        return None
+    finally:
+        if prv_outfile != None:
+            builtins.__import__ = prv_builtin_import
+
+# Called by register_bfm when no class is registered for BFM type <tname>
+def load_bfm(tname) -> bool:
+    if tname not in bfm_lazy_map.keys():
+        return False
+
+    m = bfm_lazy_map.pop(tname)
+    return load(m, "hpi.bfm_load " + tname) != None
+
+#********************************************************************
+#* dump_importtime()
+#*
+#* Writes the import-time profile in the same layout as
+#* 'python -X importtime', nested imports listed before their parent
+#********************************************************************
+def dump_importtime():
+    if prv_outfile == None or len(prv_records) == 0:
+        return
+
+    total_ns = sum(r[3] for r in prv_records if r[0] == 0)
+    with open(prv_outfile, "w") as fp:
+        fp.write("import time: self [us] | cumulative | imported package\n")
+        for depth,name,self_ns,cumulative_ns in prv_records:
+            fp.write("import time: %9d | %10d | %s%s\n" % (
+                self_ns//1000, cumulative_ns//1000, "  "*depth, name))
+
+    log.info("hpi: import time %.3f ms (" % (total_ns/1000000.0) +
+             str(len(prv_records)) + " modules, see " + prv_outfile + ")")
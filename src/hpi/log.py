@@ -0,0 +1,97 @@
+#****************************************************************************
+#* log.py
+#*
+#* Leveled, buffered message output. The level is set with
+#* +hpi.verbosity=<none|error|warn|info|debug>, and is mirrored to the
+#* generated C code such that both sides filter messages the same way
+#****************************************************************************
+import atexit
+import sys
+
+NONE = 0
+ERROR = 1
+WARN = 2
+INFO = 3
+DEBUG = 4
+
+level_names = {
+    "none": NONE,
+    "error": ERROR,
+    "warn": WARN,
+    "warning": WARN,
+    "info": INFO,
+    "debug": DEBUG
+    }
+
+# Current level. Messages above this level are discarded. Code on hot
+# paths should check this before formatting a message:
+#   if log.level >= log.DEBUG:
+#       log.debug("..." + str(x))
+level = INFO
+
+# Messages are collected and written in blocks
+prv_buf = []
+prv_buf_sz = 0
+prv_buf_max = 16384
+
+def set_level(l):
+    global level
+    if type(l) == str:
+        if l.lower() in level_names.keys():
+            l = level_names[l.lower()]
+        else:
+            try:
+                l = int(l)
+            except ValueError:
+                warn("unknown verbosity \"" + l + "\" (valid levels: " +
+                     ", ".join(level_names.keys()) + " or 0-4); keeping " +
+                     "the current level")
+                return
+    level = max(NONE, min(DEBUG, l))
+
+    # Keep the generated C code in sync
+    try:
+        import hpi_e
+        hpi_e.set_verbosity(level)
+    except (ImportError, AttributeError):
+        pass
+
+def enabled(l) -> bool:
+    return l <= level
+
+def flush():
+    global prv_buf_sz
+    if len(prv_buf) != 0:
+        sys.stdout.write("".join(prv_buf))
+        prv_buf.clear()
+        prv_buf_sz = 0
+    sys.stdout.flush()
+
+def write(msg):
+    global prv_buf_sz
+    prv_buf.append(msg + "\n")
+    prv_buf_sz += len(msg) + 1
+    if prv_buf_sz >= prv_buf_max:
+        flush()
+
+# Errors and warnings are written immediately, along with any
+# messages that precede them
+def error(msg):
+    if level >= ERROR:
+        write("Error: " + msg)
+        flush()
+
+def warn(msg):
+    if level >= WARN:
+        write("Warning: " + msg)
+        flush()
+
+def info(msg):
+    if level >= INFO:
+        write(msg)
+
+def debug(msg):
+    if level >= DEBUG:
+        write(msg)
+
+atexit.register(flush)
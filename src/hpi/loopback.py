@@ -0,0 +1,267 @@
+#****************************************************************************
+#* loopback.py
+#*
+#* Runs a Python testbench without an HDL simulator. Pure-Python stand-ins
+#* for the hpi_e (exports) and hpi_l (launcher) modules are driven by a
+#* cycle-based model. Export-task calls made by BFMs are looped back to
+#* Python responder models, and import-task calls may be injected from a
+#* recorded trace. The real rgy, scheduler and tb_main code runs
+#* unchanged.
+#****************************************************************************
+import heapq
+import json
+import shlex
+import sys
+import time
+import types
+
+import hpi
+from hpi import rgy
+from hpi import log
+from hpi.scheduler import int_thread_yield
+from hpi.tb_main import tb_init, tb_main, tb_fini
+from hpi.tb_main import get_plusarg_time
+from hpi.tb_main import parse_time
+
+# Responder classes, by BFM type name
+responder_type_map = {}
+
+#********************************************************************
+#* responder()
+#*
+#* Class decorator that registers a responder model for a BFM type.
+#* One responder is created per BFM instance. Each export task of the
+#* BFM is called on the responder as a method of the same name, with
+#* the same arguments
+#********************************************************************
+class responder():
+
+    def __init__(self, tname : str):
+        self.tname = tname
+
+    def __call__(self, cls):
+        responder_type_map[self.tname] = cls
+        return cls
+
+class ResponderBase():
+
+    def __init__(self):
+        self.bfm = None
+        self.lb = None
+
+    def now(self) -> int:
+        return self.lb.cycle
+
+    # Calls import task <method> of the BFM after <delay> cycles
+    def call(self, delay : int, method : str, *args):
+        self.lb.schedule(delay, getattr(self.bfm, method), args)
+
+    # Blocks the calling thread for <delay> cycles, like an export
+    # task that consumes time
+    def wait(self, delay : int):
+        sem = hpi.semaphore()
+        self.lb.schedule(delay, sem.put, (1,))
+        sem.get(1)
+
+class loopback():
+
+    def __init__(self, period_ps=1000):
+        self.period_ps = period_ps
+        self.cycle = 0
+        self.timeout = None
+        self.finished = False
+        # Pending events: (cycle, seq, func, args)
+        self.events = []
+        self.seq = 0
+        self.responders = []
+        # Export calls made, as (cycle, iname, method, args), when recording
+        self.exports = None
+        self.n_exports = 0
+        self.n_imports = 0
+
+    def schedule(self, delay, func, args):
+        heapq.heappush(self.events, (self.cycle+delay, self.seq, func, args))
+        self.seq += 1
+
+    #****************************************************************
+    #* install()
+    #*
+    #* Installs the hpi_e and hpi_l stand-ins. Export functions are
+    #* resolved by name on first use, since BFM modules are loaded
+    #* by tb_init
+    #****************************************************************
+    def install(self):
+        hpi_e = types.ModuleType("hpi_e")
+        hpi_e.__getattr__ = self.get_export
+        sys.modules["hpi_e"] = hpi_e
+
+        hpi_l = types.ModuleType("hpi_l")
+        hpi_l.get_simtime = lambda: float(self.cycle*self.period_ps)
+        hpi_l.finish = self.finish
+        hpi_l.set_timeout = self.set_timeout
+        hpi_l.trace_on = lambda: None
+        hpi_l.trace_off = lambda: None
+        sys.modules["hpi_l"] = hpi_l
+
+    def uninstall(self):
+        for m in ("hpi_e", "hpi_l"):
+            if m in sys.modules.keys():
+                del sys.modules[m]
+
+    def finish(self):
+        self.finished = True
+
+    def set_timeout(self, t):
+        self.timeout = int(t) if t else None
+
+    def get_export(self, name):
+        for tname,info in rgy.bfm_type_map.items():
+            for tf in info.tf_list:
+                if not tf.is_imp and tf.tf_name() == name:
+                    method = tf.fname[len(tname)+1:]
+                    return lambda ctxt, *args: self.export(ctxt, method, args)
+        raise AttributeError("module 'hpi_e' has no export '" + name + "'")
+
+    def export(self, ctxt, method, args):
+        self.n_exports += 1
+        if self.exports != None:
+            self.exports.append(
+                (self.cycle, rgy.bfm_list[ctxt].iname, method, list(args)))
+
+        rsp = self.responders[ctxt]
+        if rsp == None:
+            log.error("no loopback responder for BFM \"" +
+                      rgy.bfm_list[ctxt].iname + "\" (" + method + ")")
+            return 0
+        getattr(rsp, method)(*args)
+        return 0
+
+    # Creates BFM instances as the generated wrappers would, and a
+    # responder for each
+    def register(self, tname, iname):
+        ctxt = len(self.responders)
+        self.responders.append(None)
+        if rgy.register_bfm(tname, iname, ctxt) == -1:
+            return
+
+        if tname in responder_type_map.keys():
+            rsp = responder_type_map[tname]()
+            rsp.bfm = rgy.bfm_list[ctxt]
+            rsp.lb = self
+            self.responders[ctxt] = rsp
+
+    #****************************************************************
+    #* load_trace()
+    #*
+    #* Schedules import-task calls from a trace. Each line is a JSON
+    #* list: [cycle, bfm_path, method, [args...]]
+    #****************************************************************
+    def load_trace(self, path):
+        with open(path, "r") as fp:
+            for line in fp:
+                if line.strip() == "":
+                    continue
+                cycle,iname,method,args = json.loads(line)
+                bfm = rgy.get_bfm(iname)
+                if bfm == None:
+                    raise Exception("Trace \"" + path +
+                            "\" references unknown BFM \"" + iname + "\"")
+                heapq.heappush(self.events,
+                        (cycle, self.seq, getattr(bfm, method), tuple(args)))
+                self.seq += 1
+
+    def save_exports(self, path):
+        with open(path, "w") as fp:
+            for e in self.exports:
+                fp.write(json.dumps(e) + "\n")
+
+    #****************************************************************
+    #* run()
+    #*
+    #* Advances time from event to event until the testbench calls
+    #* finish(), the timeout is reached, or no events remain
+    #****************************************************************
+    def run(self, max_cycles=None):
+        while not self.finished:
+            if len(self.events) == 0:
+                log.warn("loopback: no pending activity at cycle " +
+                         str(self.cycle))
+                break
+
+            cycle = self.events[0][0]
+            if max_cycles != None and cycle > max_cycles:
+                self.cycle = max_cycles
+                break
+            if (self.timeout != None and
+                    cycle*self.period_ps >= self.timeout):
+                self.cycle = self.timeout // self.period_ps
+                break
+
+            self.cycle = cycle
+            while (not self.finished and len(self.events) != 0 and
+                    self.events[0][0] == cycle):
+                ev = heapq.heappop(self.events)
+                self.n_imports += 1
+                ev[2](*ev[3])
+                # Let threads woken by the call run to their next block
+                int_thread_yield()
+
+def main(args, bfms, modules=[], trace=None, record=None, max_cycles=None,
+         period_ps=1000):
+    lb = loopback(period_ps)
+    lb.install()
+    if record != None:
+        lb.exports = []
+
+    try:
+        for m in modules:
+            __import__(m)
+
+        start = time.perf_counter()
+        tb_init(args)
+        timeout = get_plusarg_time("hpi.timeout")
+        if timeout != None:
+            lb.set_timeout(timeout)
+
+        for tname,iname in bfms:
+            lb.register(tname, iname)
+        if trace != None:
+            lb.load_trace(trace)
+
+        tb_main()
+        lb.run(max_cycles)
+        wall = time.perf_counter() - start
+
+        print("hpi: simtime=%dps cycles=%d" % (lb.cycle*lb.period_ps, lb.cycle))
+        print("loopback: %d export calls, %d events in %.3fs (%.0f calls/s)" % (
+            lb.n_exports, lb.n_imports, wall,
+            (lb.n_exports+lb.n_imports)/wall if wall > 0 else 0))
+        tb_fini()
+
+        if record != None:
+            lb.save_exports(record)
+    finally:
+        lb.uninstall()
+
+    return lb
+
+def loopback_cmd(args):
+    bfms = []
+    for b in args.bfm or []:
+        # <type>:<path>[:<count>]
+        f = b.split(':')
+        if len(f) == 2:
+            bfms.append((f[0], f[1]))
+        elif len(f) == 3:
+            for i in range(int(f[2])):
+                bfms.append((f[0], f[1] + str(i)))
+        else:
+            raise Exception("-bfm expects <type>:<path>[:<count>]")
+
+    main([] if args.args == None else shlex.split(args.args),
+         bfms,
+         modules=args.m or [],
+         trace=args.trace,
+         record=args.record,
+         max_cycles=args.cycles,
+         period_ps=parse_time(args.period))
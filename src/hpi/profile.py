@@ -0,0 +1,134 @@
+#****************************************************************************
+#* profile.py
+#*
+#* Collects and reports the split of run time between HDL evaluation,
+#* Python code called from the HDL (import tasks), and HDL code called
+#* from Python (export tasks)
+#****************************************************************************
+import json
+import time
+from hpi import log
+
+prv_outfile = None
+prv_start = 0
+
+def enable(outfile):
+    global prv_outfile
+    global prv_start
+    prv_outfile = outfile
+    prv_start = time.monotonic_ns()
+
+    for m in ("hpi_e", "hpi_l"):
+        try:
+            mod = __import__(m)
+            mod.prof_enable(1)
+        except (ImportError, AttributeError):
+            log.warn("profiling not supported by module \"" + m + "\"")
+
+def enabled():
+    return prv_outfile != None
+
+def collect() -> dict:
+    ret = {
+        "runs": 1,
+        "wall_time_ns": time.monotonic_ns() - prv_start,
+        "eval": {"count": 0, "time_ns": 0},
+        "tasks": []
+        }
+
+    try:
+        import hpi_l
+        ret["eval"] = hpi_l.prof_data()
+    except (ImportError, AttributeError):
+        pass
+
+    try:
+        import hpi_e
+        for name,kind,count,time_ns in hpi_e.prof_data():
+            ret["tasks"].append({
+                "name": name,
+                "kind": kind,
+                "count": count,
+                "time_ns": time_ns})
+    except (ImportError, AttributeError):
+        pass
+
+    return ret
+
+#********************************************************************
+#* print_report()
+#*
+#* Prints per-task counts and times, followed by the split of time
+#* between HDL, Python, and export calls. Note that evaluation time
+#* includes import tasks called by the HDL, and import-task time
+#* includes export tasks called by Python
+#********************************************************************
+def print_report(data):
+    ms = 1000000.0
+    print("%-40s %-7s %12s %12s %10s" % (
+        "Task", "Kind", "Calls", "Total (ms)", "Avg (us)"))
+
+    tasks = sorted(data["tasks"], key=lambda t: t["time_ns"], reverse=True)
+    for t in tasks + [dict(name="<eval>", kind="hdl", **data["eval"])]:
+        if t["count"] == 0:
+            continue
+        print("%-40s %-7s %12d %12.3f %10.3f" % (
+            t["name"], t["kind"], t["count"], t["time_ns"]/ms,
+            t["time_ns"]/t["count"]/1000.0))
+
+    imp_ns = sum(t["time_ns"] for t in data["tasks"] if t["kind"] == "import")
+    exp_ns = sum(t["time_ns"] for t in data["tasks"] if t["kind"] == "export")
+    eval_ns = data["eval"]["time_ns"]
+
+    print("Runs:                 " + str(data["runs"]))
+    print("Wall time:            %.3f ms" % (data["wall_time_ns"]/ms))
+    print("HDL eval (total):     %.3f ms" % (eval_ns/ms))
+    print("HDL eval (excl. DPI): %.3f ms" % (max(eval_ns-imp_ns, 0)/ms))
+    print("Python (imports):     %.3f ms" % (max(imp_ns-exp_ns, 0)/ms))
+    print("HDL (exports):        %.3f ms" % (exp_ns/ms))
+
+def dump():
+    if prv_outfile == None:
+        return
+
+    data = collect()
+    print_report(data)
+    with open(prv_outfile, "w") as fp:
+        json.dump(data, fp, indent=2)
+
+def merge(data_l) -> dict:
+    ret = {
+        "runs": 0,
+        "wall_time_ns": 0,
+        "eval": {"count": 0, "time_ns": 0},
+        "tasks": []
+        }
+    task_m = {}
+
+    for data in data_l:
+        ret["runs"] += data["runs"]
+        ret["wall_time_ns"] += data["wall_time_ns"]
+        ret["eval"]["count"] += data["eval"]["count"]
+        ret["eval"]["time_ns"] += data["eval"]["time_ns"]
+        for t in data["tasks"]:
+            key = (t["name"], t["kind"])
+            if key not in task_m.keys():
+                task_m[key] = dict(name=t["name"], kind=t["kind"], count=0, time_ns=0)
+                ret["tasks"].append(task_m[key])
+            task_m[key]["count"] += t["count"]
+            task_m[key]["time_ns"] += t["time_ns"]
+
+    return ret
+
+def profile_report(args):
+    data_l = []
+    for f in args.files:
+        with open(f, "r") as fp:
+            data_l.append(json.load(fp))
+
+    data = merge(data_l)
+    print_report(data)
+
+    if args.o != None:
+        with open(args.o, "w") as fp:
+            json.dump(data, fp, indent=2)
@@ -0,0 +1,225 @@
+#****************************************************************************
+#* recorder.py
+#*
+#* Records fixed-schema transactions from BFMs and monitors. Values are
+#* stored in preallocated arrays, one per field, and full blocks are
+#* written to disk by a background thread. A recording is a directory
+#* with one raw little-endian file per column, plus:
+#*
+#*   meta.json   - fields, type codes and row count
+#*   index.bin   - (time, row) of the first row of each block, as int64
+#*
+#* Each column can be mapped with mmap (or numpy.memmap) and used as an
+#* array. The 'time' column holds the simulation time (ps) of each row.
+#****************************************************************************
+import array
+import bisect
+import json
+import mmap
+import os
+import queue
+import sys
+import threading
+
+# Open recorders, closed by tb_fini
+prv_recorders = []
+
+def now_f():
+    try:
+        import hpi_l
+        return hpi_l.get_simtime
+    except ImportError:
+        return lambda: 0
+
+class recorder():
+
+    #****************************************************************
+    #* __init__()
+    #*
+    #* <fields> is a list of (name, type code) pairs, using the type
+    #* codes of the array module (eg 'B', 'i', 'q', 'd'). Rows are
+    #* written in blocks of <block> rows. Up to <blocks> blocks may be
+    #* waiting to be written before add() waits for the writer
+    #****************************************************************
+    def __init__(self, path : str, fields, block : int = 65536, blocks : int = 4):
+        if sys.byteorder != "little":
+            raise Exception("recorder requires a little-endian host")
+        self.path = path
+        self.fields = [("time", 'q')] + [(n,tc) for n,tc in fields]
+        self.block = block
+        self.count = 0
+        self.closed = False
+        self.now = now_f()
+        names = set()
+        for n,tc in self.fields:
+            if n in names:
+                raise Exception("duplicate recorder field \"" + n + "\"")
+            names.add(n)
+
+        os.makedirs(path, exist_ok=True)
+        self.fp_l = [open(os.path.join(path, n + ".bin"), "wb") for n,tc in self.fields]
+        self.index_fp = open(os.path.join(path, "index.bin"), "wb")
+
+        # Preallocated blocks, passed to the writer when full and
+        # returned once written
+        self.free_q = queue.Queue()
+        for i in range(2):
+            self.free_q.put(self.alloc())
+        self.n_blocks = 2
+        self.max_blocks = max(2, blocks)
+        self.write_q = queue.Queue()
+        self.cols = self.free_q.get()
+        self.n = 0
+        self.gen_add()
+
+        self.writer = threading.Thread(target=self.write_main, daemon=True)
+        self.writer.start()
+        prv_recorders.append(self)
+
+    def alloc(self):
+        return [array.array(tc, bytes(self.block*array.array(tc).itemsize))
+                for n,tc in self.fields]
+
+    #****************************************************************
+    #* gen_add()
+    #*
+    #* Generates add() and add_t() for the schema, with the column
+    #* stores unrolled:
+    #*   add(*vals)      - records a row at the current simulation time
+    #*   add_t(t, *vals) - records a row at time <t> (ps)
+    #* Values are passed in field order
+    #****************************************************************
+    def gen_add(self):
+        names = ["v" + str(i) for i in range(1, len(self.fields))]
+        cols = ["c" + str(i) for i in range(len(self.fields))]
+        body = "    i = self.n\n"
+        body += "    " + ",".join(cols) + (", = " if len(cols) == 1 else " = ") + "self.cols\n"
+        body += "    c0[i] = t\n"
+        for c,v in zip(cols[1:], names):
+            body += "    " + c + "[i] = " + v + "\n"
+        body += "    i += 1\n"
+        body += "    self.n = i\n"
+        body += "    if i == self.block:\n"
+        body += "        self.swap()\n"
+
+        src = "def add_t(t" + "".join([", " + v for v in names]) + "):\n" + body
+        src += "def add(" + ", ".join(names) + "):\n"
+        src += "    t = int(now())\n" + body
+        scope = {"self" : self, "now" : self.now}
+        exec(src, scope)
+        self.add = scope["add"]
+        self.add_t = scope["add_t"]
+
+    def swap(self):
+        self.write_q.put((self.cols, self.n))
+        self.count += self.n
+        if self.free_q.empty() and self.n_blocks < self.max_blocks:
+            # Allow a burst to run ahead of the writer
+            self.free_q.put(self.alloc())
+            self.n_blocks += 1
+        self.cols = self.free_q.get()
+        self.n = 0
+
+    def write_main(self):
+        row = 0
+        while True:
+            item = self.write_q.get()
+            if item == None:
+                break
+            cols,n = item
+            if n != 0:
+                self.index_fp.write(array.array('q', [cols[0][0], row]).tobytes())
+                for fp,c in zip(self.fp_l, cols):
+                    if n == self.block:
+                        c.tofile(fp)
+                    else:
+                        fp.write(memoryview(c)[:n])
+                row += n
+            self.free_q.put(cols)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.write_q.put((self.cols, self.n))
+        self.count += self.n
+        self.write_q.put(None)
+        self.writer.join()
+
+        for fp in self.fp_l:
+            fp.close()
+        self.index_fp.close()
+        with open(os.path.join(self.path, "meta.json"), "w") as fp:
+            json.dump({
+                "version": 1,
+                "count": self.count,
+                "block": self.block,
+                "fields": [[n,tc] for n,tc in self.fields]}, fp, indent=2)
+        if self in prv_recorders:
+            prv_recorders.remove(self)
+
+def close_all():
+    for r in list(prv_recorders):
+        r.close()
+
+#********************************************************************
+#* reader
+#*
+#* Loads a recording for post-processing. Columns are mapped, not
+#* read, and are returned as NumPy arrays when NumPy is available and
+#* as memoryviews otherwise
+#********************************************************************
+class reader():
+
+    def __init__(self, path : str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as fp:
+            meta = json.load(fp)
+        self.count = meta["count"]
+        self.fields = [(n,tc) for n,tc in meta["fields"]]
+        self.cols = {}
+        # The index is only used for bisection, so is kept as a memoryview
+        self.index = self.map("index", 'q')
+
+    def map(self, name, tc):
+        fn = os.path.join(self.path, name + ".bin")
+        if os.path.getsize(fn) == 0:
+            return memoryview(array.array(tc))
+        with open(fn, "rb") as fp:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mm).cast(tc)
+
+    def column(self, name : str):
+        if name in self.cols.keys():
+            return self.cols[name]
+        for n,tc in self.fields:
+            if n == name:
+                col = self.map(n, tc)
+                try:
+                    import numpy
+                    col = numpy.frombuffer(col, dtype=numpy.dtype(tc).newbyteorder('<'))
+                except ImportError:
+                    pass
+                self.cols[name] = col
+                return col
+        raise KeyError("recording has no field \"" + name + "\"")
+
+    def columns(self) -> dict:
+        return {n : self.column(n) for n,tc in self.fields}
+
+    #****************************************************************
+    #* rows()
+    #*
+    #* Returns the range of rows with time in [t0, t1). The block
+    #* index narrows the search to the blocks that span the window
+    #****************************************************************
+    def rows(self, t0 : int, t1 : int) -> range:
+        t = self.column("time")
+        starts = self.index[0::2]
+        rows = self.index[1::2]
+        b0 = max(0, bisect.bisect_left(starts, t0) - 1)
+        b1 = bisect.bisect_left(starts, t1)
+        lo = rows[b0] if b0 < len(rows) else self.count
+        hi = rows[b1] if b1 < len(rows) else self.count
+        return range(bisect.bisect_left(t, t0, lo, hi),
+                     bisect.bisect_left(t, t1, lo, hi))
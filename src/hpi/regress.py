@@ -0,0 +1,252 @@
+#****************************************************************************
+#* regress.py
+#*
+#* Parallel regression runner. Runs a list of tests (each with plusargs
+#* and a set of seeds) across a pool of local simulator processes
+#****************************************************************************
+import json
+import os
+import re
+import shlex
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Summary line printed by the generated launchers at end of simulation
+prv_simtime_re = re.compile(r"hpi: simtime=(\d+)ps cycles=(\d+)")
+# Messages that fail a test, even if the simulator exits with status 0.
+# Includes Verilator's %Error/%Fatal and uncaught Python exceptions
+prv_error_re = re.compile(r"^(%?Error|%?Fatal|FATAL|Traceback)\b", re.MULTILINE)
+
+runtimes_file = ".hpi_runtimes.json"
+
+class regress_job():
+
+    def __init__(self, test, seed, plusargs):
+        self.test = test
+        self.seed = seed
+        self.plusargs = plusargs
+        self.name = test + "." + str(seed)
+        self.status = None
+        self.exitcode = None
+        self.wall_time = 0.0
+        self.sim_time = None
+        self.cycles = None
+        self.message = None
+
+    def cps(self):
+        if self.cycles == None or self.wall_time <= 0.0:
+            return None
+        return self.cycles / self.wall_time
+
+#********************************************************************
+#* parse_testlist()
+#*
+#* Reads a test list. Each line specifies a test name, followed by
+#* plusargs and, optionally, the seeds to run:
+#*
+#*   <name> [+plusarg ...] [-seed <n> ...] [-count <n>]
+#*
+#* Text following '#' is a comment. Each test and seed runs in its own
+#* directory, so may only be specified once
+#********************************************************************
+def parse_testlist(path, dflt_count=1) -> [regress_job]:
+    ret = []
+    names = set()
+
+    with open(path, "r") as fp:
+        for lineno,line in enumerate(fp, 1):
+            toks = shlex.split(line, comments=True)
+            if len(toks) == 0:
+                continue
+
+            test = toks[0]
+            plusargs = []
+            seeds = []
+            count = dflt_count
+            i=1
+            while i < len(toks):
+                if toks[i] == "-seed" or toks[i] == "-count":
+                    if i+1 >= len(toks):
+                        raise Exception(path + ":" + str(lineno) +
+                                ": missing value for " + toks[i])
+                    if toks[i] == "-seed":
+                        seeds.append(int(toks[i+1]))
+                    else:
+                        count = int(toks[i+1])
+                    i += 1
+                else:
+                    plusargs.append(toks[i])
+                i += 1
+
+            if len(seeds) == 0:
+                seeds = list(range(1, count+1))
+
+            for s in seeds:
+                job = regress_job(test, s, plusargs)
+                if job.name in names:
+                    raise Exception(path + ":" + str(lineno) + ": test \"" +
+                            test + "\" with seed " + str(s) + " is already specified")
+                names.add(job.name)
+                ret.append(job)
+
+    return ret
+
+def load_runtimes(outdir):
+    path = os.path.join(outdir, runtimes_file)
+    if os.path.isfile(path):
+        try:
+            with open(path, "r") as fp:
+                return json.load(fp)
+        except ValueError:
+            print("Warning: ignoring corrupt runtime history \"" + path + "\"")
+    return {}
+
+def save_runtimes(outdir, runtimes, jobs):
+    for j in jobs:
+        if j.status == "PASS":
+            # Smooth run-to-run variation across seeds
+            if j.test in runtimes.keys():
+                runtimes[j.test] = 0.5*runtimes[j.test] + 0.5*j.wall_time
+            else:
+                runtimes[j.test] = j.wall_time
+
+    with open(os.path.join(outdir, runtimes_file), "w") as fp:
+        json.dump(runtimes, fp, indent=2, sort_keys=True)
+
+# Orders jobs longest-first. Tests without history are assumed
+# to be long, and are started first
+def schedule(jobs, runtimes) -> [regress_job]:
+    return sorted(jobs,
+            key=lambda j: runtimes.get(j.test, float("inf")),
+            reverse=True)
+
+def run_job(job, sim, sim_args, outdir, env, timeout):
+    rundir = os.path.join(outdir, job.name)
+    os.makedirs(rundir, exist_ok=True)
+    logfile = os.path.join(rundir, "sim.log")
+
+    cmd = [sim] + sim_args + job.plusargs + ["+hpi.seed=" + str(job.seed)]
+
+    start = time.monotonic()
+    with open(logfile, "w") as fp:
+        fp.write("# " + " ".join(shlex.quote(c) for c in cmd) + "\n")
+        fp.flush()
+        try:
+            # Output is streamed straight to the per-test log
+            job.exitcode = subprocess.call(cmd,
+                    cwd=rundir, env=env,
+                    stdout=fp, stderr=subprocess.STDOUT,
+                    timeout=timeout)
+        except subprocess.TimeoutExpired:
+            job.status = "TIMEOUT"
+        except OSError as e:
+            fp.write("Error: failed to launch simulator: " + str(e) + "\n")
+            job.status = "FAIL"
+    job.wall_time = time.monotonic() - start
+
+    with open(logfile, "r", errors="replace") as fp:
+        content = fp.read()
+
+    m = None
+    for m in prv_simtime_re.finditer(content):
+        pass
+    if m != None:
+        job.sim_time = int(m.group(1))
+        job.cycles = int(m.group(2))
+
+    if job.status == None:
+        if job.exitcode != 0 or prv_error_re.search(content) != None:
+            job.status = "FAIL"
+        else:
+            job.status = "PASS"
+
+    print(job.status + ": " + job.name + " (" +
+            "%.2fs" % job.wall_time + ")", flush=True)
+
+    return job
+
+def fmt_simtime(ps):
+    if ps == None:
+        return "-"
+    for unit,scale in (("s", 10**12), ("ms", 10**9), ("us", 10**6), ("ns", 10**3)):
+        if ps >= scale:
+            return "%.3f%s" % (ps/scale, unit)
+    return str(ps) + "ps"
+
+def print_summary(jobs, wall_time):
+    print("%-40s %-8s %12s %10s %12s" % (
+        "Test", "Status", "Sim Time", "Wall (s)", "Cycles/s"))
+    for j in jobs:
+        cps = j.cps()
+        print("%-40s %-8s %12s %10.2f %12s" % (
+            j.name, j.status, fmt_simtime(j.sim_time), j.wall_time,
+            "-" if cps == None else "%.0f" % cps))
+
+    n_pass = sum(1 for j in jobs if j.status == "PASS")
+    print("Passed: " + str(n_pass) + "/" + str(len(jobs)) +
+            " (wall time %.2fs)" % wall_time)
+
+def write_summary(path, jobs, wall_time):
+    summary = {
+        "wall_time": wall_time,
+        "tests" : [{
+            "name": j.name,
+            "test": j.test,
+            "seed": j.seed,
+            "status": j.status,
+            "message": j.message,
+            "exitcode": j.exitcode,
+            "sim_time_ps": j.sim_time,
+            "cycles": j.cycles,
+            "wall_time": j.wall_time,
+            "cycles_per_sec": j.cps()} for j in jobs]
+        }
+    with open(path, "w") as fp:
+        json.dump(summary, fp, indent=2)
+
+def regress(args):
+    outdir = os.path.abspath(args.outdir)
+    os.makedirs(outdir, exist_ok=True)
+
+    sim = os.path.abspath(args.sim) if os.path.exists(args.sim) else args.sim
+    sim_args = [] if args.args == None else shlex.split(args.args)
+    if args.fast_exit:
+        sim_args.append("+hpi.fast_exit")
+
+    jobs = parse_testlist(args.testlist, args.count)
+    runtimes = load_runtimes(outdir)
+
+    # Tests run in their own directory. Ensure testbench modules
+    # remain loadable relative to the invocation directory
+    env = os.environ.copy()
+    pythonpath = [os.getcwd()]
+    if "PYTHONPATH" in env.keys():
+        pythonpath.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(pythonpath)
+
+    print("Running " + str(len(jobs)) + " jobs on " + str(args.j) + " workers",
+          flush=True)
+    start = time.monotonic()
+    # Each pool worker supervises one simulator process at a time
+    with ThreadPoolExecutor(max_workers=args.j) as pool:
+        futures = [(j, pool.submit(run_job, j, sim, sim_args, outdir, env, args.timeout))
+                   for j in schedule(jobs, runtimes)]
+        for j,f in futures:
+            try:
+                f.result()
+            except Exception as e:
+                # An internal failure (eg the run directory couldn't be
+                # created) must not leave the job without a status
+                j.status = "ERROR"
+                j.message = str(e)
+                print("ERROR: " + j.name + ": " + j.message, flush=True)
+    wall_time = time.monotonic() - start
+
+    save_runtimes(outdir, runtimes, jobs)
+    print_summary(jobs, wall_time)
+    write_summary(os.path.join(outdir, "summary.json"), jobs, wall_time)
+
+    if any(j.status != "PASS" for j in jobs):
+        return 1
+    return 0
@@ -0,0 +1,256 @@
+#****************************************************************************
+#* replay.py
+#*
+#* Records the calls between the simulator and the Python testbench
+#* (+hpi.record), and replays a recording without the simulator. During
+#* replay, BFM registrations and import calls are applied in recorded
+#* order, and each export call made by the testbench is checked against
+#* the recorded export calls. The log uses the records of the shared-
+#* memory transport (see shm.py), and is read in place via mmap.
+#****************************************************************************
+import collections
+import json
+import mmap
+import shlex
+import struct
+import sys
+import time
+import types
+
+from hpi import log
+from hpi import shm
+
+MAGIC       = 0x4C495048 # 'HPIL'
+VERSION     = 1
+
+prv_recording = False
+
+# Bits of each integer parameter type, used to compare arguments
+# as the HDL sees them
+prv_type_bits = {'b': 8, 'h': 16, 'i': 32, 'l': 64}
+
+#********************************************************************
+#* record()
+#*
+#* Called by tb_init to start recording. The log begins with the
+#* testbench arguments and the generated task table, as the shared-
+#* memory channel does
+#********************************************************************
+def record(path, argv):
+    global prv_recording
+    try:
+        import hpi_e
+        tf_l = [[name,kind] for name,kind,count,time_ns in hpi_e.prof_data()]
+        hpi_e.record_open(path, json.dumps({"argv" : argv, "tf" : tf_l}))
+        prv_recording = True
+        log.info("recording DPI calls to " + path)
+    except (ImportError, AttributeError):
+        log.warn("+hpi.record is not supported by this launcher")
+
+# Marks the start of the testbench
+def record_main():
+    if prv_recording:
+        import hpi_e
+        hpi_e.record_event(shm.MAIN)
+
+def record_close():
+    global prv_recording
+    if prv_recording:
+        import hpi_e
+        hpi_e.record_close()
+        prv_recording = False
+
+def same_args(tf, expected, actual) -> bool:
+    if len(expected) != len(actual):
+        return False
+    for p,e,a in zip(tf.params, expected, actual):
+        if p.ptype == 's':
+            if str(a) != e:
+                return False
+        elif (e - int(a)) % (1 << prv_type_bits[p.ptype[0]]) != 0:
+            return False
+    return True
+
+class player():
+
+    def __init__(self, path, max_errors=10):
+        self.path = path
+        fp = open(path, "rb")
+        self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        fp.close()
+
+        magic,version = struct.unpack_from("<II", self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception("\"" + path + "\" is not a pyHPI recording")
+        self.off = 16
+        self.simtime = 0
+        self.tf_idx = {}
+        self.tf_names = []
+        self.imports = {}
+        self.finished = False
+        self.max_errors = max_errors
+        self.n_errors = 0
+        self.n_imports = 0
+        self.n_exports = 0
+        # Unmatched export calls made and recorded, by BFM id
+        self.actual = {}
+        self.expected = {}
+        self.decoders = {}
+
+    def install(self):
+        hpi_e = types.ModuleType("hpi_e")
+        hpi_e.__getattr__ = self.get_export
+        sys.modules["hpi_e"] = hpi_e
+
+        hpi_l = types.ModuleType("hpi_l")
+        hpi_l.get_simtime = lambda: float(self.simtime)
+        hpi_l.finish = self.finish
+        hpi_l.set_timeout = lambda t: None
+        hpi_l.trace_on = lambda: None
+        hpi_l.trace_off = lambda: None
+        sys.modules["hpi_l"] = hpi_l
+
+    def uninstall(self):
+        for m in ("hpi_e", "hpi_l"):
+            if m in sys.modules.keys():
+                del sys.modules[m]
+
+    def finish(self):
+        self.finished = True
+
+    def error(self, msg):
+        self.n_errors += 1
+        if self.n_errors <= self.max_errors:
+            log.error("replay @ " + str(self.simtime) + "ps: " + msg)
+
+    def get_export(self, name):
+        if name not in self.tf_idx.keys():
+            raise AttributeError("module 'hpi_e' has no export '" + name + "'")
+        idx = self.tf_idx[name]
+        return lambda ctxt, *args: self.check_export(idx, ctxt, args)
+
+    def describe(self, tf, id, args):
+        from hpi import rgy
+        if id >= 0 and id < len(rgy.bfm_list) and rgy.bfm_list[id] != None:
+            inst = rgy.bfm_list[id].iname
+        else:
+            inst = str(id)
+        return self.tf_names[tf] + str(tuple(args)) + " on " + inst
+
+    #****************************************************************
+    #* check_export()
+    #*
+    #* Called for each export call made by the testbench. Calls are
+    #* matched against the recorded export calls of the same BFM, in
+    #* order. Calls on different BFMs may be recorded in a different
+    #* order (eg with +hpi.shm), so matching is per BFM and unmatched 
+    #* calls are only reported once simulation time advances
+    #****************************************************************
+    def check_export(self, idx, ctxt, args):
+        self.n_exports += 1
+        self.pending(self.actual, ctxt).append((idx, tuple(args)))
+        self.match(ctxt)
+        return 0
+
+    def pending(self, m, id):
+        if id not in m.keys():
+            m[id] = collections.deque()
+        return m[id]
+
+    def match(self, id):
+        actual = self.pending(self.actual, id)
+        expected = self.pending(self.expected, id)
+        while len(actual) != 0 and len(expected) != 0:
+            a_tf,a_args = actual.popleft()
+            e_tf,e_args = expected.popleft()
+            if a_tf != e_tf:
+                self.error("export call " + self.describe(a_tf, id, a_args) +
+                           " does not match recorded call " +
+                           self.describe(e_tf, id, e_args))
+            elif not same_args(shm.find_export(self.tf_names[a_tf]), e_args, a_args):
+                self.error("export call " + self.describe(a_tf, id, a_args) +
+                           " does not match recorded arguments " + str(tuple(e_args)))
+
+    # Reports export calls left unmatched once time advances
+    def check_pending(self):
+        for id,q in self.actual.items():
+            for tf,args in q:
+                self.error("unexpected export call " + self.describe(tf, id, args))
+            q.clear()
+        for id,q in self.expected.items():
+            for tf,args in q:
+                self.error("recorded export call " + 
+                           self.describe(tf, id, args) + " was not made")
+            q.clear()
+
+    def hello(self, off, argv):
+        from hpi.tb_main import tb_init
+
+        msg = json.loads(shm.unpack_str(self.mm, off+16)[0])
+        for i,(name,kind) in enumerate(msg["tf"]):
+            self.tf_idx[name] = i
+            self.tf_names.append(name)
+
+        tb_init(msg["argv"] + argv)
+        self.imports = shm.import_table(self.tf_idx)
+
+    #****************************************************************
+    #* run()
+    #*
+    #* Applies the recorded registrations and import calls. Returns
+    #* the number of mismatched export calls
+    #****************************************************************
+    def run(self, argv=[]):
+        from hpi.tb_main import tb_main
+        from hpi import rgy
+        mm = self.mm
+
+        while self.off < len(mm):
+            n,kind,tf,id,rsvd = shm.prv_rec.unpack_from(mm, self.off)
+            off = self.off
+            self.off += n
+
+            if kind == shm.IMPORT:
+                self.n_imports += 1
+                shm.call_import(self.imports, mm, tf, id, off+16)
+            elif kind == shm.TIME:
+                self.check_pending()
+                self.simtime = shm.prv_u64.unpack_from(mm, off+16)[0]
+            elif kind == shm.EXPORT:
+                if tf not in self.decoders.keys():
+                    decl = shm.find_export(self.tf_names[tf])
+                    self.decoders[tf] = shm.arg_decoder(decl)
+                self.pending(self.expected, id).append(
+                    (tf, tuple(self.decoders[tf](mm, off+16))))
+                self.match(id)
+            elif kind == shm.REGISTER:
+                tname,soff = shm.unpack_str(mm, off+16)
+                iname,soff = shm.unpack_str(mm, soff)
+                rgy.register_bfm(tname, iname, id)
+            elif kind == shm.MAIN:
+                tb_main()
+            elif kind == shm.HELLO:
+                self.hello(off, argv)
+            else:
+                log.error("unknown record kind " + str(kind) + " in \"" + self.path + "\"")
+                break
+
+        self.check_pending()
+        return self.n_errors
+
+def replay(args):
+    p = player(args.log, args.max_errors)
+    p.install()
+    try:
+        start = time.perf_counter()
+        errors = p.run([] if args.args == None else shlex.split(args.args))
+        wall = time.perf_counter() - start
+
+        from hpi.tb_main import tb_fini
+        tb_fini()
+    finally:
+        p.uninstall()
+
+    print("replay: simtime=%dps %d import calls, %d export calls checked in %.3fs, %d mismatches" % (
+        p.simtime, p.n_imports, p.n_exports, wall, errors))
+    return 1 if errors != 0 else 0
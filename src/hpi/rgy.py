@@ -5,52 +5,61 @@
 #****************************************************************************
 from hpi.bfm_info import bfm_info
 from hpi.scheduler import int_thread_yield
-
-try:
-    import hpi_e
-except:
-    pass
+from hpi import scheduler
+from hpi import loader
+from hpi import log
+from hpi.inst_tree import inst_tree
 
 class bfm_wrapper_type(enumerate):
     SV_DPI = 1,
     VL_VPI = 2
 
+# BFM instances, indexed by context id. The generated C code looks up
+# instances by the id it assigned at registration
 bfm_list = []
 bfm_type_map = {}
 bfm_inst_map = {}
+bfm_inst_tree = inst_tree()
 tf_global_list = []
 entry_list = {}
 
 def entry(ent):
     global entry_list
-    print("Register entry \"" + ent.__name__ + "\"")
+    log.debug("Register entry \"" + ent.__name__ + "\"")
     entry_list[ent.__name__] = ent
-    
-    print("entry_list.size==" + str(len(entry_list.keys())))
 
 def get_bfm_info(tname : str) -> bfm_info:
     if tname in bfm_type_map.keys():
         return bfm_type_map[tname]
     else:
-        print("Adding BFM \"" + tname + "\" to bfm_type_map")
+        log.debug("Adding BFM \"" + tname + "\" to bfm_type_map")
         info = bfm_info(tname, len(bfm_type_map))
         bfm_type_map[tname] = info
         return info
 
+# Optional base class for BFMs. BFM classes that derive from BfmBase
+# and declare __slots__ for their own fields have no per-instance
+# __dict__, which matters for testbenches with thousands of instances
+class BfmBase():
+    __slots__ = ('iname', 'ctxt')
+
 def bfm(cls):
     # Register the BFM type
-    print("Register bfm \"" + cls.__name__ + "\"")
+    log.debug("Register bfm \"" + cls.__name__ + "\"")
     info = get_bfm_info(cls.__name__)
     info.cls = cls
     return cls
 
 class tf_param():
+    __slots__ = ('pname', 'ptype')
     
     def __init__(self, pname : str, ptype : str):
         self.pname = pname
         self.ptype = ptype
 
 class tf_decl():
+    __slots__ = ('bfm', 'bfm_id', 'tf_id', 'is_imp', 'is_task', 'fname',
+                 'rtype', 'module', 'export_f', 'params')
     
     def __init__(self, 
                  bfm,
@@ -73,6 +82,7 @@ class tf_decl():
         self.rtype = rtype
         self.bfm = None
         self.module = None
+        self.export_f = None
         self.params = []
 
         si = 0        
@@ -163,7 +173,6 @@ class import_task():
 class export_task():
     
     def __init__(self, tinfo : str = ""):
-        print("export_task_init")
         self.tinfo = tinfo
         
     def __call__(self, func):
@@ -188,20 +197,21 @@ class export_task():
                 'i',
                 fi.co_varnames[1:fi.co_argcount],
                 self.tinfo)
-            print("Add export " + func.__name__ + " to bfm " + bfm_name)
+            log.debug("Add export " + func.__name__ + " to bfm " + bfm_name)
             info.tf_list.append(tf)
             tinfo = self.tinfo
             
             def export_task_w(self,*args):
-		# Assume hpi_e contains a <call_trampoline> function?
-		# call_trampoline(tf_name, self.ctxt, tinfo, params)
-                import hpi_e
-                hpi_e.export_trampoline(tf.bfm_id, tf.tf_id, self.ctxt, args)
-#                params = [self.ctxt]
-#                for a in args:
-#                    params.append(a)
-#                # TODO: set appropriate context
-#                eval("hpi_e." + tf.tf_name() + "(*params)")
+                if scheduler.prv_shutdown:
+                    # Cleanup code in a SimThread unwinding at shutdown
+                    # must not call into the finalized model
+                    return
+                # Exports are dispatched by name, since BFM ids depend 
+                # on the order in which BFM modules are loaded
+                if tf.export_f == None:
+                    import hpi_e
+                    tf.export_f = getattr(hpi_e, tf.tf_name())
+                tf.export_f(self.ctxt, *args)
                 
             return export_task_w
         else:
@@ -250,9 +260,14 @@ class import_func():
         return func
     
 def register_bfm(tname : str, iname : str, id : int):
-    print("--> register_bfm: " + tname + " " + iname)
-    if tname not in bfm_type_map.keys():
-        print("Error: BFM type \"" + tname + "\" is not registered")
+    if log.level >= log.DEBUG:
+        log.debug("--> register_bfm: " + tname + " " + iname)
+    if tname not in bfm_type_map.keys() or bfm_type_map[tname].cls == None:
+        # The module may be registered for loading on first use
+        loader.load_bfm(tname)
+        
+    if tname not in bfm_type_map.keys() or bfm_type_map[tname].cls == None:
+        log.error("BFM type \"" + tname + "\" is not registered")
         return -1
     
     info = bfm_type_map[tname]
@@ -262,8 +277,92 @@ def register_bfm(tname : str, iname : str, id : int):
     inst.ctxt = id; # Capture the context ID
     
     bfm_inst_map[iname] = inst
-    bfm_list.append(inst)
+    bfm_inst_tree.insert(iname, inst)
+    info.inst_list.append(inst)
+    
+    # Ids are normally assigned in sequence. A failed registration 
+    # leaves a gap, which must not shift later instances
+    if id >= len(bfm_list):
+        bfm_list.extend([None] * (id+1-len(bfm_list)))
+    bfm_list[id] = inst
     
-    print("<-- register_bfm: " + tname + " " + iname)
+    if log.level >= log.DEBUG:
+        log.debug("<-- register_bfm: " + tname + " " + iname)
     return id
 
+#********************************************************************
+#* register_bfms()
+#*
+#* Registers a list of (tname, iname, id) entries. Used by the 
+#* generated code when registrations are queued (+hpi.bulk_register)
+#********************************************************************
+def register_bfms(reg_l):
+    if log.level >= log.DEBUG:
+        for tname,iname,id in reg_l:
+            register_bfm(tname, iname, id)
+        return
+    
+    if len(reg_l) != 0:
+        max_id = max(r[2] for r in reg_l)
+        if max_id >= len(bfm_list):
+            bfm_list.extend([None] * (max_id+1-len(bfm_list)))
+
+    # Same steps as register_bfm, with the type lookup done once 
+    # per run of instances of the same type
+    info = None
+    for tname,iname,id in reg_l:
+        if info == None or info.tname != tname:
+            if tname not in bfm_type_map.keys() or bfm_type_map[tname].cls == None:
+                loader.load_bfm(tname)
+            if tname not in bfm_type_map.keys() or bfm_type_map[tname].cls == None:
+                log.error("BFM type \"" + tname + "\" is not registered")
+                info = None
+                continue
+            info = bfm_type_map[tname]
+            cls = info.cls
+            inst_list = info.inst_list
+            
+        inst = cls()
+        inst.iname = iname
+        inst.ctxt = id
+        bfm_inst_map[iname] = inst
+        bfm_inst_tree.insert(iname, inst)
+        inst_list.append(inst)
+        bfm_list[id] = inst
+
+# Creates the BFM instances for queued registrations
+def flush_registrations():
+    try:
+        import hpi_e
+        hpi_e.flush_registrations()
+    except (ImportError, AttributeError):
+        pass
+
+def get_bfm(iname : str):
+    if iname in bfm_inst_map.keys():
+        return bfm_inst_map[iname]
+    return None
+
+# Returns instances of BFM type <tname>, in registration order
+def get_bfms(tname : str) -> []:
+    if tname in bfm_type_map.keys():
+        return bfm_type_map[tname].inst_list
+    return []
+
+#********************************************************************
+#* find_bfms()
+#*
+#* Returns BFM instances whose hierarchical path matches <pattern>
+#* (see inst_tree.find), optionally restricted to BFM type <tname>.
+#* For example: find_bfms("top.u_cluster3.**", "axi_master")
+#********************************************************************
+def find_bfms(pattern : str = "**", tname : str = None) -> []:
+    if tname != None:
+        if tname not in bfm_type_map.keys():
+            return []
+        cls = bfm_type_map[tname].cls
+        ret = [i for i in bfm_inst_tree.find(pattern) if type(i) == cls]
+    else:
+        ret = bfm_inst_tree.find(pattern)
+        
+    return sorted(ret, key=lambda i: i.ctxt)
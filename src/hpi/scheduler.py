@@ -7,9 +7,10 @@ Created on May 25, 2019
 @author: ballance
 '''
 import threading
+import time
 from threading import Lock
 from threading import Condition
-import traceback
+from hpi import log
 
 prv_active_mutex = Lock()
 prv_active_thread_started = False
@@ -18,36 +19,54 @@ prv_active_thread = None
 prv_active_thread_list = []
 prv_blocked_thread_list = []
 prv_threadset_changed = False
+prv_live_threads = set()
+prv_shutdown = False
+
+# Raised in a blocked SimThread to unwind it when the scheduler shuts down
+class SimThreadExit(BaseException):
+    pass
 
 class SimThreadData():
-    def __init__(self):
-        self.running = False
-        self.run_sem = threading.Semaphore(0)
+    __slots__ = ()
 
 class semaphore:
+    __slots__ = ('count', 'waiters')
+    
     def __init__(self, init=0):
         self.count = init
-        self.thread = None
+        # SimThreads blocked in get()
+        self.waiters = []
         
     def put(self, count=1):
         self.count += count
         
-        if self.thread != None:
-            self.thread.unblock()
+        if len(self.waiters) != 0:
+            # Each waiter re-checks the count when it runs, and waits
+            # again if another waiter took it first
+            waiters = self.waiters
+            self.waiters = []
+            for t in waiters:
+                t.unblock()
     
     def get(self, count=1):
         global prv_active_thread
         global prv_active_mutex
 
         prv_active_mutex.acquire()        
-        self.thread = prv_active_thread
+        thread = prv_active_thread
         prv_active_mutex.release()
         
         while self.count < count:
             prv_threadset_changed = True
-            self.thread.block()
+            self.waiters.append(thread)
+            thread.block()
 
-        self.thread = None
+        self.count -= count
+        
+    # Takes <count> without waiting, for callers that can't block (eg 
+    # import-task callbacks). The count may go negative, in which case
+    # waiters are not satisfied until puts have repaid it
+    def borrow(self, count=1):
         self.count -= count
     
 class ThreadGroup:
@@ -76,20 +95,27 @@ class ThreadGroup:
         self.sem.put(1);
 #        print("<-- thread_ended")
         
+#********************************************************************
+#* SimThread
+#*
+#* Both hand-offs between the scheduler and a thread (run, and 
+#* suspend) are made under a single per-thread lock. A condition 
+#* wait releases the lock atomically, so a notification can't be 
+#* sent before the other side is waiting for it
+#********************************************************************
 class SimThread(threading.Thread,SimThreadData):
     
     def __init__(self, func):
         threading.Thread.__init__(self)
-        SimThreadData.__init__(self)
         # Make SimThreads daemon threads to allow Python to shut down
         # with threads still active
         self.daemon = True
-        self.join_listeners = []
+        # Created on first use. Most threads are never joined
+        self.join_listeners = None
         self.func = func
-        self.run_mutex = Lock()
-        self.run_cond = Condition(self.run_mutex)
-        self.suspend_mutex = Lock()
-        self.suspend_cond = Condition(self.suspend_mutex)
+        self.lock = Lock()
+        self.run_cond = Condition(self.lock)
+        self.suspend_cond = Condition(self.lock)
         self.running = False
         self.alive = False
         
@@ -98,22 +124,32 @@ class SimThread(threading.Thread,SimThreadData):
         self.alive = True
         
 #        print("--> run")
+        # Hold the thread lock before announcing the thread, such that
+        # the scheduler can't run it before it waits to be run
+        self.lock.acquire()
         prv_active_mutex.acquire()
         prv_active_thread_list.append(self)
+        prv_live_threads.add(self)
         prv_active_thread_start_cond.notify()
         prv_active_mutex.release()
         
         prv_threadset_changed = True
    
-#        print("--> Wait to run")
-        self.thread_yield()
-#        print("<-- Wait to run")
-        
 #        print("--> calling function " + str(self.func))
         try:
+#            print("--> Wait to run")
+            self.thread_yield()
+#            print("<-- Wait to run")
             self.func()
+        except SimThreadExit:
+            # Scheduler is shutting down. Nothing waits on this thread
+            self.running = False
+            self.alive = False
+            prv_live_threads.discard(self)
+            return
         except:
-            print("Error: caught exception in SimThread")
+            log.error("caught exception in SimThread")
+            import traceback
             traceback.print_exc()
 #            print(e)
         
@@ -121,8 +157,9 @@ class SimThread(threading.Thread,SimThreadData):
 #        print("<-- run")
         
 #        print("--> notify listeners")
-        for l in self.join_listeners:
-            l.thread_ended(self)
+        if self.join_listeners != None:
+            for l in self.join_listeners:
+                l.thread_ended(self)
 #        print("<-- notify listeners")
         
         # TODO: cleanup after thread
@@ -131,27 +168,30 @@ class SimThread(threading.Thread,SimThreadData):
 #        print("--> final notification")
         self.running = False
         self.alive = False
-        self.suspend_mutex.acquire()
+        prv_live_threads.discard(self)
+        self.lock.acquire()
         self.suspend_cond.notify()
-        self.suspend_mutex.release()
+        self.lock.release()
 #        print("<-- final notification")
         
 #        print("Note: thread complete " + str(self))
 
     def add_join_listener(self, l):
+        if self.join_listeners == None:
+            self.join_listeners = []
         self.join_listeners.append(l)
         
     def block(self):
 #        print("--> block " + str(self))
         self.running = False
-        self.suspend_mutex.acquire()
+        self.lock.acquire()
         prv_threadset_changed = True
         self.suspend_cond.notify()
-        self.suspend_mutex.release()
-        
-        self.run_mutex.acquire()
         self.run_cond.wait()
-        self.run_mutex.release()
+        self.lock.release()
+        
+        if prv_shutdown:
+            raise SimThreadExit()
         
 #        print("<-- block " + str(self))
         
@@ -181,22 +221,22 @@ class SimThread(threading.Thread,SimThreadData):
         
 #        print("prv_active_thread: " + str(prv_active_thread))
         
-        self.run_mutex.acquire()
+        # Run the thread, then wait for it to suspend or exit
+        self.lock.acquire()
         self.run_cond.notify()
-        self.run_mutex.release()
-       
-        # wait for thread to suspend or exit
-        self.suspend_mutex.acquire()
         self.suspend_cond.wait()
-        self.suspend_mutex.release()
+        self.lock.release()
        
         return self.running
 
+    # Called with the thread lock held, when the thread starts
     def thread_yield(self):
 #        print("--> thread_yield")
-        self.run_mutex.acquire()
         self.run_cond.wait()
-        self.run_mutex.release()
+        self.lock.release()
+        
+        if prv_shutdown:
+            raise SimThreadExit()
 #        print("<-- thread_yield")
         
 def thread_active():
@@ -248,6 +288,32 @@ def int_thread_yield():
 def thread_block():
     pass
 
+#********************************************************************
+#* shutdown()
+#*
+#* Tears down all SimThreads at the end of simulation. Each blocked
+#* thread is woken and unwinds with SimThreadExit, such that the
+#* interpreter doesn't shut down with threads blocked on conditions
+#********************************************************************
+def shutdown(timeout=1.0):
+    global prv_shutdown
+    prv_shutdown = True
+    
+    threads = list(prv_live_threads)
+    deadline = time.monotonic() + timeout
+    for t in threads:
+        while t.is_alive() and time.monotonic() < deadline:
+            t.lock.acquire()
+            t.run_cond.notify()
+            t.lock.release()
+            # A thread that was just about to block may miss the first
+            # notification, so wake it again if it hasn't exited
+            t.join(0.001)
+
+    n_alive = sum(1 for t in threads if t.is_alive())
+    if n_alive != 0:
+        log.warn(str(n_alive) + " SimThreads did not exit at shutdown")
+
 def thread_create(func):
     global prv_active_mutex
     global prv_active_thread_start_cond
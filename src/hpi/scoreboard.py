@@ -0,0 +1,343 @@
+#****************************************************************************
+#* scoreboard.py
+#*
+#* Scoreboards for checking the transactions observed by monitors.
+#*
+#* stream_scoreboard collects expected and actual values of an in-order
+#* stream in arrays, and compares them in batches at flush points. The
+#* callback cost is an array append. Batches are compared with NumPy
+#* when it is available, and by comparing memoryviews otherwise.
+#*
+#* ooo_scoreboard matches transactions that complete out of order
+#* between keys (eg AXI IDs) and in order within a key. Outstanding
+#* expected transactions are held in a FIFO per key, so each match
+#* is O(1) regardless of the number outstanding.
+#****************************************************************************
+import array
+import collections
+import sys
+
+from hpi import log
+from hpi.recorder import now_f
+from hpi.scheduler import semaphore
+from hpi.scheduler import thread_active
+
+# Scoreboards checked by tb_fini
+prv_scoreboards = []
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#********************************************************************
+#* first_mismatch()
+#*
+#* Returns the index of the first element that differs between the
+#* first <n> elements of arrays <a> and <b>, or -1
+#********************************************************************
+def first_mismatch(a, b, n) -> int:
+    if numpy != None:
+        idx = numpy.flatnonzero(
+            numpy.frombuffer(a, dtype=a.typecode, count=n) !=
+            numpy.frombuffer(b, dtype=b.typecode, count=n))
+        return int(idx[0]) if len(idx) != 0 else -1
+
+    a_v = memoryview(a)[:n]
+    b_v = memoryview(b)[:n]
+    if a_v == b_v:
+        return -1
+    # Narrow down by halves, comparing each half in C
+    lo,hi = 0,n
+    while hi - lo > 64:
+        mid = (lo + hi) // 2
+        if a_v[lo:mid] == b_v[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    for i in range(lo, hi):
+        if a[i] != b[i]:
+            return i
+    return -1
+
+class stream_scoreboard():
+
+    #****************************************************************
+    #* __init__()
+    #*
+    #* <tc> is the array type code of the values (default 'Q', 64-bit
+    #* unsigned). Values are compared whenever <flush> actual values
+    #* have been collected (0 compares only on flush() and at the end
+    #* of simulation). <bfm> is the monitor BFM (or its instance name)
+    #* that supplies the actual values. When <timed> is False, the
+    #* actual-value callback is a bare array append and mismatches are
+    #* reported with the time range of the batch
+    #****************************************************************
+    def __init__(self,
+            name : str,
+            tc : str = 'Q',
+            flush : int = 4096,
+            bfm = None,
+            timed : bool = True,
+            max_errors : int = 10):
+        self.name = name
+        self.inst = bfm if bfm == None or type(bfm) == str else bfm.iname
+        self.exp = array.array(tc)
+        self.act = array.array(tc)
+        # Times are stored as the launcher returns them, to avoid a
+        # conversion per item
+        self.act_t = array.array('d')
+        self.timed = timed
+        self.flush_n = flush
+        self.max_errors = max_errors
+        self.n_errors = 0
+        self.n_checked = 0
+        self.now = now_f()
+        self.t_flush = 0
+        self.flush_at = flush if flush > 0 else sys.maxsize
+        self.fmt = str if tc in ('f', 'd') else hex
+
+        # Callbacks. Testbench code and monitors call these directly
+        self.expect = self.exp.append
+        self.expect_all = self.exp.extend
+        if not timed and flush == 0:
+            self.actual = self.act.append
+        else:
+            self.actual = self.gen_actual()
+        prv_scoreboards.append(self)
+
+    def gen_actual(self):
+        act = self.act
+        act_append = self.act.append
+        t_append = self.act_t.append
+        now = self.now
+
+        if self.timed:
+            def actual(v):
+                act_append(v)
+                t_append(now())
+                if len(act) >= self.flush_at:
+                    self.flush()
+        else:
+            def actual(v):
+                act_append(v)
+                if len(act) >= self.flush_at:
+                    self.flush()
+        return actual
+
+    #****************************************************************
+    #* flush()
+    #*
+    #* Compares the values collected on both sides, and discards them
+    #****************************************************************
+    def flush(self):
+        n = min(len(self.exp), len(self.act))
+        if n != 0:
+            i = first_mismatch(self.exp, self.act, n)
+            if i != -1:
+                self.mismatch(i, n)
+            del self.exp[:n]
+            del self.act[:n]
+            if self.timed:
+                del self.act_t[:n]
+            self.n_checked += n
+        self.t_flush = int(self.now())
+        if self.flush_n > 0:
+            self.flush_at = len(self.act) + self.flush_n
+
+    def mismatch(self, i, n):
+        # Only reached on failure, so the batch is counted item by item
+        count = 0
+        for j in range(i, n):
+            if self.exp[j] != self.act[j]:
+                count += 1
+
+        if self.n_errors < self.max_errors:
+            if self.timed:
+                when = "@ " + str(int(self.act_t[i])) + "ps"
+            else:
+                when = "between " + str(self.t_flush) + "ps and " + str(int(self.now())) + "ps"
+            msg = ("scoreboard " + self.name + ": item " + str(self.n_checked+i) +
+                   " " + when)
+            if self.inst != None:
+                msg += " on " + self.inst
+            msg += (": expect " + self.fmt(self.exp[i]) + " ; receive " + self.fmt(self.act[i]))
+            if count > 1:
+                msg += " (" + str(count-1) + " more mismatches in batch)"
+            log.error(msg)
+        self.n_errors += count
+
+    #****************************************************************
+    #* check()
+    #*
+    #* Compares outstanding values and reports values left without
+    #* a counterpart. Returns the number of errors
+    #****************************************************************
+    def check(self) -> int:
+        self.flush()
+        if len(self.exp) != 0:
+            log.error("scoreboard " + self.name + ": " + str(len(self.exp)) +
+                      " expected items not received")
+            self.n_errors += len(self.exp)
+            del self.exp[:]
+        if len(self.act) != 0:
+            log.error("scoreboard " + self.name + ": " + str(len(self.act)) +
+                      " unexpected items received")
+            self.n_errors += len(self.act)
+            del self.act[:]
+            del self.act_t[:]
+        return self.n_errors
+
+class ooo_scoreboard():
+
+    #****************************************************************
+    #* __init__()
+    #*
+    #* <key> returns the ordering key of a transaction, and is applied
+    #* to both expected and actual transactions. <compare> compares
+    #* an expected and actual transaction (default ==).
+    #*
+    #* When <max_outstanding> is non-zero, expect() blocks the calling
+    #* SimThread until fewer expected transactions are outstanding.
+    #* Called outside a SimThread (eg from an import task), expect()
+    #* doesn't block, and the excess is taken from the next credits
+    #* returned by actual().
+    #*
+    #* When <max_age> (ps) is non-zero, expected transactions that
+    #* are outstanding for longer are reported as leaked, once
+    #****************************************************************
+    def __init__(self,
+            name : str,
+            key = None,
+            compare = None,
+            max_outstanding : int = 0,
+            max_age : int = 0,
+            bfm = None,
+            max_errors : int = 10):
+        self.name = name
+        self.inst = bfm if bfm == None or type(bfm) == str else bfm.iname
+        self.key = key if key != None else (lambda t: t)
+        self.compare = compare
+        self.max_outstanding = max_outstanding
+        self.max_age = max_age
+        self.max_errors = max_errors
+        self.now = now_f()
+        # Key -> FIFO of [transaction, time, live] entries
+        self.pending = {}
+        # All entries in the order expected, for leak detection.
+        # Matched entries are discarded lazily
+        self.age_q = collections.deque()
+        self.n_outstanding = 0
+        self.n_matched = 0
+        self.n_errors = 0
+        self.n_leaked = 0
+        self.credit = semaphore(max_outstanding) if max_outstanding > 0 else None
+        prv_scoreboards.append(self)
+
+    def error(self, msg):
+        self.n_errors += 1
+        if self.n_errors <= self.max_errors:
+            hdr = "scoreboard " + self.name + " @ " + str(int(self.now())) + "ps"
+            if self.inst != None:
+                hdr += " on " + self.inst
+            log.error(hdr + ": " + msg)
+
+    #****************************************************************
+    #* expect()
+    #*
+    #* Adds an expected transaction
+    #****************************************************************
+    def expect(self, t):
+        if self.credit != None:
+            if thread_active() != None:
+                self.credit.get(1)
+            else:
+                self.credit.borrow(1)
+        k = self.key(t)
+        q = self.pending.get(k)
+        if q == None:
+            q = collections.deque()
+            self.pending[k] = q
+        ent = [t, self.now(), True]
+        q.append(ent)
+        self.n_outstanding += 1
+        if self.max_age > 0:
+            self.age_q.append(ent)
+            self.check_age(ent[1])
+
+    #****************************************************************
+    #* actual()
+    #*
+    #* Matches an observed transaction against the oldest expected
+    #* transaction with the same key. Never blocks, so may be called
+    #* from import-task callbacks
+    #****************************************************************
+    def actual(self, t):
+        k = self.key(t)
+        q = self.pending.get(k)
+        if q == None:
+            self.error("unexpected transaction " + str(t) + " (key " + str(k) + ")")
+            return
+        ent = q.popleft()
+        if len(q) == 0:
+            del self.pending[k]
+        ent[2] = False
+        self.n_outstanding -= 1
+        if self.credit != None:
+            self.credit.put(1)
+
+        if (ent[0] != t) if self.compare == None else not self.compare(ent[0], t):
+            self.error("expect " + str(ent[0]) + " ; receive " + str(t) + 
+                       " (key " + str(k) + ")")
+        else:
+            self.n_matched += 1
+
+        if self.max_age > 0:
+            self.check_age(self.now())
+
+    # Reports entries that have been outstanding for longer than max_age
+    def check_age(self, now):
+        age_q = self.age_q
+        while len(age_q) != 0:
+            ent = age_q[0]
+            if ent[2] and now - ent[1] <= self.max_age:
+                break
+            age_q.popleft()
+            if ent[2]:
+                self.n_leaked += 1
+                self.error("expected transaction " + str(ent[0]) + 
+                           " outstanding since " + str(int(ent[1])) + "ps")
+
+    def outstanding(self) -> int:
+        return self.n_outstanding
+
+    #****************************************************************
+    #* check()
+    #*
+    #* Reports expected transactions that were not observed. Returns
+    #* the number of errors
+    #****************************************************************
+    def check(self) -> int:
+        if self.max_age > 0:
+            # Transactions that leaked after the last expect() or 
+            # actual() are reported with their age
+            self.check_age(self.now())
+        if self.n_outstanding != 0:
+            self.n_errors += self.n_outstanding
+            msg = ("scoreboard " + self.name + ": " + str(self.n_outstanding) + 
+                   " expected transactions not received, on " + 
+                   str(len(self.pending)) + " keys")
+            for k,q in list(self.pending.items())[:4]:
+                msg += "\n  key " + str(k) + ": " + str(q[0][0]) + " since " + str(int(q[0][1])) + "ps"
+                if len(q) > 1:
+                    msg += " (+" + str(len(q)-1) + ")"
+            log.error(msg)
+            self.pending.clear()
+            self.age_q.clear()
+            self.n_outstanding = 0
+        return self.n_errors
+
+def check_all():
+    for sb in prv_scoreboards:
+        sb.check()
+    prv_scoreboards.clear()
@@ -0,0 +1,431 @@
+#****************************************************************************
+#* shm.py
+#*
+#* Runs the Python testbench in a separate process from the simulator
+#* (+hpi.shm). The simulator and testbench exchange calls through a pair
+#* of single-producer/single-consumer rings in a shared file:
+#*
+#*   0     header (magic, version, ring size)
+#*   64    simulator->testbench ring head (written by the simulator)
+#*   128   simulator->testbench ring tail (written by the testbench)
+#*   192   testbench->simulator ring head (written by the testbench)
+#*   256   testbench->simulator ring tail (written by the simulator)
+#*   4096  simulator->testbench ring data, then testbench->simulator data
+#*
+#* Head and tail are free-running byte counts. Each record starts with a
+#* 16-byte header (length, kind, tf index, id) and is 8-byte aligned.
+#* Records do not wrap; a PAD record fills the end of the ring when
+#* required. A record is written before the head that covers it. The
+#* simulator side uses acquire/release accesses for head and tail, but
+#* this module can't, so relies on the host making stores visible in
+#* program order (TSO). The channel is refused on other hosts.
+#*
+#* Import calls are posted by the simulator, and only SYNC (sent before
+#* simulation time advances), MAIN and FINI wait for the testbench to
+#* report that it is idle. Export calls made by the testbench are posted
+#* and applied by the simulator in order.
+#****************************************************************************
+import json
+import mmap
+import os
+import platform
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import types
+
+from hpi import log
+
+PAD         = 0
+HELLO       = 1
+REGISTER    = 2
+IMPORT      = 3
+TIME        = 4
+SYNC        = 5
+MAIN        = 6
+FINI        = 7
+IDLE        = 16
+EXPORT      = 17
+FINISH      = 18
+TIMEOUT     = 19
+TRACE       = 20
+
+S2P_HEAD    = 64
+S2P_TAIL    = 128
+P2S_HEAD    = 192
+P2S_TAIL    = 256
+DATA        = 4096
+
+MAGIC       = 0x52495048 # 'HPIR'
+VERSION     = 1
+RING_SIZE   = 4*1024*1024
+
+prv_hdr = struct.Struct("<II")
+prv_rec = struct.Struct("<IHHiI")
+prv_u32 = struct.Struct("<I")
+prv_u64 = struct.Struct("<Q")
+
+# State of the simulator side, once the testbench process is started
+prv_host = None
+
+# Polls before yielding the CPU while waiting. Spinning only helps when
+# the simulator and testbench can run on different cores
+prv_spin = 1000 if (os.cpu_count() or 1) > 1 else 0
+
+# Hosts whose memory model is TSO, as platform.machine() reports them
+prv_tso_machines = ("x86_64", "amd64", "x86", "i386", "i486", "i586", "i686")
+
+def check_host():
+    if platform.machine().lower() not in prv_tso_machines:
+        raise Exception("+hpi.shm is not supported on " + platform.machine() +
+                        " hosts: the Python side of the channel requires stores " +
+                        "to be visible in program order, as on x86. Run without " +
+                        "+hpi.shm")
+
+def align(n):
+    return (n + 7) & ~7
+
+#********************************************************************
+#* ring
+#*
+#* One direction of the channel. The index is the head for the
+#* producer side, and the tail for the consumer side
+#********************************************************************
+class ring():
+
+    def __init__(self, mm, head_off, tail_off, data_off, size, producer):
+        self.mm = mm
+        self.head_off = head_off
+        self.tail_off = tail_off
+        self.data_off = data_off
+        self.size = size
+        if producer:
+            self.idx = prv_u64.unpack_from(mm, head_off)[0]
+        else:
+            self.idx = prv_u64.unpack_from(mm, tail_off)[0]
+
+    def put(self, kind, tf, id, payload=b""):
+        mm = self.mm
+        n = align(16 + len(payload))
+        off = self.idx % self.size
+        need = n
+        if off + n > self.size:
+            need += self.size - off
+
+        count = 0
+        while self.size - (self.idx - prv_u64.unpack_from(mm, self.tail_off)[0]) < need:
+            count = backoff(count)
+
+        if off + n > self.size:
+            prv_rec.pack_into(mm, self.data_off+off, self.size-off, PAD, 0, 0, 0)
+            self.idx += self.size - off
+            off = 0
+
+        prv_rec.pack_into(mm, self.data_off+off, n, kind, tf, id, 0)
+        if len(payload) != 0:
+            mm[self.data_off+off+16:self.data_off+off+16+len(payload)] = payload
+        self.idx += n
+        prv_u64.pack_into(mm, self.head_off, self.idx)
+
+# Waits briefly, then with increasing delay, for the other side
+def backoff(count):
+    count += 1
+    if count < prv_spin:
+        pass
+    elif count < prv_spin+10000:
+        os.sched_yield()
+    else:
+        time.sleep(0.0001)
+    return count
+
+def pack_str(s):
+    b = s.encode() if type(s) == str else bytes(s)
+    return prv_u32.pack(len(b)) + b + bytes(align(4+len(b))-4-len(b))
+
+def unpack_str(mm, off):
+    n = prv_u32.unpack_from(mm, off)[0]
+    return (mm[off+4:off+4+n].decode(), off + align(4+n))
+
+def int_fmt(params):
+    return struct.Struct("<" + "".join(['Q' if p == 'lu' else 'q' for p in params]))
+
+# Returns a function that encodes the arguments of <tf>
+def arg_encoder(tf, nul=False):
+    params = [p.ptype for p in tf.params]
+    if 's' not in params:
+        fmt = int_fmt(params)
+        return lambda args: fmt.pack(*args)
+
+    def encode(args):
+        ret = b""
+        for p,a in zip(params, args):
+            if p == 's':
+                ret += pack_str(str(a).encode() + (b"\0" if nul else b""))
+            elif p == 'lu':
+                ret += prv_u64.pack(a)
+            else:
+                ret += struct.pack("<q", a)
+        return ret
+    return encode
+
+# Returns a function that decodes the arguments of <tf> at an offset
+def arg_decoder(tf):
+    params = [p.ptype for p in tf.params]
+    if 's' not in params:
+        fmt = int_fmt(params)
+        return lambda mm, off: fmt.unpack_from(mm, off)
+
+    def decode(mm, off):
+        args = []
+        for p in params:
+            if p == 's':
+                s,off = unpack_str(mm, off)
+                args.append(s.rstrip("\0"))
+            else:
+                args.append(struct.unpack_from(
+                    "<Q" if p == 'lu' else "<q", mm, off)[0])
+                off += 8
+        return args
+    return decode
+
+# Returns the declaration of BFM export task <name>
+def find_export(name):
+    from hpi import rgy
+    for info in rgy.bfm_type_map.values():
+        for tf in info.tf_list:
+            if not tf.is_imp and tf.tf_name() == name:
+                return tf
+    return None
+
+#********************************************************************
+#* import_table()
+#*
+#* Returns a map of task index to (method, argument decoder) for the 
+#* import tasks of the loaded testbench modules. The method is a name
+#* for BFM tasks, and a (module, name) pair for global tasks
+#********************************************************************
+def import_table(tf_idx):
+    from hpi import rgy
+    ret = {}
+
+    tf_l = [tf for tf in rgy.tf_global_list if tf.is_imp]
+    for info in rgy.bfm_type_map.values():
+        tf_l.extend([tf for tf in info.tf_list if tf.is_imp])
+    for tf in tf_l:
+        if tf.tf_name() in tf_idx.keys():
+            if tf.bfm != None:
+                name = tf.fname
+            else:
+                name = (tf.module, tf.fname)
+            ret[tf_idx[tf.tf_name()]] = (name, arg_decoder(tf))
+    return ret
+
+# Calls the import task with index <tf> on BFM <id>, with arguments
+# decoded from <mm> at <off>
+def call_import(imports, mm, tf, id, off):
+    from hpi import rgy
+    if tf not in imports.keys():
+        log.error("import-task index " + str(tf) + " is not known to the testbench")
+        return
+    name,decode = imports[tf]
+    args = decode(mm, off)
+
+    try:
+        if id == -1:
+            getattr(sys.modules[name[0]], name[1])(*args)
+        else:
+            getattr(rgy.bfm_list[id], name)(*args)
+    except Exception:
+        traceback.print_exc()
+
+def default_path():
+    if os.path.isdir("/dev/shm"):
+        d = "/dev/shm"
+    else:
+        d = tempfile.gettempdir()
+    return os.path.join(d, "hpi_" + str(os.getpid()) + ".shm")
+
+#********************************************************************
+#* start()
+#*
+#* Called by tb_init in the simulator process. Creates the channel,
+#* queues the testbench arguments and the table of import/export
+#* tasks, and starts the testbench process
+#********************************************************************
+def start(path, argv):
+    global prv_host
+    import hpi_e
+
+    check_host()
+    if path == None or path == "":
+        path = default_path()
+
+    # The generated code numbers tasks by their position in its profile table
+    tf_l = [[name,kind] for name,kind,count,time_ns in hpi_e.prof_data()]
+
+    with open(path, "wb") as fp:
+        fp.truncate(DATA + 2*RING_SIZE)
+    fd = os.open(path, os.O_RDWR)
+    mm = mmap.mmap(fd, DATA + 2*RING_SIZE)
+    os.close(fd)
+    prv_hdr.pack_into(mm, 0, MAGIC, VERSION)
+    prv_u64.pack_into(mm, 8, RING_SIZE)
+
+    s2p = ring(mm, S2P_HEAD, S2P_TAIL, DATA, RING_SIZE, True)
+    s2p.put(HELLO, 0, 0, pack_str(json.dumps({"argv" : argv, "tf" : tf_l})))
+    mm.close()
+
+    proc = subprocess.Popen([sys.executable, "-m", "hpi", "shm-tb", path])
+    log.info("started testbench process " + str(proc.pid) + " (" + path + ")")
+    log.flush()
+    hpi_e.shm_connect(path, proc.pid)
+    prv_host = (path, proc)
+
+def active() -> bool:
+    return prv_host != None
+
+def main():
+    import hpi_e
+    hpi_e.shm_main()
+
+def fini():
+    global prv_host
+    import hpi_e
+    path,proc = prv_host
+    prv_host = None
+
+    hpi_e.shm_fini()
+    status = proc.wait()
+    if status != 0:
+        log.error("testbench process exited with status " + str(status))
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return status
+
+#********************************************************************
+#* client
+#*
+#* Testbench side of the channel. Provides stand-ins for the hpi_e
+#* and hpi_l modules, and applies the calls posted by the simulator
+#********************************************************************
+class client():
+
+    def __init__(self, path):
+        check_host()
+        fd = os.open(path, os.O_RDWR)
+        self.size = os.fstat(fd).st_size
+        self.mm = mmap.mmap(fd, self.size)
+        os.close(fd)
+
+        magic,version = prv_hdr.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception("\"" + path + "\" is not a pyHPI channel")
+        ring_size = prv_u64.unpack_from(self.mm, 8)[0]
+
+        self.s2p = ring(self.mm, S2P_HEAD, S2P_TAIL, DATA, ring_size, False)
+        self.p2s = ring(self.mm, P2S_HEAD, P2S_TAIL, DATA+ring_size, ring_size, True)
+        self.simtime = 0
+        self.running = True
+        # Task name -> index in the simulator's table
+        self.tf_idx = {}
+        # Index -> (method name, argument decoder) for import tasks
+        self.imports = {}
+
+    def install(self):
+        hpi_e = types.ModuleType("hpi_e")
+        hpi_e.__getattr__ = self.get_export
+        sys.modules["hpi_e"] = hpi_e
+
+        hpi_l = types.ModuleType("hpi_l")
+        hpi_l.get_simtime = lambda: float(self.simtime)
+        hpi_l.finish = lambda: self.p2s.put(FINISH, 0, 0)
+        hpi_l.set_timeout = lambda t: self.p2s.put(TIMEOUT, 0, 0, prv_u64.pack(int(t)))
+        hpi_l.trace_on = lambda: self.p2s.put(TRACE, 0, 1)
+        hpi_l.trace_off = lambda: self.p2s.put(TRACE, 0, 0)
+        sys.modules["hpi_l"] = hpi_l
+
+    def get_export(self, name):
+        if name not in self.tf_idx.keys():
+            raise AttributeError("module 'hpi_e' has no export '" + name + "'")
+
+        idx = self.tf_idx[name]
+        tf = find_export(name)
+        if tf != None:
+            # Strings are passed to the HDL in place, so include a NUL
+            encode = arg_encoder(tf, True)
+            return lambda ctxt, *args: self.p2s.put(EXPORT, idx, ctxt, encode(args))
+        raise AttributeError("module 'hpi_e' has no export '" + name + "'")
+
+    def hello(self, off):
+        from hpi.tb_main import tb_init
+
+        msg = json.loads(unpack_str(self.mm, off+16)[0])
+        for i,(name,kind) in enumerate(msg["tf"]):
+            self.tf_idx[name] = i
+
+        tb_init(msg["argv"])
+        self.imports = import_table(self.tf_idx)
+
+    #****************************************************************
+    #* run()
+    #*
+    #* Applies records posted by the simulator until FINI
+    #****************************************************************
+    def run(self):
+        from hpi.tb_main import tb_main, tb_fini
+        from hpi import rgy
+        mm = self.mm
+        r = self.s2p
+        ppid = os.getppid()
+        count = 0
+
+        while self.running:
+            head = prv_u64.unpack_from(mm, r.head_off)[0]
+            if r.idx == head:
+                count = backoff(count)
+                if (count & 0x3FF) == 0 and os.getppid() != ppid:
+                    log.error("simulator process exited")
+                    break
+                continue
+            count = 0
+
+            while r.idx < head and self.running:
+                off = r.data_off + (r.idx % r.size)
+                n,kind,tf,id,rsvd = prv_rec.unpack_from(mm, off)
+
+                if kind == IMPORT:
+                    call_import(self.imports, mm, tf, id, off+16)
+                elif kind == TIME:
+                    self.simtime = prv_u64.unpack_from(mm, off+16)[0]
+                elif kind == SYNC:
+                    self.p2s.put(IDLE, 0, 0)
+                elif kind == REGISTER:
+                    tname,soff = unpack_str(mm, off+16)
+                    iname,soff = unpack_str(mm, soff)
+                    rgy.register_bfm(tname, iname, id)
+                elif kind == HELLO:
+                    self.hello(off)
+                elif kind == MAIN:
+                    tb_main()
+                    self.p2s.put(IDLE, 0, 0)
+                elif kind == FINI:
+                    tb_fini()
+                    self.running = False
+                    self.p2s.put(IDLE, 0, 0)
+                elif kind != PAD:
+                    log.error("unknown record kind " + str(kind) + " from simulator")
+                r.idx += n
+            prv_u64.pack_into(mm, r.tail_off, r.idx)
+
+def shm_tb(args):
+    c = client(args.channel)
+    c.install()
+    c.run()
+    log.flush()
+    sys.stdout.flush()
+    return 0
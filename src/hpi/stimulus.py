@@ -0,0 +1,197 @@
+#****************************************************************************
+#* stimulus.py
+#*
+#* Generates blocks of random transactions, one column per field, rather
+#* than calling random.randint per field per transaction. Each generator
+#* has its own bit generator, seeded from +hpi.seed and the generator
+#* name, such that the values don't depend on the order in which
+#* SimThreads run. Blocks are generated with NumPy when it is available.
+#*
+#*   gen = stimulus.generator("wr_seq", [
+#*       ("addr", stimulus.rand_range(0, 0xFFFF)),
+#*       ("kind", stimulus.rand_dist({0: 8, 1: 1, (2,7): 1})),
+#*       ("len",  stimulus.rand_range(1, lambda addr: 0x10000-addr, "addr"))])
+#*
+#*   for addr,kind,len in gen.items(10000):
+#*       ...
+#****************************************************************************
+import hashlib
+import itertools
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#********************************************************************
+#* stream_seed()
+#*
+#* Returns the seed of the named stream, derived from +hpi.seed.
+#* Without +hpi.seed, the seed is taken from the (unseeded) Python
+#* random-number generator
+#********************************************************************
+def stream_seed(name : str) -> int:
+    from hpi.tb_main import get_plusarg_int
+    seed = get_plusarg_int("hpi.seed")
+    if seed == None:
+        seed = random.getrandbits(64)
+    h = hashlib.sha256((str(seed) + ":" + name).encode()).digest()
+    return int.from_bytes(h[:8], "little")
+
+class field():
+    # Names of the fields this field depends on
+    deps = ()
+
+class rand_range(field):
+
+    #****************************************************************
+    #* __init__()
+    #*
+    #* Uniform value in [lo, hi]. When <dep> names an earlier field,
+    #* <lo> and <hi> may be functions of that field's value
+    #****************************************************************
+    def __init__(self, lo, hi, dep : str = None):
+        self.lo = lo
+        self.hi = hi
+        if dep != None:
+            self.deps = (dep,)
+        elif callable(lo) or callable(hi):
+            raise Exception("rand_range bounds may only be functions with a 'dep' field")
+
+    def gen(self, g, n, dep_cols):
+        lo,hi = self.lo,self.hi
+        if len(self.deps) != 0:
+            d = dep_cols[0]
+            lo = [lo(v) for v in d] if callable(lo) else [lo]*n
+            hi = [hi(v) for v in d] if callable(hi) else [hi]*n
+            if g.np != None:
+                return g.np.integers(lo, hi, endpoint=True, dtype=numpy.int64).tolist()
+            rr = g.rnd.randrange
+            return [rr(l, h+1) for l,h in zip(lo, hi)]
+
+        if g.np != None:
+            dt = numpy.uint64 if hi >= (1 << 63) else numpy.int64
+            return g.np.integers(lo, hi, size=n, endpoint=True, dtype=dt).tolist()
+        if hi - lo < (1 << 32):
+            return g.rnd.choices(range(lo, hi+1), k=n)
+        rr = g.rnd.randrange
+        return [rr(lo, hi+1) for i in range(n)]
+
+class rand_dist(field):
+
+    #****************************************************************
+    #* __init__()
+    #*
+    #* Weighted distribution. <dist> maps a value, or an inclusive
+    #* (lo,hi) range, to its weight. A range's weight is shared by
+    #* its values, as with SystemVerilog ':/'
+    #****************************************************************
+    def __init__(self, dist : dict):
+        self.buckets = []
+        self.weights = []
+        for k,w in dist.items():
+            self.buckets.append(k if type(k) == tuple else (k,k))
+            self.weights.append(w)
+        self.cum = list(itertools.accumulate(self.weights))
+        self.ranged = any(lo != hi for lo,hi in self.buckets)
+
+    def gen(self, g, n, dep_cols):
+        if g.np != None:
+            p = numpy.array(self.weights, dtype=float)
+            b = g.np.choice(len(self.buckets), size=n, p=p/p.sum())
+            lo = numpy.array([lo for lo,hi in self.buckets], dtype=numpy.int64)[b]
+            if not self.ranged:
+                return lo.tolist()
+            hi = numpy.array([hi for lo,hi in self.buckets], dtype=numpy.int64)[b]
+            return g.np.integers(lo, hi, endpoint=True).tolist()
+
+        b = g.rnd.choices(self.buckets, cum_weights=self.cum, k=n)
+        if not self.ranged:
+            return [lo for lo,hi in b]
+        rr = g.rnd.randrange
+        return [lo if lo == hi else rr(lo, hi+1) for lo,hi in b]
+
+class derive(field):
+
+    #****************************************************************
+    #* __init__()
+    #*
+    #* Value computed from earlier fields, by calling <func> with the
+    #* values of the named fields
+    #****************************************************************
+    def __init__(self, func, *deps):
+        self.func = func
+        self.deps = deps
+
+    def gen(self, g, n, dep_cols):
+        return list(map(self.func, *dep_cols))
+
+class generator():
+
+    #****************************************************************
+    #* __init__()
+    #*
+    #* <fields> is a list of (name, field) pairs. Fields may depend on
+    #* fields that precede them. <seed> overrides the seed derived
+    #* from +hpi.seed and <name>
+    #****************************************************************
+    def __init__(self,
+            name : str,
+            fields,
+            seed : int = None,
+            use_numpy : bool = True):
+        self.name = name
+        self.fields = fields
+        self.names = [n for n,f in fields]
+        self.seed = seed if seed != None else stream_seed(name)
+        self.rnd = random.Random(self.seed)
+        self.np = None
+        if use_numpy and numpy != None:
+            self.np = numpy.random.default_rng(self.seed)
+
+        # Resolve dependencies to column indices
+        self.dep_idx = []
+        for i,(n,f) in enumerate(fields):
+            idx = []
+            for d in f.deps:
+                if d not in self.names[:i]:
+                    raise Exception("field \"" + n + "\" depends on \"" + d +
+                                    "\", which isn't an earlier field")
+                idx.append(self.names.index(d))
+            self.dep_idx.append(idx)
+
+    #****************************************************************
+    #* block()
+    #*
+    #* Generates <n> transactions. Returns a list of columns (lists of
+    #* int), one per field
+    #****************************************************************
+    def block(self, n : int):
+        cols = []
+        for (name,f),idx in zip(self.fields, self.dep_idx):
+            cols.append(f.gen(self, n, [cols[i] for i in idx]))
+        return cols
+
+    #****************************************************************
+    #* items()
+    #*
+    #* Iterates over <count> transactions (unbounded when None), as
+    #* tuples in field order, generated <block> at a time
+    #****************************************************************
+    def items(self, count : int = None, block : int = 4096):
+        while count == None or count > 0:
+            n = block if count == None else min(block, count)
+            if count != None:
+                count -= n
+            yield from zip(*self.block(n))
+
+    #****************************************************************
+    #* feed()
+    #*
+    #* Calls <func> (eg a BFM method such as simple_bfm.xfer) with the
+    #* fields of each of <count> transactions
+    #****************************************************************
+    def feed(self, func, count : int, block : int = 4096):
+        for t in self.items(count, block):
+            func(*t)
@@ -4,18 +4,28 @@ Created on May 22, 2019
 @author: ballance
 '''
 import os
+import sys
 from hpi.rgy import entry_list
+from hpi.rgy import flush_registrations
 from hpi.scheduler import create_root_thread
 from hpi.scheduler import thread_yield
-from hpi.filelist_parser import FilelistParser
+from hpi import scheduler
+from hpi import loader
+from hpi import log
 
 class plusarg:
+    __slots__ = ('p', 'v')
+    
     def __init__(self, p, v):
         self.p = p;
         self.v = v;
         
 prv_argv = []
 prv_plusargs = []
+# Index of plusarg values by name
+prv_plusarg_m = {}
+# Converted values returned by the typed plusarg accessors
+prv_plusarg_cache = {}
 prv_objection_count = 0
 
 def raise_objection():
@@ -24,6 +34,9 @@ def raise_objection():
     
 def drop_objection():
     global prv_objection_count
+    if scheduler.prv_shutdown:
+        # Threads unwinding at shutdown. Simulation has already ended
+        return
     if prv_objection_count >= 1:
         prv_objection_count -= 1
         
@@ -31,38 +44,141 @@ def drop_objection():
         finish()
 
 def finish():
+        if scheduler.prv_shutdown:
+            # The model is finalized once the scheduler shuts down
+            return
         try:
             import hpi_l
             hpi_l.finish()
         except:
-            print("Error: failed to call 'hpi_l.finish'")
+            log.error("failed to call 'hpi_l.finish'")
             
-def get_plusarg_vals(key):
-    global prv_plusargs
-    ret = []
-    
-    for p in prv_plusargs:
-        if p.p == key:
-            ret.append(p.v)
+def trace_on():
+        try:
+            import hpi_l
+            hpi_l.trace_on()
+        except:
+            log.error("failed to call 'hpi_l.trace_on'")
+
+def trace_off():
+        try:
+            import hpi_l
+            hpi_l.trace_off()
+        except:
+            log.error("failed to call 'hpi_l.trace_off'")
+            
+def get_simtime():
+    import hpi_l
+    return hpi_l.get_simtime()
+
+def set_timeout(t):
+        try:
+            import hpi_l
+            hpi_l.set_timeout(int(t))
+        except:
+            log.error("failed to call 'hpi_l.set_timeout'")
+            
+# Returns True if argument <a> is +<key> or +<key>=<value>
+def is_plusarg(a, key):
+    return a == "+" + key or a.startswith("+" + key + "=")
 
-    if len(ret) == 0:
+def get_plusarg_vals(key):
+    if key not in prv_plusarg_m.keys():
         return None
-    else:
-        return ret
+    return list(prv_plusarg_m[key])
 
 def get_plusarg(key, dflt=None):
-    ret = None
+    if key not in prv_plusarg_m.keys():
+        return None
     
-    for p in prv_plusargs:
-        if p.p == key:
-            if p.v == None:
-                ret = dflt
-            else:
-                ret = p.v
-            break
+    v = prv_plusarg_m[key][0]
+    if v == None:
+        return dflt
+    return v
+
+# Returns a snapshot of all plusargs, as a dict of name to a list of
+# values. A plusarg specified without a value has a value of None
+def get_plusargs():
+    return {k : list(v) for k,v in prv_plusarg_m.items()}
+
+# Unit suffixes accepted by get_plusarg_time(), scaled to ps
+prv_time_units = {
+    "ps": 1,
+    "ns": 1000,
+    "us": 1000000,
+    "ms": 1000000000,
+    "s": 1000000000000
+    }
+
+def parse_int(v):
+    try:
+        return int(v, 0)
+    except ValueError:
+        # Base detection rejects leading zeros (eg a seed of 010)
+        return int(v, 10)
+
+def parse_bool(v):
+    if v == None:
+        # A bare +<key> enables the option
+        return True
+    if v.lower() in ("1", "true", "yes", "on"):
+        return True
+    if v.lower() in ("0", "false", "no", "off", ""):
+        return False
+    raise ValueError("invalid boolean \"" + v + "\"")
+
+def parse_time(v):
+    num = v.rstrip("psnumPSNUM")
+    unit = v[len(num):].lower()
+    if unit == "":
+        # As with the launchers' str2time(), a unit is required
+        raise ValueError("missing time unit (ps, ns, us, ms or s)")
+    if unit not in prv_time_units.keys():
+        raise ValueError("unknown time unit \"" + unit + "\"")
+    return int(round(float(num) * prv_time_units[unit]))
 
+#********************************************************************
+#* get_plusarg_typed()
+#*
+#* Returns the first value of plusarg <key> converted with <conv>, or
+#* <dflt> if the plusarg is not specified. Converted values are 
+#* cached, since knobs are often queried from per-transaction code
+#********************************************************************
+def get_plusarg_typed(key, conv, dflt, none_ok=False):
+    ckey = (key, conv)
+    if ckey in prv_plusarg_cache.keys():
+        return prv_plusarg_cache[ckey]
+    
+    if key not in prv_plusarg_m.keys():
+        return dflt
+    
+    v = prv_plusarg_m[key][0]
+    if v == None and not none_ok:
+        return dflt
+    
+    try:
+        ret = conv(v)
+    except ValueError as e:
+        raise Exception("Failed to parse plusarg +" + key + "=" + 
+                        str(v) + ": " + str(e))
+    prv_plusarg_cache[ckey] = ret
     return ret
 
+# Returns the value of +<key>=<n> as an integer. Decimal (including
+# with leading zeros), 0x, 0o and 0b forms are accepted
+def get_plusarg_int(key, dflt=None):
+    return get_plusarg_typed(key, parse_int, dflt)
+
+# Returns True for +<key>, or +<key>=1/true/yes/on. Returns False
+# for +<key>=0/false/no/off
+def get_plusarg_bool(key, dflt=False):
+    return get_plusarg_typed(key, parse_bool, dflt, True)
+
+# Returns the value of +<key>=<time> in ps. The time must have a
+# unit suffix (ps, ns, us, ms, s)
+def get_plusarg_time(key, dflt=None):
+    return get_plusarg_typed(key, parse_time, dflt)
+
 def tb_entry_wrapper(entry):
     raise_objection()
 
@@ -71,14 +187,32 @@ def tb_entry_wrapper(entry):
     finally:
         drop_objection()
 
+# Returns the hpi submodule <name> if it is loaded, and None otherwise.
+# Optional features are only loaded when enabled, so are only finalized
+# when loaded
+def loaded(name):
+    return sys.modules.get("hpi." + name)
+
 def tb_main():
     global entry_list
+    
+    replay = loaded("replay")
+    if replay != None:
+        replay.record_main()
+    shm = loaded("shm")
+    if shm != None and shm.active():
+        # The testbench runs in a separate process (+hpi.shm)
+        shm.main()
+        return
    
     # TODO: Select a default entry if one exists
 #    print("entry_list: size=" + str(len(entry_list.keys())))
 #    for e in entry_list.keys():
 #        print("Entry: " + e)
 
+    # BFMs queued with +hpi.bulk_register must exist before the test runs
+    flush_registrations()
+
     entry_l = get_plusarg_vals("hpi.entry")
     entry = None
     if entry_l == None:
@@ -100,6 +234,9 @@ def tb_main():
     else:
         raise Exception("Multiple +hpi.entry options specified")
 
+    # Messages from initialization are written before the test starts
+    log.flush()
+
     # Launch entry() in a new SimThread
     create_root_thread(lambda: tb_entry_wrapper(entry))
     
@@ -112,20 +249,27 @@ def tb_main():
             break
 
     if stable_count == -1:
-        print("Error: after 1000 iterations, all pyHPI threads are not blocked")
+        log.error("after 1000 iterations, all pyHPI threads are not blocked")
         
     if prv_objection_count == 0:
-        print("Warning: no objections raised by initial threads")
+        log.warn("no objections raised by initial threads")
         finish()
         
+    log.flush()
+        
     # TODO: should check to ensure that the hpi thread suspends in a 
     # reasonable amount of time
 
 def tb_init(argv):
     global prv_plusargs
     global prv_argv
-    timeout = 1000000 # 1ms (in ns)
-    print("tb_init: " + str(argv))
+    # Expanded filelists may be cached across runs
+    cache_dir = None
+    for arg in argv:
+        if arg == "+hpi.filelist_cache":
+            cache_dir = ".hpi_cache"
+        elif arg.startswith("+hpi.filelist_cache="):
+            cache_dir = arg[len("+hpi.filelist_cache="):]
     
     # Expand out arguments
     i=0
@@ -134,9 +278,10 @@ def tb_init(argv):
     while i < len(argv):
         if argv[i] == '-f' or argv[i] == '-F':
             filelist = argv[i+1]
-            print("filelist=\"" + filelist + "\"")
+            log.debug("filelist=\"" + filelist + "\"")
+            from hpi.filelist_parser import FilelistParser
             parser = FilelistParser(filelist, cwd, 
-                    (argv[i] == '-F'))
+                    (argv[i] == '-F'), cache_dir=cache_dir)
             fl_argv = parser.parse()
             
             for arg in fl_argv:
@@ -147,46 +292,132 @@ def tb_init(argv):
             prv_argv.append(argv[i])
         i+=1
     
+    prv_plusargs = []
+    prv_plusarg_m.clear()
+    prv_plusarg_cache.clear()
     i=0;
     while i < len(prv_argv):
         arg = prv_argv[i]
         if arg.startswith("+"):
             key = arg[1:]
             if key.find('=') != -1:
-                prv_plusargs.append(plusarg(
+                p = plusarg(
                     key[:key.find('=')],
-                    key[key.find('=')+1:]));
+                    key[key.find('=')+1:])
+            else:
+                p = plusarg(key, None)
+            prv_plusargs.append(p)
+            if p.p in prv_plusarg_m.keys():
+                prv_plusarg_m[p.p].append(p.v)
             else:
-                prv_plusargs.append(plusarg(key, None))
+                prv_plusarg_m[p.p] = [p.v]
         elif arg == "-f" or arg == "-F":
             filelist = prv_argv[i+1]
-            print("TODO: handle filelist \"" + filelist + "\"")
+            log.warn("TODO: handle filelist \"" + filelist + "\"")
             i += 1
         i += 1
             
+    verbosity = get_plusarg("hpi.verbosity")
+    if verbosity != None:
+        log.set_level(verbosity)
+    log.debug("tb_init: " + str(argv))
+    
+    # Arguments passed on to a testbench process or recorded. Recording
+    # and the channel are handled by the simulator process
+    tb_argv = [a for a in prv_argv if not is_plusarg(a, "hpi.record") and 
+                not is_plusarg(a, "hpi.shm")]
+
+    # Model evaluation is profiled in the simulator process, including
+    # with +hpi.shm
+    profile_file = get_plusarg("hpi.profile", "hpi_profile.json")
+    if profile_file != None:
+        from hpi import profile
+        profile.enable(profile_file)
+
+    record_file = get_plusarg("hpi.record", "hpi_record.bin")
+    if record_file != None:
+        from hpi import replay
+        replay.record(record_file, tb_argv)
+    
+    shm_path = get_plusarg("hpi.shm", "")
+    if shm_path != None:
+        # Run the testbench in a separate process. Only the launcher
+        # interface remains in this process
+        from hpi import shm
+        shm.start(shm_path, 
+            [a for a in tb_argv if not is_plusarg(a, "hpi.profile")])
+        return
+            
+    if get_plusarg_bool("hpi.bulk_register"):
+        try:
+            import hpi_e
+            hpi_e.set_bulk_register(1)
+        except (ImportError, AttributeError):
+            log.warn("+hpi.bulk_register is not supported by this launcher")
+
+    seed = get_plusarg_int("hpi.seed")
+    if seed != None:
+        import random
+        random.seed(seed)
+
+    coverage_file = get_plusarg("hpi.coverage", "hpi_coverage.cov")
+    if coverage_file != None:
+        from hpi import coverage
+        coverage.enable(coverage_file)
+
+    importtime_file = get_plusarg("hpi.importtime", "hpi_importtime.txt")
+    if importtime_file != None:
+        loader.enable_importtime(importtime_file)
+
+    # BFM-only modules may be deferred until the BFM type is first registered
+    for v in get_plusarg_vals("hpi.bfm_load") or []:
+        if v == None or v.find(':') == -1:
+            log.error("+hpi.bfm_load expects <bfm_type>:<module>")
+        else:
+            loader.bfm_lazy_map[v[:v.find(':')]] = v[v.find(':')+1:]
 
     for p in prv_plusargs:                
         if p.p == "hpi.load":
-            print("Loading \"" + p.v + "\"")
-            try:
-                __import__(p.v)
-            except:
-                print("Error: loading " + p.v)
+            loader.load(p.v)
         elif p.p == "hpi.entry":
-            if p.v.find("."):
+            if p.v.find(".") != -1:
                 # Load the module associated with the entry
-                m = p.v[:p.v.find(".")]
-                print("--> load module \"" + m + "\"")
-                try:
-                    __import__(m)
-                except:
-                    print("Error: loading " + m)
-                    raise
-                print("<-- load module \"" + m + "\"")
+                m = p.v[:p.v.rfind(".")]
+                if loader.load(m, "hpi.entry") == None:
+                    raise Exception("Failed to load module \"" + m + 
+                                    "\" for entry \"" + p.v + "\"")
 
-    try:
-        import hpi_l
-        hpi_l.set_timeout(timeout)
-    except:
-        print("Error: caught an execption")
+    # Simulation timeout (ps). Otherwise, the launcher's default applies
+    timeout = get_plusarg_time("hpi.timeout")
+    if timeout != None:
+        set_timeout(timeout)
+
+def tb_fini():
+    # Called by the launcher once simulation ends, before it flushes
+    # trace and coverage data
+    shm = loaded("shm")
+    if shm != None and shm.active():
+        shm.fini()
+    for name,fini in (
+            ("replay", "record_close"),
+            ("scoreboard", "check_all"),
+            ("recorder", "close_all")):
+        m = loaded(name)
+        if m != None:
+            getattr(m, fini)()
+    log.flush()
+    for name in ("profile", "coverage"):
+        m = loaded(name)
+        if m != None:
+            m.dump()
+    loader.dump_importtime()
+    scheduler.shutdown()
+
+def fast_exit(status=0):
+    # Exits without tearing down the interpreter. Intended for regression
+    # runs (+hpi.fast_exit), once the launcher has flushed its output
+    log.flush()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(status)
 
@@ -0,0 +1,93 @@
+#****************************************************************************
+#* build_bench.py
+#*
+#* Compares generating the launcher, BFM wrappers and DPI interface for
+#* a testbench with many BFM types with one 'python -m hpi' invocation
+#* per output, and with a single 'python -m hpi build'
+#****************************************************************************
+import argparse
+import filecmp
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+bfm_template = '''
+@hpi.bfm
+class bfm_${i}():
+
+    @hpi.export_task("i")
+    def req(self, data : int):
+        pass
+
+    @hpi.import_task()
+    def ack(self):
+        pass
+
+bfm_${i}.bfm_wrappers = {
+    bfm_wrapper_type.SV_DPI : """
+module bfm_${i}(input clk);
+    task bfm_${i}_req(int data);
+    endtask
+    export "DPI-C" task bfm_${i}_req;
+    import "DPI-C" context task bfm_${i}_ack(int id);
+    import "DPI-C" context function int bfm_${i}_register(string path);
+endmodule
+"""
+}
+'''
+
+def gen_tb(path, n):
+    with open(path, "w") as fp:
+        fp.write("import hpi\nfrom hpi.rgy import bfm_wrapper_type\n")
+        for i in range(n):
+            fp.write(bfm_template.replace("${i}", str(i)))
+
+def run(cmd, cwd):
+    out = subprocess.run([sys.executable, "-m", "hpi"] + cmd, cwd=cwd,
+        stdout=subprocess.DEVNULL)
+    if out.returncode != 0:
+        print("Error: " + " ".join(cmd) + " failed")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=150,
+            help="Number of BFM types")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        gen_tb(os.path.join(d, "many_bfms.py"), args.n)
+        os.environ["PYTHONPATH"] = d + os.pathsep + os.environ.get("PYTHONPATH", "")
+        os.makedirs(os.path.join(d, "sep"))
+
+        start = time.perf_counter()
+        run(["gen-launcher-vl", "-m", "many_bfms", "-clk", "clk=1ns", "-o", "sep/launcher_vl.cpp", "top"], d)
+        for i in range(args.n):
+            run(["gen-bfm-wrapper", "-m", "many_bfms", "-type", "sv-dpi", 
+                 "-o", "sep/bfm_" + str(i) + ".sv", "bfm_" + str(i)], d)
+        run(["gen-dpi", "-m", "many_bfms", "-o", "sep/pyhpi_dpi.c"], d)
+        t_sep = time.perf_counter() - start
+
+        start = time.perf_counter()
+        run(["build", "-m", "many_bfms", "-top", "top", "-clk", "clk=1ns", "-outdir", "one"], d)
+        t_one = time.perf_counter() - start
+
+        start = time.perf_counter()
+        run(["build", "-m", "many_bfms", "-top", "top", "-clk", "clk=1ns", "-outdir", "one"], d)
+        t_again = time.perf_counter() - start
+
+        names = sorted(os.listdir(os.path.join(d, "sep")))
+        match,mismatch,errors = filecmp.cmpfiles(os.path.join(d, "sep"), 
+            os.path.join(d, "one"), names, shallow=False)
+        if len(mismatch) != 0 or len(errors) != 0:
+            print("Error: outputs differ: " + str(mismatch + errors))
+            return 1
+
+    print("%d BFM types: separate commands %.2fs, build %.2fs, unchanged rebuild %.2fs" % (
+        args.n, t_sep, t_one, t_again))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
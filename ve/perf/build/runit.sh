@@ -0,0 +1,7 @@
+#!/bin/sh -x
+
+cwd=`pwd`
+export PYTHONPATH=$cwd/../../../src:$PYTHONPATH
+
+python3 build_bench.py
+if test $? -ne 0; then exit 1; fi
@@ -0,0 +1,104 @@
+#****************************************************************************
+#* coverage_bench.py
+#*
+#* Compares dict-of-counters coverage with hpi.coverage covergroups,
+#* sampling per transaction and in blocks, and measures merging the
+#* coverage files of many runs with 'hpi cov-merge'
+#****************************************************************************
+import argparse
+import array
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from hpi import coverage
+
+class dict_cov():
+
+    def __init__(self):
+        self.kind = {}
+        self.len = {}
+        self.cross = {}
+
+    def sample(self, kind, ln):
+        b_len = min(ln // 256, 15)
+        self.kind[kind] = self.kind.get(kind, 0) + 1
+        self.len[b_len] = self.len.get(b_len, 0) + 1
+        self.cross[(kind, b_len)] = self.cross.get((kind, b_len), 0) + 1
+
+def new_cg():
+    return coverage.covergroup("bus", [
+        coverage.coverpoint("kind", bins=list(range(8))),
+        coverage.coverpoint("len", lo=0, hi=4095, auto=16)],
+        crosses=[("kind", "len")])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=500000,
+            help="Number of samples")
+    parser.add_argument("-runs", type=int, default=200,
+            help="Number of coverage files to merge")
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    kind = [rnd.randrange(8) for i in range(args.n)]
+    ln = [rnd.randrange(4096) for i in range(args.n)]
+
+    d = dict_cov()
+    start = time.perf_counter()
+    for k,l in zip(kind, ln):
+        d.sample(k, l)
+    print("%-14s %8.1f ns/sample" % ("dict", 1e9*(time.perf_counter()-start)/args.n))
+
+    cg = new_cg()
+    start = time.perf_counter()
+    for k,l in zip(kind, ln):
+        cg.sample(k, l)
+    print("%-14s %8.1f ns/sample" % ("sample", 1e9*(time.perf_counter()-start)/args.n))
+
+    cg_b = new_cg()
+    start = time.perf_counter()
+    for i in range(0, args.n, 4096):
+        cg_b.sample_block(kind[i:i+4096], ln[i:i+4096])
+    print("%-14s %8.1f ns/sample" % ("sample_block", 1e9*(time.perf_counter()-start)/args.n))
+
+    if cg.counts != cg_b.counts:
+        print("Error: sample and sample_block counts differ")
+        return 1
+    for (k,b),c in d.cross.items():
+        if cg.counts[8+16+k*16+b] != c:
+            print("Error: cross bin " + str((k,b)) + " differs")
+            return 1
+
+    # Coverage files of <runs> runs, merged by a separate process
+    outdir = tempfile.mkdtemp()
+    try:
+        files = []
+        for r in range(args.runs):
+            files.append(os.path.join(outdir, "run_" + str(r) + ".cov"))
+            counts = array.array('Q')
+            for g in coverage.prv_covergroups:
+                counts.extend(g.counts)
+            coverage.write(files[-1], coverage.header(), counts)
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-m", "hpi", "cov-merge",
+            "-o", os.path.join(outdir, "merged.cov")] + files,
+            stdout=subprocess.PIPE)
+        wall = time.perf_counter() - start
+        if out.returncode != 0:
+            return 1
+        hdr,counts = coverage.read(os.path.join(outdir, "merged.cov"))[1:]
+        if hdr["runs"] != args.runs or counts[0] != args.runs*cg.counts[0]:
+            print("Error: bad merge")
+            return 1
+        print("cov-merge %d runs: %.3fs" % (args.runs, wall))
+    finally:
+        shutil.rmtree(outdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#****************************************************************************
+#* filelist_bench.py
+#*
+#* Measures filelist expansion time over a generated tree of nested
+#* filelists, after checking that -F filelists rebase their paths
+#****************************************************************************
+import argparse
+import os
+import tempfile
+import time
+
+from hpi.filelist_parser import FilelistParser
+
+def gen_tree(root, n_files, n_lines):
+    os.environ["HPI_BENCH_ROOT"] = root
+    
+    top = os.path.join(root, "top.f")
+    with open(top, "w") as top_fp:
+        top_fp.write("// Generated top-level filelist\n")
+        for i in range(n_files):
+            sub = os.path.join(root, "sub_" + str(i) + ".f")
+            top_fp.write("-f " + sub + "\n")
+            with open(sub, "w") as fp:
+                fp.write("/*\n * Generated filelist " + str(i) + "\n */\n")
+                fp.write("+incdir+${HPI_BENCH_ROOT}/inc_" + str(i) + "\n")
+                for j in range(n_lines):
+                    if j % 10 == 0:
+                        fp.write("// group " + str(j) + "\n")
+                    fp.write("$HPI_BENCH_ROOT/rtl/blk_" + str(i) + 
+                             "/file_" + str(j) + ".sv\n")
+    return top
+
+# Checks that paths in a -F filelist are rebased, including quoted paths
+def check_caps_f(root):
+    d = os.path.join(root, "caps_f")
+    os.makedirs(d)
+    with open(os.path.join(d, "files.f"), "w") as fp:
+        fp.write("plain.sv\n\"quoted file.sv\"\n-v \"lib dir/cells.v\"\n")
+
+    argv = FilelistParser(os.path.join("caps_f", "files.f"), root, True).parse()
+    expect = [
+        os.path.join(d, "plain.sv"),
+        '"' + os.path.join(d, "quoted file.sv") + '"',
+        "-v",
+        '"' + os.path.join(d, "lib dir", "cells.v") + '"']
+    if argv != expect:
+        raise Exception("-F expansion: expected " + str(expect) + 
+                        ", found " + str(argv))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-files", type=int, default=200,
+            help="Number of nested filelists")
+    parser.add_argument("-lines", type=int, default=1000,
+            help="Number of lines per nested filelist")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as root:
+        check_caps_f(root)
+        top = gen_tree(root, args.files, args.lines)
+        
+        start = time.perf_counter()
+        argv = FilelistParser(top, root, False).parse()
+        elapsed = time.perf_counter() - start
+        
+        print("Expanded " + str(len(argv)) + " arguments from " + 
+              str(args.files) + " filelists in %.3fs" % elapsed)
+        print("%.0f args/s" % (len(argv)/elapsed))
+        
+        # Same expansion, with included filelists read serially
+        start = time.perf_counter()
+        argv_s = FilelistParser(top, root, False, io_threads=0).parse()
+        elapsed = time.perf_counter() - start
+        
+        if argv_s != argv:
+            raise Exception("Serial expansion differs from concurrent expansion")
+        print("Serial reads in %.3fs" % elapsed)
+        
+        # Populate the expanded-filelist cache, then measure a hit
+        cache_dir = os.path.join(root, "cache")
+        FilelistParser(top, root, False, cache_dir=cache_dir).parse()
+        start = time.perf_counter()
+        argv_c = FilelistParser(top, root, False, cache_dir=cache_dir).parse()
+        elapsed = time.perf_counter() - start
+        
+        if argv_c != argv:
+            raise Exception("Cached expansion differs from parsed expansion")
+        print("Cache hit in %.3fs" % elapsed)
+
+if __name__ == "__main__":
+    main()
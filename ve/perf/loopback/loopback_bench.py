@@ -0,0 +1,31 @@
+#****************************************************************************
+#* loopback_bench.py
+#*
+#* Measures the rate at which BFM calls complete with the loopback 
+#* backend, using the testbench from ve/unit/bfm
+#****************************************************************************
+import argparse
+import os
+import sys
+
+import hpi
+from hpi import loopback
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=2,
+            help="Number of BFM instances")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "../../unit/bfm"))
+
+    bfms = []
+    for i in range(args.n):
+        bfms.append(("simple_bfm", "top.u_bfm_" + str(i)))
+
+    loopback.main(["+hpi.load=my_tb"], bfms, modules=["simple_bfm", "simple_rsp"])
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,14 @@
+#****************************************************************************
+#* simple_rsp.py
+#*
+#* Loopback responder for the simple_bfm used by the unit tests. Each
+#* request is acknowledged one cycle later, like the SV model
+#****************************************************************************
+from hpi.loopback import responder, ResponderBase
+
+@responder("simple_bfm")
+class simple_rsp(ResponderBase):
+
+    def req(self, data):
+        self.call(1, "ack")
+
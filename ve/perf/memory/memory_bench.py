@@ -0,0 +1,78 @@
+#****************************************************************************
+#* memory_bench.py
+#*
+#* Measures the per-instance memory of BFM instances (plain and 
+#* BfmBase-derived), alone and including registry entries, and of
+#* SimThread objects
+#****************************************************************************
+import argparse
+import gc
+import tracemalloc
+
+import hpi
+from hpi import rgy
+from hpi.scheduler import SimThread
+
+@hpi.bfm
+class plain_bfm():
+
+    def __init__(self):
+        self.ack_sem = hpi.semaphore()
+        self.count = 0
+
+@hpi.bfm
+class slots_bfm(hpi.BfmBase):
+    __slots__ = ('ack_sem', 'count')
+
+    def __init__(self):
+        self.ack_sem = hpi.semaphore()
+        self.count = 0
+
+# Returns the bytes allocated per call of <func>, averaged over <n> calls
+def measure(n, func):
+    keep = []
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for i in range(n):
+        keep.append(func(i))
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used / n
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=5000,
+            help="Number of instances to create")
+    args = parser.parse_args()
+
+    ctxt = [0]
+    def register(tname):
+        def f(i):
+            rgy.register_bfm(tname,
+                "top.u_cluster" + str(i%16) + ".u_" + tname + str(i), ctxt[0])
+            ctxt[0] += 1
+        return f
+
+    def create(cls):
+        def f(i):
+            inst = cls()
+            inst.iname = "top.u_bfm"
+            inst.ctxt = i
+            return inst
+        return f
+
+    print("%-28s %10s" % ("Object", "Bytes"))
+    print("%-28s %10.0f" % ("BFM instance (plain class)",
+            measure(args.n, create(plain_bfm))))
+    print("%-28s %10.0f" % ("BFM instance (BfmBase)",
+            measure(args.n, create(slots_bfm))))
+    print("%-28s %10.0f" % ("Registered BFM (plain)",
+            measure(args.n, register("plain_bfm"))))
+    print("%-28s %10.0f" % ("Registered BFM (BfmBase)",
+            measure(args.n, register("slots_bfm"))))
+    print("%-28s %10.0f" % ("SimThread (not started)",
+            measure(args.n, lambda i: SimThread(None))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#****************************************************************************
+#* recorder_bench.py
+#*
+#* Compares the cost of capturing monitor transactions by appending
+#* tuples to a list, by print(), and with hpi.recorder. Reports the
+#* per-transaction time and the peak memory of each
+#****************************************************************************
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from hpi.recorder import recorder
+from hpi.recorder import reader
+
+def run_list(n, outdir):
+    txn_l = []
+    for i in range(n):
+        txn_l.append((i, i & 0xFF, i*4, 1))
+    return txn_l
+
+def run_print(n, outdir):
+    with open(os.path.join(outdir, "txn.log"), "w") as fp:
+        for i in range(n):
+            print("%d: addr=0x%08x data=0x%08x write=%d" % (i, i & 0xFF, i*4, 1), file=fp)
+
+def run_recorder(n, outdir):
+    r = recorder(os.path.join(outdir, "txn"), 
+        [("addr", 'I'), ("data", 'Q'), ("write", 'B')])
+    add = r.add_t
+    for i in range(n):
+        add(i, i & 0xFF, i*4, 1)
+    r.close()
+
+def measure(name, func, n):
+    outdir = tempfile.mkdtemp()
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        func(n, outdir)
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(outdir)
+    print("%-10s %8.1f ns/txn %10.1f KiB peak" % (name, 1e9*wall/n, peak/1024))
+
+def check(n):
+    outdir = tempfile.mkdtemp()
+    try:
+        run_recorder(n, outdir)
+        rd = reader(os.path.join(outdir, "txn"))
+        if rd.count != n:
+            print("Error: expect " + str(n) + " rows ; receive " + str(rd.count))
+            return 1
+        data = rd.column("data")
+        if data[n-1] != (n-1)*4:
+            print("Error: bad data in last row")
+            return 1
+        rows = rd.rows(n//2, n//2+10)
+        if rows != range(n//2, n//2+10):
+            print("Error: bad time window " + str(rows))
+            return 1
+    finally:
+        shutil.rmtree(outdir)
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=1000000,
+            help="Number of transactions to capture")
+    args = parser.parse_args()
+
+    if check(200000) != 0:
+        return 1
+    measure("list", run_list, args.n)
+    measure("print", run_print, args.n)
+    measure("recorder", run_recorder, args.n)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+/****************************************************************************
+ * reg_bench.c
+ *
+ * Measures the time to register BFM instances through the generated 
+ * DPI interface, as a large array of BFMs would during elaboration. 
+ * svGetScope/svSetScope and the exported task are stubbed out
+ ****************************************************************************/
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include "Python.h"
+
+int pyhpi_init(void);
+int reg_bfm_register(const char *iname);
+void reg_bfm_ack(int id);
+
+static int prv_argc;
+static char **prv_argv;
+static int prv_scope;
+
+void *svGetScope(void) {
+    return &prv_scope;
+}
+
+void svSetScope(void *scope) { }
+
+void reg_bfm_req(int data) { }
+
+int pyhpi_launcher_init(void) {
+    PyObject *hpi, *args, *ret;
+    int i;
+
+    pyhpi_init();
+    Py_Initialize();
+
+    args = PyList_New(0);
+    for (i=0; i<prv_argc; i++) {
+        PyObject *arg = PyUnicode_FromString(prv_argv[i]);
+        PyList_Append(args, arg);
+        Py_DECREF(arg);
+    }
+
+    if (!(hpi = PyImport_ImportModule("hpi"))) {
+        PyErr_Print();
+        exit(1);
+    }
+    if (!(ret = PyObject_CallMethod(hpi, "tb_init", "O", args))) {
+        PyErr_Print();
+        exit(1);
+    }
+    Py_DECREF(ret);
+    Py_DECREF(args);
+    Py_DECREF(hpi);
+
+    return 1;
+}
+
+static double now(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec*1e-9;
+}
+
+int main(int argc, char **argv) {
+    int n = 100000, i;
+    char iname[64];
+    double start, t_reg, t_flush;
+    PyObject *hpi, *ret;
+    
+    // Options: [-n <count>] [+plusarg ...]
+    for (i=1; i<argc; i++) {
+        if (!strcmp(argv[i], "-n") && i+1 < argc) {
+            n = atoi(argv[++i]);
+        } else {
+            break;
+        }
+    }
+    prv_argc = argc-i;
+    prv_argv = &argv[i];
+
+    start = now();
+    for (i=0; i<n; i++) {
+        sprintf(iname, "top.u_cluster%d.u_bfm%d", i%64, i);
+        if (reg_bfm_register(iname) != i) {
+            fprintf(stderr, "Error: registration %d returned the wrong id\n", i);
+            return 1;
+        }
+    }
+    t_reg = now() - start;
+
+    // Queued registrations are created when the testbench starts
+    hpi = PyImport_ImportModule("hpi.rgy");
+    ret = PyObject_CallMethod(hpi, "flush_registrations", 0);
+    Py_XDECREF(ret);
+    t_flush = now() - start;
+
+    // Check that the last instance is reachable
+    reg_bfm_ack(n-1);
+    ret = PyObject_CallMethod(hpi, "get_bfm", "s", iname);
+    if (!ret || ret == Py_None) {
+        fprintf(stderr, "Error: instance %s is not registered\n", iname);
+        return 1;
+    }
+    Py_DECREF(ret);
+    Py_DECREF(hpi);
+
+    printf("%d registrations: %.3fs in register calls, %.3fs total (%.0f/s)\n",
+        n, t_reg, t_flush, n/t_flush);
+
+    return 0;
+}
+
@@ -0,0 +1,22 @@
+#****************************************************************************
+#* reg_bfm.py
+#*
+#* BFM used by the registration benchmark
+#****************************************************************************
+import hpi
+
+@hpi.bfm
+class reg_bfm(hpi.BfmBase):
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+    @hpi.export_task("i")
+    def req(self, data : int):
+        pass
+
+    @hpi.import_task()
+    def ack(self):
+        self.count += 1
+
@@ -0,0 +1,21 @@
+#!/bin/sh -x
+
+cwd=`pwd`
+export PYTHONPATH=$cwd/../../../src:$cwd:$PYTHONPATH
+
+mkdir -p build
+python3 -m hpi gen-dpi -m reg_bfm -o build/pyhpi_dpi.c
+if test $? -ne 0; then exit 1; fi
+
+CFLAGS="`python3-config --cflags`"
+LDFLAGS="`python3-config --ldflags --embed`"
+
+gcc -o build/reg_bench ${CFLAGS} reg_bench.c build/pyhpi_dpi.c ${LDFLAGS}
+if test $? -ne 0; then exit 1; fi
+
+./build/reg_bench -n 100000 +hpi.load=reg_bfm
+if test $? -ne 0; then exit 1; fi
+
+./build/reg_bench -n 100000 +hpi.load=reg_bfm +hpi.bulk_register
+if test $? -ne 0; then exit 1; fi
+
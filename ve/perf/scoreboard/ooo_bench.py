@@ -0,0 +1,109 @@
+#****************************************************************************
+#* ooo_bench.py
+#*
+#* Compares a list-scanning out-of-order scoreboard with 
+#* hpi.scoreboard.ooo_scoreboard as the number of outstanding
+#* transactions grows. Responses complete in random order across IDs,
+#* and in order within an ID
+#****************************************************************************
+import argparse
+import random
+import sys
+import time
+
+from hpi import log
+from hpi.scoreboard import ooo_scoreboard
+
+class list_scoreboard():
+
+    def __init__(self):
+        self.exp_l = []
+        self.n_errors = 0
+
+    def expect(self, t):
+        self.exp_l.append(t)
+
+    def actual(self, t):
+        for i,e in enumerate(self.exp_l):
+            if e[0] == t[0]:
+                if e != t:
+                    self.n_errors += 1
+                self.exp_l.pop(i)
+                return
+        self.n_errors += 1
+
+def gen(n, n_ids, seed=1):
+    rnd = random.Random(seed)
+    exp = [(rnd.randrange(n_ids), i) for i in range(n)]
+    # Interleave the per-ID streams randomly, keeping per-ID order
+    per_id = {}
+    for t in exp:
+        per_id.setdefault(t[0], []).append(t)
+    act = []
+    ids = list(per_id.keys())
+    pos = {k : 0 for k in ids}
+    while len(ids) != 0:
+        k = ids[rnd.randrange(len(ids))]
+        act.append(per_id[k][pos[k]])
+        pos[k] += 1
+        if pos[k] == len(per_id[k]):
+            ids.remove(k)
+    return exp,act
+
+def run(sb, exp, act):
+    start = time.perf_counter()
+    for t in exp:
+        sb.expect(t)
+    for t in act:
+        sb.actual(t)
+    return time.perf_counter() - start
+
+def check():
+    t = [0]
+    sb = ooo_scoreboard("check", key=lambda t: t[0], max_outstanding=4, max_age=100)
+    sb.now = lambda: t[0]
+    for i in range(6):
+        sb.expect((i % 2, i))
+    if sb.credit.count != -2:
+        print("Error: expect credit -2 ; receive " + str(sb.credit.count))
+        return 1
+    sb.actual((1, 1))
+    sb.actual((0, 0))
+    sb.actual((0, 9))
+    t[0] = 200
+    sb.actual((1, 3))
+    # (0,9) mismatches (0,2); (0,4) and (1,5) leak
+    if sb.n_errors != 3 or sb.n_leaked != 2 or sb.outstanding() != 2:
+        print("Error: errors=%d leaked=%d outstanding=%d" % (
+            sb.n_errors, sb.n_leaked, sb.outstanding()))
+        return 1
+    sb.check()
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-ids", type=int, default=16,
+            help="Number of transaction IDs")
+    args = parser.parse_args()
+
+    # Errors are expected, so are not reported
+    log.set_level(log.NONE)
+    ret = check()
+    log.set_level(log.INFO)
+    if ret != 0:
+        return 1
+
+    for n in (1000, 4000, 16000):
+        exp,act = gen(n, args.ids)
+        res = []
+        for sb in (list_scoreboard(), ooo_scoreboard("bench", key=lambda t: t[0])):
+            wall = run(sb, exp, act)
+            if sb.n_errors != 0:
+                print("Error: " + str(sb.n_errors) + " errors")
+                return 1
+            res.append(1e9*wall/n)
+        print("%6d outstanding: list %9.1f ns/txn  ooo %7.1f ns/txn" % (n, res[0], res[1]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+#!/bin/sh -x
+
+cwd=`pwd`
+export PYTHONPATH=$cwd/../../../src:$PYTHONPATH
+
+python3 scoreboard_bench.py
+if test $? -ne 0; then exit 1; fi
+
+python3 ooo_bench.py
+if test $? -ne 0; then exit 1; fi
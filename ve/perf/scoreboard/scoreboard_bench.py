@@ -0,0 +1,77 @@
+#****************************************************************************
+#* scoreboard_bench.py
+#*
+#* Compares an in-order checker that compares each transaction in the
+#* monitor callback with hpi.scoreboard.stream_scoreboard
+#****************************************************************************
+import argparse
+import collections
+import sys
+import time
+
+from hpi import log
+from hpi.scoreboard import stream_scoreboard
+
+class item_checker():
+
+    def __init__(self):
+        self.exp_q = collections.deque()
+        self.n_errors = 0
+
+    def expect(self, v):
+        self.exp_q.append(v)
+
+    def actual(self, v):
+        e = self.exp_q.popleft()
+        if e != v:
+            self.n_errors += 1
+
+def run(sb, n):
+    expect = sb.expect
+    actual = sb.actual
+    start = time.perf_counter()
+    for i in range(n):
+        expect(i*3)
+        actual(i*3)
+    if hasattr(sb, "check"):
+        sb.check()
+    return time.perf_counter() - start
+
+def check():
+    # The first mismatch is reported, and all are counted
+    sb = stream_scoreboard("check", flush=1000)
+    for i in range(10000):
+        sb.expect(i)
+        sb.actual(i if i not in (4321, 4500) else 0)
+    if sb.check() != 2:
+        print("Error: expect 2 errors ; receive " + str(sb.n_errors))
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=1000000,
+            help="Number of transactions to check")
+    args = parser.parse_args()
+
+    # Mismatches are expected, so are not reported
+    log.set_level(log.NONE)
+    ret = check()
+    log.set_level(log.INFO)
+    if ret != 0:
+        return 1
+
+    for name,sb in (
+            ("per-item", item_checker()),
+            ("stream", stream_scoreboard("timed")),
+            ("stream-untimed", stream_scoreboard("untimed", timed=False)),
+            ("stream-append", stream_scoreboard("append", timed=False, flush=0))):
+        wall = run(sb, args.n)
+        if sb.n_errors != 0:
+            print("Error: " + name + " reported " + str(sb.n_errors) + " errors")
+            return 1
+        print("%-16s %8.1f ns/txn" % (name, 1e9*wall/args.n))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
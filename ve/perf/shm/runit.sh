@@ -0,0 +1,39 @@
+#!/bin/sh -x
+
+# Compares the ve/unit/bfm testbench run in the simulator process and
+# in a separate process over a shared-memory channel (+hpi.shm)
+cwd=`pwd`
+bfm_dir=$cwd/../../unit/bfm
+export PYTHONPATH=$cwd/../../../src:$bfm_dir:$PYTHONPATH
+
+rm -rf build
+mkdir -p build
+cd build
+
+python3 -m hpi gen-launcher-vl top -clk clk=1ns 
+if test $? -ne 0; then exit 1; fi
+
+python3 -m hpi gen-bfm-wrapper -m my_tb simple_bfm -type sv-dpi
+if test $? -ne 0; then exit 1; fi
+
+python3 -m hpi gen-dpi -m my_tb
+if test $? -ne 0; then exit 1; fi
+
+CFLAGS="${CFLAGS} `python3-config --cflags`"
+LDFLAGS="${LDFLAGS} `python3-config --ldflags --embed`"
+
+verilator --cc --exe -Wno-fatal \
+	$bfm_dir/top.sv simple_bfm.sv \
+	launcher_vl.cpp pyhpi_dpi.c \
+	-CFLAGS "${CFLAGS}" -LDFLAGS "${LDFLAGS}"
+if test $? -ne 0; then exit 1; fi
+
+make -C obj_dir -f Vtop.mk
+if test $? -ne 0; then exit 1; fi
+
+time ./obj_dir/Vtop +hpi.load=my_tb +vl.timeout=1ms
+if test $? -ne 0; then exit 1; fi
+
+time ./obj_dir/Vtop +hpi.load=my_tb +vl.timeout=1ms +hpi.shm
+if test $? -ne 0; then exit 1; fi
+
@@ -0,0 +1,17 @@
+#!/bin/sh -x
+
+cwd=`pwd`
+export PYTHONPATH=$cwd/../../../src:$PYTHONPATH
+
+python3 startup_bench.py
+if test $? -ne 0; then exit 1; fi
+
+mkdir -p build
+CFLAGS="`python3-config --cflags`"
+LDFLAGS="`python3-config --ldflags --embed`"
+
+gcc -o build/startup_embed ${CFLAGS} startup_embed.c ${LDFLAGS}
+if test $? -ne 0; then exit 1; fi
+
+./build/startup_embed
+if test $? -ne 0; then exit 1; fi
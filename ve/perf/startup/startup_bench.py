@@ -0,0 +1,47 @@
+#****************************************************************************
+#* startup_bench.py
+#*
+#* Measures the wall time of 'import hpi' and of 'python -m hpi' 
+#* subcommands, each as the median of several runs
+#****************************************************************************
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+def measure(cmd, n, cwd):
+    t_l = []
+    for i in range(n):
+        start = time.perf_counter()
+        out = subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL)
+        t_l.append(time.perf_counter() - start)
+        if out.returncode != 0:
+            print("Error: " + " ".join(cmd) + " failed")
+            sys.exit(1)
+    return 1000*statistics.median(t_l)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=20,
+            help="Number of runs of each command")
+    args = parser.parse_args()
+
+    py = sys.executable
+    with tempfile.TemporaryDirectory() as d:
+        base = measure([py, "-c", "pass"], args.n, d)
+        print("%-40s %7.1f ms" % ("python -c pass", base))
+        for name,cmd in (
+                ("import hpi", [py, "-c", "import hpi"]),
+                ("python -m hpi list-bfms", [py, "-m", "hpi", "list-bfms"]),
+                ("python -m hpi gen-launcher-vl", 
+                    [py, "-m", "hpi", "gen-launcher-vl", "-clk", "clk=1ns", "-o", "l.cpp", "top"]),
+                ("python -m hpi gen-launcher-sv", 
+                    [py, "-m", "hpi", "gen-launcher-sv"])):
+            t = measure(cmd, args.n, d)
+            print("%-40s %7.1f ms (+%.1f ms)" % (name, t, t-base))
+
+if __name__ == "__main__":
+    main()
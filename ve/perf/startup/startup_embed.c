@@ -0,0 +1,45 @@
+/****************************************************************************
+ * startup_embed.c
+ *
+ * Measures the time taken by an embedded interpreter to import hpi, as
+ * the launchers do with PyImport_ImportModule("hpi"), and to look up
+ * the entry points that the launcher calls first
+ ****************************************************************************/
+#include <stdio.h>
+#include <time.h>
+#include "Python.h"
+
+static double now_ms(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec*1000.0 + ts.tv_nsec/1000000.0;
+}
+
+int main(int argc, char **argv) {
+    PyObject *hpi, *f;
+    double start, t_import, t_init;
+
+    Py_Initialize();
+
+    start = now_ms();
+    if (!(hpi = PyImport_ImportModule("hpi"))) {
+        PyErr_Print();
+        return 1;
+    }
+    t_import = now_ms() - start;
+
+    start = now_ms();
+    if (!(f = PyObject_GetAttrString(hpi, "tb_init"))) {
+        PyErr_Print();
+        return 1;
+    }
+    Py_DECREF(f);
+    t_init = now_ms() - start;
+
+    fprintf(stdout, "embedded: import hpi %.2f ms, hpi.tb_init %.2f ms\n", 
+            t_import, t_init);
+
+    Py_DECREF(hpi);
+    Py_Finalize();
+    return 0;
+}
@@ -0,0 +1,76 @@
+#****************************************************************************
+#* stimulus_bench.py
+#*
+#* Compares generating transactions with per-field random.randint calls
+#* with generating them in blocks with hpi.stimulus
+#****************************************************************************
+import argparse
+import random
+import sys
+import time
+
+from hpi import stimulus
+
+def gen_per_item(n):
+    rnd = random.Random(1)
+    kinds = [0, 1, 2, 3, 4, 5, 6, 7]
+    weights = [8, 1, 1/6, 1/6, 1/6, 1/6, 1/6, 1/6]
+    s = 0
+    for i in range(n):
+        addr = rnd.randint(0, 0xFFFF)
+        kind = rnd.choices(kinds, weights)[0]
+        ln = rnd.randint(1, 0x10000-addr)
+        s += addr + kind + ln
+    return s
+
+def gen_block(n, use_numpy):
+    gen = stimulus.generator("bench", [
+        ("addr", stimulus.rand_range(0, 0xFFFF)),
+        ("kind", stimulus.rand_dist({0: 8, 1: 1, (2,7): 1})),
+        ("len",  stimulus.rand_range(1, lambda addr: 0x10000-addr, "addr"))],
+        seed=1, use_numpy=use_numpy)
+    s = 0
+    for addr,kind,ln in gen.items(n):
+        s += addr + kind + ln
+    return s
+
+def check():
+    gen = stimulus.generator("check", [
+        ("addr", stimulus.rand_range(0, 0xFFFF)),
+        ("kind", stimulus.rand_dist({0: 8, 1: 1, (2,7): 1})),
+        ("len",  stimulus.rand_range(1, lambda addr: 0x10000-addr, "addr")),
+        ("end",  stimulus.derive(lambda addr,ln: addr+ln, "addr", "len"))],
+        seed=1)
+    n_zero = 0
+    for addr,kind,ln,end in gen.items(100000):
+        if addr > 0xFFFF or kind > 7 or ln < 1 or end > 0x10000 or end != addr+ln:
+            print("Error: bad transaction " + str((addr,kind,ln,end)))
+            return 1
+        n_zero += (kind == 0)
+    if abs(n_zero/100000 - 0.8) > 0.01:
+        print("Error: kind=0 frequency " + str(n_zero/100000))
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=500000,
+            help="Number of transactions to generate")
+    args = parser.parse_args()
+
+    if check() != 0:
+        return 1
+
+    runs = [("per-item", lambda: gen_per_item(args.n)),
+            ("block", lambda: gen_block(args.n, False))]
+    if stimulus.numpy != None:
+        runs.append(("block-numpy", lambda: gen_block(args.n, True)))
+    for name,f in runs:
+        start = time.perf_counter()
+        f()
+        wall = time.perf_counter() - start
+        print("%-12s %8.1f ns/txn" % (name, 1e9*wall/args.n))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
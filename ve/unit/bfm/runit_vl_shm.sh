@@ -0,0 +1,68 @@
+#!/bin/sh -x
+
+# Runs the testbench in-process and out-of-process (+hpi.shm), and
+# checks that both runs produce the same testbench output and end at
+# the same simulation time
+
+# auto-set PYTHONPATH
+cwd=`pwd`
+export PYTHONPATH=$cwd/../../../src:$cwd:$PYTHONPATH
+
+python3 -m hpi gen-launcher-vl top -clk clk=1ns
+if test $? -ne 0; then exit 1; fi
+
+python3 -m hpi gen-bfm-wrapper -m my_tb simple_bfm -type sv-dpi
+if test $? -ne 0; then exit 1; fi
+
+python3 -m hpi gen-dpi -m my_tb
+if test $? -ne 0; then exit 1; fi
+
+# Query required compilation/linker flags from Python
+CFLAGS="${CFLAGS} `python3-config --cflags`"
+LDFLAGS="${LDFLAGS} `python3-config --ldflags --embed`"
+
+verilator --cc --exe -Wno-fatal \
+	top.sv simple_bfm.sv \
+	launcher_vl.cpp pyhpi_dpi.c \
+	-CFLAGS "${CFLAGS}" -LDFLAGS "${LDFLAGS}"
+if test $? -ne 0; then exit 1; fi
+
+# Build the Verilator image
+make -C obj_dir -f Vtop.mk
+if test $? -ne 0; then exit 1; fi
+
+./obj_dir/Vtop +hpi.load=my_tb +vl.timeout=1ms > embedded.log 2>&1
+if test $? -ne 0; then cat embedded.log; exit 1; fi
+
+./obj_dir/Vtop +hpi.load=my_tb +vl.timeout=1ms +hpi.shm > shm.log 2>&1
+if test $? -ne 0; then cat shm.log; exit 1; fi
+
+# Only the testbench output and the end-of-simulation summary are
+# compared. Launcher messages differ between the modes
+filter="thread|run_my_tb|hpi: simtime="
+grep -E "$filter" embedded.log > embedded.out
+grep -E "$filter" shm.log > shm.out
+if ! test -s embedded.out; then echo "FAIL: no testbench output"; exit 1; fi
+
+if ! diff embedded.out shm.out; then
+  echo "FAIL: +hpi.shm run differs from the in-process run"
+  exit 1
+fi
+echo "PASS: +hpi.shm run matches the in-process run"
+
+# Recording is done by the simulator process. The testbench process
+# must not see +hpi.record
+./obj_dir/Vtop +hpi.load=my_tb +vl.timeout=1ms +hpi.shm +hpi.record=shm_record.bin > shm_record.log 2>&1
+if test $? -ne 0; then cat shm_record.log; exit 1; fi
+
+if grep -q "hpi.record is not supported" shm_record.log; then
+  cat shm_record.log
+  echo "FAIL: +hpi.record was passed to the testbench process"
+  exit 1
+fi
+if ! test -s shm_record.bin; then echo "FAIL: no record written"; exit 1; fi
+echo "PASS: +hpi.shm run with +hpi.record"
+
+# Remove generated files
+#rm *.cpp *.c simple_bfm.sv *.log *.out
+#rm -rf obj_dir __pycache__
@@ -0,0 +1,135 @@
+#****************************************************************************
+#* merge_test.py
+#*
+#* Merges coverage files whose covergroups differ, and checks that the
+#* merged file holds the items of every file, with the counts of each
+#****************************************************************************
+import array
+import os
+import shutil
+import sys
+import tempfile
+
+from hpi import coverage
+
+# Returns the counters of covergroups <cgs>, as saved at the end of a run
+def counts_of(cgs):
+    ret = array.array('Q')
+    for cg in cgs:
+        ret.extend(cg.counts)
+    return ret
+
+def common():
+    return coverage.covergroup("common", [
+        coverage.coverpoint("kind", bins=[0, 1, 2, 3])])
+
+def only_in_a():
+    return coverage.covergroup("only_in_a", [
+        coverage.coverpoint("len", lo=0, hi=15, auto=4)])
+
+def only_in_b():
+    return coverage.covergroup("only_in_b", [
+        coverage.coverpoint("kind", bins=[0, 1]),
+        coverage.coverpoint("len", lo=0, hi=15, auto=4)],
+        crosses=[("kind", "len")])
+
+# Reads the counts of each item of a coverage file, keyed by
+# (covergroup, item)
+def item_counts(path):
+    hdr_b,hdr,counts = coverage.read(path)
+    ret = {}
+    for g in hdr["groups"]:
+        off = g["offset"]
+        for it in g["items"]:
+            ret[(g["name"], it["name"])] = list(counts[off:off+it["size"]])
+            off += it["size"]
+    return hdr["runs"], ret
+
+# Several covergroups may have the same name (eg one per BFM instance).
+# Returns errors found merging files where they differ in their items
+def merge_same_name(d):
+    c1 = os.path.join(d, "same1.cov")
+    c2 = os.path.join(d, "same2.cov")
+
+    coverage.prv_covergroups.clear()
+    cgs = [coverage.covergroup("cg", [coverage.coverpoint("p", bins=[0, 1])])
+           for i in range(2)]
+    cgs[0].sample(0); cgs[1].sample(1)
+    coverage.write(c1, coverage.header(), counts_of(cgs))
+
+    coverage.prv_covergroups.clear()
+    cg = coverage.covergroup("cg", [
+        coverage.coverpoint("p", bins=[0, 1]),
+        coverage.coverpoint("q", bins=[0, 1])])
+    cg.sample(1, 0)
+    coverage.write(c2, coverage.header(), counts_of([cg]))
+    coverage.prv_covergroups.clear()
+
+    hdr,counts = coverage.merge([c1, c2])
+    found = []
+    for g in hdr["groups"]:
+        off = g["offset"]
+        for it in g["items"]:
+            found.append((g["name"], it["name"], list(counts[off:off+it["size"]])))
+            off += it["size"]
+
+    expect = [("cg", "p", [1, 1]), ("cg", "q", [1, 0]), ("cg", "p", [0, 1])]
+    if found != expect:
+        return ["same-name covergroups: expected " + str(expect) + 
+                ", found " + str(found)]
+    return []
+
+def main():
+    d = tempfile.mkdtemp()
+    a = os.path.join(d, "a.cov")
+    b = os.path.join(d, "b.cov")
+    a2 = os.path.join(d, "a2.cov")
+    merged = os.path.join(d, "merged.cov")
+
+    # Each run is modeled by creating its covergroups afresh
+    coverage.prv_covergroups.clear()
+    cg_c,cg_a = common(),only_in_a()
+    cg_c.sample(1); cg_c.sample(1); cg_a.sample(5)
+    coverage.write(a, coverage.header(), counts_of([cg_c, cg_a]))
+    coverage.write(a2, coverage.header(), counts_of([cg_c, cg_a]))
+
+    coverage.prv_covergroups.clear()
+    cg_b,cg_c = only_in_b(),common()
+    cg_b.sample(1, 14); cg_c.sample(3)
+    coverage.write(b, coverage.header(), counts_of([cg_b, cg_c]))
+    coverage.prv_covergroups.clear()
+
+    hdr,counts = coverage.merge([a, b, a2])
+    coverage.write(merged, hdr, counts)
+    runs,items = item_counts(merged)
+    same_name_errors = merge_same_name(d)
+    shutil.rmtree(d)
+
+    expect = {
+        ("common", "kind"):    [0, 4, 0, 1],
+        ("only_in_a", "len"):  [0, 2, 0, 0],
+        ("only_in_b", "kind"): [0, 1],
+        ("only_in_b", "len"):  [0, 0, 0, 1],
+        ("only_in_b", "kindxlen"): [0, 0, 0, 0, 0, 0, 0, 1]}
+
+    errors = same_name_errors
+    if runs != 3:
+        errors.append("expected 3 runs, found " + str(runs))
+    for key,exp in expect.items():
+        if key not in items.keys():
+            errors.append(key[0] + "." + key[1] + " missing from the merged file")
+        elif items[key] != exp:
+            errors.append(key[0] + "." + key[1] + ": expected " + str(exp) +
+                          ", found " + str(items[key]))
+    for key in items.keys():
+        if key not in expect.keys():
+            errors.append("unexpected item " + key[0] + "." + key[1])
+
+    for e in errors:
+        print("FAIL: " + e)
+    if len(errors) != 0:
+        sys.exit(1)
+    print("PASS: merged " + str(len(items)) + " items from 3 files")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#****************************************************************************
+#* inst_tree_test.py
+#*
+#* Checks hierarchical instance queries, including generate and array
+#* scopes (eg gen[3]), which are matched literally
+#****************************************************************************
+import sys
+
+from hpi.inst_tree import inst_tree
+
+def main():
+    t = inst_tree()
+    paths = ["top.gen[" + str(i) + "].u_bfm" for i in range(4)]
+    paths += ["top.u_cluster0.u_bfm", "top.u_cluster1.u_bfm"]
+    for p in paths:
+        t.insert(p, p)
+
+    expect = {
+        "top.gen[3].u_bfm": ["top.gen[3].u_bfm"],
+        "top.gen*.u_bfm": paths[:4],
+        "top.gen[[]1[]].u_bfm": ["top.gen[1].u_bfm"],
+        "top.u_cluster[01].u_bfm": paths[4:],
+        "top.**.u_bfm": paths,
+        "top.gen[7].u_bfm": []}
+
+    errors = []
+    if t.get("top.gen[3].u_bfm") != "top.gen[3].u_bfm":
+        errors.append("get(top.gen[3].u_bfm) failed")
+    for pattern,exp in expect.items():
+        found = sorted(t.find(pattern))
+        if found != sorted(exp):
+            errors.append("find(" + pattern + "): expected " + str(sorted(exp)) +
+                          ", found " + str(found))
+
+    for e in errors:
+        print("FAIL: " + e)
+    if len(errors) != 0:
+        sys.exit(1)
+    print("PASS: " + str(len(expect)) + " queries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+#!/bin/sh -x
+
+cwd=`pwd`
+export PYTHONPATH=$cwd/../../../src:$PYTHONPATH
+
+python3 inst_tree_test.py
+if test $? -ne 0; then exit 1; fi
+
+rm -rf __pycache__
@@ -0,0 +1,41 @@
+#****************************************************************************
+#* age_test.py
+#*
+#* Checks that an ooo_scoreboard reports a transaction that leaks after
+#* the final expect() and actual() calls, with its age, when checked at
+#* the end of the run
+#****************************************************************************
+import sys
+
+from hpi.scoreboard import ooo_scoreboard
+
+def main():
+    simtime = [0]
+    sb = ooo_scoreboard("age", max_age=200)
+    sb.now = lambda: simtime[0]
+
+    sb.expect(1)
+    simtime[0] = 50
+    sb.expect(2)
+    simtime[0] = 60
+    sb.actual(2)
+
+    # Transaction 1 is never received, and is older than max_age by
+    # the end of the run
+    simtime[0] = 1000
+    sb.check()
+
+    errors = []
+    if sb.n_leaked != 1:
+        errors.append("reported " + str(sb.n_leaked) + " leaked transactions, expected 1")
+    if sb.n_matched != 1:
+        errors.append("matched " + str(sb.n_matched) + " transactions, expected 1")
+
+    for e in errors:
+        print("FAIL: " + e)
+    if len(errors) != 0:
+        sys.exit(1)
+    print("PASS: leak after the final expect reported")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#****************************************************************************
+#* ooo_tb.py
+#*
+#* Two producer threads share an ooo_scoreboard limited by
+#* +sb.max_outstanding, such that both block in expect(). Each producer
+#* drives its own BFM, and the loopback responder returns each request
+#* after a delay that depends on the producer. Responses are thus out of
+#* order between producers and in order within one
+#****************************************************************************
+import hpi
+from hpi.loopback import responder, ResponderBase
+from hpi.scoreboard import ooo_scoreboard
+
+N_ITEMS = 1000
+
+# Results, checked by ooo_test.py
+n_done = [0, 0]
+n_rsp = 0
+max_seen = 0
+
+@hpi.bfm
+class ooo_bfm():
+
+  def __init__(self):
+    self.sb = None
+
+  @hpi.export_task("i")
+  def req(self, data : int):
+    pass
+
+  @hpi.import_task("i")
+  def rsp(self, data : int):
+    global n_rsp
+    self.sb.actual(data)
+    n_rsp += 1
+    if n_rsp == 2*N_ITEMS:
+      done_sem.put(1)
+
+@responder("ooo_bfm")
+class ooo_rsp(ResponderBase):
+
+  def req(self, data):
+    self.call(1 + 2*(data >> 16), "rsp", data)
+
+done_sem = hpi.semaphore()
+sb = None
+
+def producer(p):
+  global max_seen
+  bfm = hpi.rgy.bfm_list[p]
+  for i in range(N_ITEMS):
+    v = (p << 16) | i
+    sb.expect(v)
+    max_seen = max(max_seen, sb.outstanding())
+    bfm.req(v)
+  n_done[p] += 1
+
+@hpi.entry
+def run_ooo_tb():
+  global sb
+  sb = ooo_scoreboard("ooo", key=lambda v: v >> 16,
+      max_outstanding=hpi.get_plusarg_int("sb.max_outstanding", 1))
+  for b in hpi.rgy.bfm_list:
+    b.sb = sb
+
+  with hpi.fork() as f:
+    f.task(lambda: producer(0))
+    f.task(lambda: producer(1))
+  done_sem.get(1)
+  hpi.finish()
@@ -0,0 +1,49 @@
+#****************************************************************************
+#* ooo_test.py
+#*
+#* Runs ooo_tb with the loopback backend, and checks that both producers
+#* complete, that the outstanding limit holds and that every transaction
+#* matches
+#****************************************************************************
+import argparse
+import os
+import sys
+
+from hpi import loopback
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-max_outstanding", type=int, default=1)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import ooo_tb
+
+    loopback.main(["+hpi.load=ooo_tb",
+                   "+sb.max_outstanding=" + str(args.max_outstanding)],
+                  [("ooo_bfm", "top.u_bfm_0"), ("ooo_bfm", "top.u_bfm_1")],
+                  modules=["ooo_tb"])
+
+    errors = []
+    if ooo_tb.n_done != [1, 1]:
+        errors.append("producers did not complete: " + str(ooo_tb.n_done))
+    if ooo_tb.sb == None:
+        errors.append("testbench did not run")
+    else:
+        if ooo_tb.sb.n_matched != 2*ooo_tb.N_ITEMS:
+            errors.append("matched " + str(ooo_tb.sb.n_matched) + " of " +
+                          str(2*ooo_tb.N_ITEMS) + " transactions")
+        if ooo_tb.sb.n_errors != 0:
+            errors.append(str(ooo_tb.sb.n_errors) + " scoreboard errors")
+    if ooo_tb.max_seen > args.max_outstanding:
+        errors.append("outstanding reached " + str(ooo_tb.max_seen) +
+                      " (limit " + str(args.max_outstanding) + ")")
+
+    for e in errors:
+        print("FAIL: " + e)
+    if len(errors) != 0:
+        sys.exit(1)
+    print("PASS: max_outstanding=" + str(args.max_outstanding))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+#!/bin/sh -x
+
+cwd=`pwd`
+export PYTHONPATH=$cwd/../../../src:$PYTHONPATH
+
+# Two producers blocked on the same scoreboard credits
+python3 ooo_test.py -max_outstanding 1
+if test $? -ne 0; then exit 1; fi
+
+python3 ooo_test.py -max_outstanding 2
+if test $? -ne 0; then exit 1; fi
+
+# Leaks after the last scoreboard call are reported at the end
+python3 age_test.py
+if test $? -ne 0; then exit 1; fi
+
+rm -rf __pycache__
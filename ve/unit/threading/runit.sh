@@ -8,4 +8,8 @@ ncpu=`cat /proc/cpuinfo | grep processor | wc -l`
 python3 thread_test.py
 if test $? -ne 0; then exit 1; fi
 
+# Threads unwound at shutdown don't call into the finalized model
+python3 shutdown_test.py
+if test $? -ne 0; then exit 1; fi
+
 rm -rf obj_dir __pycache__
@@ -0,0 +1,59 @@
+#****************************************************************************
+#* shutdown_test.py
+#*
+#* Runs a testbench with the loopback backend whose entry thread is still
+#* blocked when simulation ends. tb_fini unwinds the thread, and the
+#* finally block must not call finish or a BFM export once the model is
+#* finalized
+#****************************************************************************
+import sys
+
+import hpi
+from hpi import loopback
+
+@hpi.bfm
+class shutdown_bfm():
+
+  @hpi.export_task("i")
+  def req(self, data : int):
+    pass
+
+@loopback.responder("shutdown_bfm")
+class shutdown_rsp(loopback.ResponderBase):
+
+  def req(self, data):
+    pass
+
+n_cleanup = 0
+
+@hpi.entry
+def run_shutdown_tb():
+  global n_cleanup
+  bfm = hpi.rgy.bfm_list[0]
+  try:
+    # Never put. The thread is blocked when simulation ends
+    hpi.semaphore().get(1)
+  finally:
+    n_cleanup += 1
+    bfm.req(1)
+    hpi.finish()
+
+def main():
+  lb = loopback.main([], [("shutdown_bfm", "top.u_bfm")])
+
+  errors = []
+  if n_cleanup != 1:
+    errors.append("finally block ran " + str(n_cleanup) + " times")
+  if lb.n_exports != 0:
+    errors.append(str(lb.n_exports) + " export calls after tb_fini")
+  if lb.finished:
+    errors.append("finish called after tb_fini")
+
+  for e in errors:
+    print("FAIL: " + e)
+  if len(errors) != 0:
+    sys.exit(1)
+  print("PASS: no calls into the model after tb_fini")
+
+if __name__ == "__main__":
+  main()